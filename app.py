@@ -5,6 +5,7 @@ from datetime import datetime
 import pandas as pd
 from utils.auth import login_required
 from assets.logo_header import render_logo, render_icon
+from assets.static_bundle import apply_page_styles
 
 # Título e descrição do aplicativo
 st.set_page_config(
@@ -32,24 +33,7 @@ if 'reconciled_invoices' not in st.session_state:
 #     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
 # Estilos básicos para cabeçalhos e texto
-st.markdown("""
-<style>
-.main-header {
-    font-size: 2rem;
-    font-weight: bold;
-    color: #4A1F60;
-}
-.sub-header {
-    font-size: 1.5rem;
-    color: #3A174E;
-    margin-top: 1rem;
-}
-.description {
-    font-size: 1rem;
-    margin-bottom: 2rem;
-}
-</style>
-""", unsafe_allow_html=True)
+apply_page_styles()
 
 # Cabeçalho com logo
 col1, col2 = st.columns([1, 3])
@@ -1,22 +1,21 @@
 import streamlit as st
 import base64
-import os
-from PIL import Image
-
-# Caminho para a imagem do logo
-LOGO_PATH = 'assets/images/oakberry_logo.jpg'
+from assets.static_bundle import LOGO_PATH, get_logo_src
 
 def get_image_base64(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode('utf-8')
 
 def get_logo_html(width=300):
+    # Endereço do logo carregado uma única vez por processo (URL estática)
+    logo_src = get_logo_src()
+    
     # Verifica se o arquivo do logo existe
-    if os.path.isfile(LOGO_PATH):
+    if logo_src is not None:
         # Usa a imagem OAKBERRY como logo
         logo_html = f"""
         <div style="text-align: center; margin-bottom: 10px;">
-            <img src="data:image/jpeg;base64,{get_image_base64(LOGO_PATH)}" width="{width}px" alt="OAKBERRY Logo">
+            <img src="{logo_src}" width="{width}px" alt="OAKBERRY Logo">
         </div>
         """
         return logo_html
@@ -60,26 +59,18 @@ def get_logo_html(width=300):
         return logo_html
 
 def render_logo(width=300):
-    if os.path.isfile(LOGO_PATH):
-        try:
-            # Usar st.image é mais eficiente para imagens
-            img = Image.open(LOGO_PATH)
-            st.image(img, width=width)
-        except Exception:
-            # Fallback para HTML se o carregamento da imagem falhar
-            logo_html = get_logo_html(width)
-            st.markdown(logo_html, unsafe_allow_html=True)
-    else:
-        logo_html = get_logo_html(width)
-        st.markdown(logo_html, unsafe_allow_html=True)
+    # O navegador carrega a imagem da URL estática (sem reenviar a imagem a cada execução)
+    st.markdown(get_logo_html(width), unsafe_allow_html=True)
 
 def get_icon_html(size=50):
+    logo_src = get_logo_src()
+    
     # Verifica se o arquivo do logo existe
-    if os.path.isfile(LOGO_PATH):
+    if logo_src is not None:
         # Usa a imagem OAKBERRY como ícone
         icon_html = f"""
         <div style="text-align: center;">
-            <img src="data:image/jpeg;base64,{get_image_base64(LOGO_PATH)}" width="{size}px" height="{size}px" 
+            <img src="{logo_src}" width="{size}px" height="{size}px" 
                  style="border-radius: 50%; object-fit: cover;" alt="OAKBERRY Icon">
         </div>
         """
@@ -136,15 +127,4 @@ def get_icon_html(size=50):
         return icon_html
 
 def render_icon(size=50):
-    if os.path.isfile(LOGO_PATH):
-        try:
-            # Usar st.image é mais eficiente para imagens
-            img = Image.open(LOGO_PATH)
-            st.image(img, width=size)
-        except Exception:
-            # Fallback para HTML se o carregamento da imagem falhar
-            icon_html = get_icon_html(size)
-            st.markdown(icon_html, unsafe_allow_html=True)
-    else:
-        icon_html = get_icon_html(size)
-        st.markdown(icon_html, unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown(get_icon_html(size), unsafe_allow_html=True)
@@ -0,0 +1,90 @@
+import base64
+import os
+import re
+
+import streamlit as st
+from utils.cache import ASSETS_NAMESPACE, cached_resource, file_version
+
+# Folhas de estilo: tema geral (aplicado por login_required) e cabeçalhos das páginas
+THEME_CSS_PATH = 'assets/style.css'
+PAGE_CSS_PATH = 'assets/page.css'
+
+# Arquivos servidos pelo Streamlit (server.enableStaticServing) a partir de static/
+STATIC_DIR = 'static'
+STATIC_URL = 'app/static'
+LOGO_FILE = 'oakberry_logo.jpg'
+LOGO_PATH = os.path.join(STATIC_DIR, LOGO_FILE)
+
+_CSS_COMMENTS = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_SPACES = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_COLON = re.compile(r':\s+')
+
+def minify_css(css):
+    """
+    Remove comentários e espaços desnecessários de uma folha de estilo
+    """
+    css = _CSS_COMMENTS.sub('', css)
+    css = _CSS_SPACES.sub(' ', css)
+    css = _CSS_PUNCTUATION.sub(r'\1', css)
+    # Espaço antes de ":" é significativo em seletores (ex.: "div :hover"), só o posterior é removido
+    css = _CSS_COLON.sub(':', css)
+    return css.replace(';}', '}').strip()
+
+def _style_tag(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f"<style>{minify_css(f.read())}</style>"
+    except OSError:
+        return ""
+
+def _logo_src():
+    """
+    Endereço do logo: URL estática (com versão para o cache do navegador) ou, se o
+    servidor não serve arquivos estáticos, a imagem embutida em base64
+    """
+    version = file_version(LOGO_PATH)
+    if version is None:
+        return None
+
+    if st.get_option('server.enableStaticServing'):
+        return f"{STATIC_URL}/{LOGO_FILE}?v={version[0]}"
+
+    with open(LOGO_PATH, 'rb') as f:
+        return f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+
+@cached_resource(ASSETS_NAMESPACE)
+def load_bundle():
+    """
+    Carrega, minifica e codifica os recursos estáticos uma única vez por processo
+
+    Retorna:
+    - dict: theme_html, page_html (tags <style>) e logo_src (None se o logo não existir)
+    """
+    return {
+        'theme_html': _style_tag(THEME_CSS_PATH),
+        'page_html': _style_tag(PAGE_CSS_PATH),
+        'logo_src': _logo_src()
+    }
+
+def apply_theme():
+    """
+    Aplica o tema geral (assets/style.css)
+    """
+    theme_html = load_bundle()['theme_html']
+    if theme_html:
+        st.markdown(theme_html, unsafe_allow_html=True)
+
+def apply_page_styles():
+    """
+    Aplica os estilos comuns das páginas (cabeçalhos e descrições)
+    """
+    page_html = load_bundle()['page_html']
+    if page_html:
+        st.markdown(page_html, unsafe_allow_html=True)
+
+def get_logo_src():
+    """
+    Retorna o endereço do logo para uso em <img src> (None se o logo não existir)
+    """
+    return load_bundle()['logo_src']
@@ -0,0 +1,264 @@
+"""
+Mede a vazão do envio de faturas por e-mail contra um servidor SMTP local (aiosmtpd)
+
+Uso:
+    python benchmarks/bench_email.py                          # 200 faturas, todas as variantes
+    python benchmarks/bench_email.py --invoices 1000 --latency 50
+    python benchmarks/bench_email.py --variant bulk --variant outbox --transient-rate 0.05
+
+Variantes:
+    serial    send_invoice_email fatura a fatura (uma conexão por e-mail)
+    bulk      EmailPipeline, como em send_bulk_invoices (pool de preparação e conexões reutilizadas)
+    outbox    enqueue_invoices e espera até a fila esvaziar
+
+O servidor local aceita STARTTLS (certificado autoassinado gerado com o
+openssl) e qualquer usuário/senha. Cada mensagem espera --latency ms antes
+da resposta; --transient-rate e --permanent-rate fazem o servidor recusar
+uma fração das mensagens com 451 (temporário) ou 550 (permanente).
+
+A latência p50/p99 é medida por mensagem: a chamada de send_invoice_email
+(serial), da preparação à aceitação pelo servidor (bulk, campo seconds do
+pipeline) e de created_at a sent_at na fila (outbox). Os dados (fila, log de auditoria, cadastro de parceiros) ficam em
+--workdir, nunca em data/ do projeto.
+"""
+import argparse
+import asyncio
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import logging
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VARIANTS = ['serial', 'bulk', 'outbox']
+
+COUNTRIES = ['USA', 'Brazil', 'Mexico', 'Colombia', 'Argentina']
+
+SMTP_USERNAME = "bench"
+SMTP_PASSWORD = "bench"
+SENDER_EMAIL = "faturas@berrybill.example"
+
+class SinkHandler:
+    """
+    Servidor SMTP que descarta as mensagens, com latência e falhas injetadas
+    """
+
+    def __init__(self, latency, jitter, transient_rate, permanent_rate, seed=42):
+        self.latency = latency
+        self.jitter = jitter
+        self.transient_rate = transient_rate
+        self.permanent_rate = permanent_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.subjects = set()
+            self.transactions = 0
+            self.transient = 0
+            self.permanent = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        subject = _subject(envelope.content)
+        roll = self._random.random()
+        with self._lock:
+            self.transactions += 1
+            self.subjects.add(subject)
+            if roll < self.permanent_rate:
+                self.permanent += 1
+                return "550 5.1.1 Mailbox unavailable"
+            if roll < self.permanent_rate + self.transient_rate:
+                self.transient += 1
+                return "451 4.3.0 Try again later"
+        return "250 OK"
+
+def _subject(content):
+    for line in content.split(b"\r\n"):
+        if line.lower().startswith(b"subject:"):
+            return line[8:].strip()
+        if not line:
+            break
+    return b""
+
+def _accept_any(server, session, envelope, mechanism, auth_data):
+    from aiosmtpd.smtp import AuthResult
+    return AuthResult(success=True)
+
+def tls_context(workdir):
+    """
+    Contexto TLS do servidor local com certificado autoassinado (gerado uma vez em workdir)
+    """
+    cert = os.path.join(workdir, "sink-cert.pem")
+    key = os.path.join(workdir, "sink-key.pem")
+    if not (os.path.exists(cert) and os.path.exists(key)):
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "365",
+                        "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                       check=True, capture_output=True)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+def start_sink(handler, port, workdir):
+    from aiosmtpd.controller import Controller
+
+    # Avisos internos do aiosmtpd (um por AUTH)
+    logging.getLogger('mail.log').setLevel(logging.ERROR)
+    controller = Controller(handler, hostname="127.0.0.1", port=port, tls_context=tls_context(workdir),
+                            authenticator=_accept_any, auth_require_tls=True, data_size_limit=None)
+    controller.start()
+    return controller
+
+def generate_invoices(count, partners, pdf_kb, seed=42):
+    """
+    Gera faturas sintéticas com PDFs aleatórios de pdf_kb KB
+    """
+    rng = random.Random(seed)
+    invoices = []
+    for i in range(count):
+        partner = f"Partner {i % partners:03d}"
+        invoices.append({
+            'invoice_number': f"BENCH-{i:06d}",
+            'partner': partner,
+            'country': COUNTRIES[i % partners % len(COUNTRIES)],
+            'month_name': "January",
+            'year': 2024,
+            'currency': "USD",
+            'total_amount': round(rng.uniform(100, 50000), 2),
+            'created_at': datetime(2024, 2, 1),
+            'pdf': b"%PDF-1.4\n" + rng.randbytes(pdf_kb * 1024),
+            'sent': False,
+        })
+    mapping = {f"Partner {p:03d}": f"financeiro{p}@parceiro{p % 10}.example" for p in range(partners)}
+    return invoices, mapping
+
+# Cada variante retorna (enviadas, latências em segundos das mensagens aceitas)
+
+def run_serial(invoices, mapping, settings, args):
+    from utils.email_sender import get_default_email_template, invoice_attachment_name, send_invoice_email
+
+    latencies = []
+    for invoice in invoices:
+        started = time.perf_counter()
+        template = get_default_email_template(invoice)
+        success, _ = send_invoice_email(mapping[invoice['partner']], template['subject'], template['body'],
+                                        invoice['pdf'], invoice_attachment_name(invoice))
+        if success:
+            latencies.append(time.perf_counter() - started)
+    return len(latencies), latencies
+
+def run_bulk(invoices, mapping, settings, args):
+    # Mesmos passos de send_bulk_invoices, que não expõe o resultado de cada mensagem
+    from utils.email_pipeline import EmailPipeline, invoice_jobs
+    from utils.email_sender import get_default_email_template
+
+    shared = [(b"%PDF-1.4\n" + os.urandom(args.shared_kb * 1024), "statement.pdf")] if args.shared_kb else None
+    jobs, _ = invoice_jobs(invoices, mapping, get_default_email_template, shared)
+    latencies = [result['seconds'] for result in EmailPipeline(settings).run(jobs) if result['success']]
+    return len(latencies), latencies
+
+def run_outbox(invoices, mapping, settings, args):
+    from utils import email_outbox
+
+    worker = email_outbox.get_outbox_worker()
+    worker.limiter.default_rate = args.domain_rate
+    worker.limiter.rates = {}
+
+    batch_id, queued, _ = email_outbox.enqueue_invoices(invoices, mapping, owner="bench", settings=settings)
+    if not batch_id:
+        return 0, []
+    while any(email_outbox.batch_summary(batch_id).get(status) for status in email_outbox.PENDING_STATUSES):
+        time.sleep(0.05)
+
+    messages = email_outbox.list_messages(batch_id, statuses=[email_outbox.STATUS_SENT], limit=queued)
+    latencies = [(datetime.fromisoformat(message['sent_at']) - datetime.fromisoformat(message['created_at'])).total_seconds()
+                 for message in messages]
+    return len(latencies), latencies
+
+RUNNERS = {'serial': run_serial, 'bulk': run_bulk, 'outbox': run_outbox}
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variant', action='append', choices=VARIANTS, help="Variantes a medir (padrão: todas)")
+    parser.add_argument('--invoices', type=int, default=200, help="Faturas por variante")
+    parser.add_argument('--partners', type=int, default=50, help="Parceiros distintos (destinatários)")
+    parser.add_argument('--pdf-kb', type=int, default=60, help="Tamanho do PDF de cada fatura (KB)")
+    parser.add_argument('--shared-kb', type=int, default=0, help="Anexo comum a todos os e-mails na variante bulk (KB)")
+    parser.add_argument('--latency', type=float, default=20, help="Latência do servidor por mensagem (ms)")
+    parser.add_argument('--jitter', type=float, default=10, help="Variação aleatória da latência (ms)")
+    parser.add_argument('--transient-rate', type=float, default=0.0, help="Fração de mensagens recusadas com 451")
+    parser.add_argument('--permanent-rate', type=float, default=0.0, help="Fração de mensagens recusadas com 550")
+    parser.add_argument('--retry-delay', type=float, default=0.05, help="Espera base entre tentativas (s)")
+    parser.add_argument('--domain-rate', type=float, default=1e9, help="Limite por domínio da fila (mensagens/min)")
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'berrybill-bench-email'))
+    args = parser.parse_args()
+
+    try:
+        import aiosmtpd  # noqa: F401
+    except ImportError:
+        parser.error("aiosmtpd não está instalado (pip install aiosmtpd)")
+
+    # Fila, log de auditoria e cadastro de parceiros ficam no diretório de trabalho
+    os.makedirs(os.path.join(args.workdir, 'data'), exist_ok=True)
+    os.chdir(args.workdir)
+
+    from utils import email_outbox, email_pipeline
+    from streamlit.logger import set_log_level
+
+    # Sem "streamlit run" cada acesso a st.session_state avisa "missing ScriptRunContext"
+    set_log_level("error")
+    email_outbox.RETRY_BASE_SECONDS = args.retry_delay
+    email_outbox.POLL_INTERVAL = 0.05
+    email_pipeline.RETRY_BASE_SECONDS = args.retry_delay
+
+    settings = {'server': "127.0.0.1", 'port': str(args.port), 'username': SMTP_USERNAME,
+                'password': SMTP_PASSWORD, 'sender': SENDER_EMAIL}
+    import streamlit as st
+    st.session_state.update(smtp_server=settings['server'], smtp_port=settings['port'],
+                            smtp_username=SMTP_USERNAME, smtp_password=SMTP_PASSWORD, sender_email=SENDER_EMAIL)
+
+    handler = SinkHandler(args.latency / 1000, args.jitter / 1000, args.transient_rate, args.permanent_rate)
+    controller = start_sink(handler, args.port, args.workdir)
+
+    print(f"{args.invoices} faturas, PDF de {args.pdf_kb} KB, latência {args.latency:.0f}±{args.jitter:.0f} ms, "
+          f"falhas {args.transient_rate:.0%} temporárias / {args.permanent_rate:.0%} permanentes")
+    print(f"\n  {'variante':<8} {'enviadas':>9} {'tempo':>8} {'msgs/s':>8} {'p50':>9} {'p99':>9} "
+          f"{'retentativas':>13} {'451':>5} {'550':>5}")
+    try:
+        for number, variant in enumerate(args.variant or VARIANTS):
+            invoices, mapping = generate_invoices(args.invoices, args.partners, args.pdf_kb, seed=number)
+            # Números distintos por variante: a fila não reenvia faturas já enviadas
+            for invoice in invoices:
+                invoice['invoice_number'] = f"{variant.upper()}-{time.time_ns()}-{invoice['invoice_number']}"
+
+            handler.reset()
+            started = time.perf_counter()
+            sent, latencies = RUNNERS[variant](invoices, mapping, settings, args)
+            elapsed = time.perf_counter() - started
+
+            retries = handler.transactions - len(handler.subjects)
+            print(f"  {variant:<8} {sent:>9,} {elapsed:>7.2f}s {sent / elapsed:>8.1f} "
+                  f"{percentile(latencies, 0.5) * 1000:>7.0f}ms {percentile(latencies, 0.99) * 1000:>7.0f}ms "
+                  f"{retries:>13,} {handler.transient:>5,} {handler.permanent:>5,}")
+    finally:
+        controller.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compara os motores de leitura de xlsx (utils.readers) em arquivos gerados
+
+Uso:
+    python benchmarks/bench_readers.py                 # 100 mil e 1 milhão de linhas
+    python benchmarks/bench_readers.py --rows 100000   # apenas 100 mil linhas
+    python benchmarks/bench_readers.py --engine xml --engine openpyxl
+
+Os arquivos gerados ficam em um diretório temporário (ou em --workdir) e são
+reutilizados entre execuções.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.readers import ENGINE_ORDER, available_engines, read_sales_file  # noqa: E402
+
+COUNTRIES = ['Brazil', 'Mexico', 'Colombia', 'Argentina', 'Chile']
+
+# Colunas extras presentes nas planilhas reais e descartadas na leitura
+EXTRA_COLUMNS = ['Region', 'Cashier', 'Notes']
+
+def generate_workbook(path, rows, seed=42):
+    """
+    Gera uma planilha de vendas com as colunas obrigatórias e colunas extras
+    """
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1)
+    days = rng.integers(0, 365, rows)
+    countries = rng.integers(0, len(COUNTRIES), rows)
+    partners = rng.integers(0, 200, rows)
+    stores = rng.integers(0, 2000, rows)
+    sales = np.round(rng.uniform(10, 50000, rows), 2)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Vendas')
+    sheet.append(['Date', 'Country', 'Partner', 'Store', 'Sales'] + EXTRA_COLUMNS)
+    for i in range(rows):
+        sheet.append([
+            start + timedelta(days=int(days[i])),
+            COUNTRIES[countries[i]],
+            f"Partner {partners[i]:03d}",
+            f"Store {stores[i]:04d}",
+            float(sales[i]),
+            f"Region {countries[i]}",
+            f"Cashier {i % 50}",
+            "Lorem ipsum dolor sit amet"
+        ])
+    workbook.save(path)
+
+def time_engine(path, engine, repeat):
+    """
+    Retorna o melhor tempo (s) de leitura e o DataFrame lido
+    """
+    best = None
+    df = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = read_sales_file(path, engine=engine)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, df
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, action='append', help="Linhas por arquivo (padrão: 100000 e 1000000)")
+    parser.add_argument('--engine', action='append', choices=ENGINE_ORDER, help="Motores a comparar (padrão: todos disponíveis)")
+    parser.add_argument('--repeat', type=int, default=1, help="Repetições por motor (vale o melhor tempo)")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'berrybill-bench'))
+    args = parser.parse_args()
+
+    sizes = args.rows or [100_000, 1_000_000]
+    engines = [engine for engine in (args.engine or ENGINE_ORDER) if engine in available_engines()]
+    os.makedirs(args.workdir, exist_ok=True)
+
+    print(f"Motores: {', '.join(engines)}")
+    for rows in sizes:
+        path = os.path.join(args.workdir, f"sales_{rows}.xlsx")
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            generate_workbook(path, rows)
+            print(f"Gerado {path} em {time.perf_counter() - started:.1f}s")
+
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"\n{rows:,} linhas ({size_mb:.1f} MB)")
+        for engine in engines:
+            elapsed, df = time_engine(path, engine, args.repeat)
+            print(f"  {engine:<10} {elapsed:8.2f}s  {rows / elapsed:>12,.0f} linhas/s  "
+                  f"({len(df):,} linhas, {len(df.columns)} colunas)")
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime, timedelta
-from utils.auth import login_required
-from utils.access_control import check_access
+from utils.permissions import (require_page, can, PAGE_DASHBOARD, PAGE_IMPORT_DATA,
+                               PAGE_GENERATE_INVOICES, PAGE_SETTINGS, PAGE_INVOICE_CONTROL)
 import os
 import json
 
@@ -16,17 +16,10 @@ st.set_page_config(
 )
 
 # Verificar login
-username = login_required()
+username = require_page(PAGE_DASHBOARD)
 full_name = st.session_state.full_name
 user_role = st.session_state.user_role
 
-# Estilo personalizado
-try:
-    with open('assets/style.css') as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-except:
-    pass
-
 # Função para calcular a inadimplência por mês
 def calculate_monthly_delinquency(invoices):
     if not invoices:
@@ -95,7 +88,7 @@ st.markdown(f'<div class="description">Olá, {full_name}! Bem-vindo ao painel de
 if 'invoices' not in st.session_state or not st.session_state.invoices:
     st.warning("Não há faturas registradas no sistema. Por favor, importe dados e gere faturas.")
     
-    if check_access(["admin", "configuracao"]):
+    if can(PAGE_IMPORT_DATA):
         if st.button("Ir para Importar Dados"):
             st.switch_page("pages/01_Importar_Dados.py")
     
@@ -506,16 +499,16 @@ st.markdown("#### Ações")
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    if check_access(["admin", "gestor"]):
+    if can(PAGE_INVOICE_CONTROL):
         if st.button("Ver Controle de Invoices", use_container_width=True):
             st.switch_page("pages/07_Controle_Invoices.py")
 
 with col2:
-    if check_access(["admin"]):
+    if can(PAGE_GENERATE_INVOICES):
         if st.button("Gerar Novas Faturas", use_container_width=True):
             st.switch_page("pages/02_Gerar_Faturas.py")
 
 with col3:
-    if check_access(["admin", "configuracao"]):
+    if can(PAGE_SETTINGS):
         if st.button("Configurações", use_container_width=True):
             st.switch_page("pages/06_Configuracoes.py")
\ No newline at end of file
@@ -2,43 +2,99 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-from utils.data_processor import validate_data, process_data
-from utils.auth import login_required
-from utils.access_control import check_access, show_access_denied
+from utils.data_processor import process_data, load_country_settings
+from utils.validation import validate_sales_data, summarize_errors
+from utils.dataset_store import store_imported_data, set_imported_data
+from utils.import_cache import (compute_import_key, file_hash, lookup_import, load_import_result,
+                                find_overlaps, parse_upload, PROCESS_SALES_JOB)
+from utils.jobs import (submit_job, get_job, get_job_result, list_jobs, render_job_progress, FINAL_STATUSES,
+                        STATUS_DONE, STATUS_CANCELLED)
+from utils.permissions import require_page, PAGE_IMPORT_DATA
 from assets.logo_header import render_logo, render_icon
+from assets.static_bundle import apply_page_styles
 
 st.set_page_config(
     page_title="Importar Dados - Sistema de Gerenciamento de Faturas",
     page_icon="📊",
     layout="wide")
 
-# Verifica login
-username = login_required()
-
-# Verifica permissão de acesso
-if not check_access(["admin", "configuracao"]):
-    show_access_denied()
+# Verifica login e permissão de acesso
+username = require_page(PAGE_IMPORT_DATA)
 
 # Estilo personalizado
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """,
-            unsafe_allow_html=True)
+apply_page_styles()
+
+def show_import_overlaps(entry):
+    """Avisa quando outros arquivos importados cobrem os mesmos períodos (ano, mês, país)"""
+    for overlap in find_overlaps(entry):
+        periods = ", ".join(f"{month:02d}/{year} ({country})" for year, month, country in overlap['periods'][:10])
+        if len(overlap['periods']) > 10:
+            periods += f" e mais {len(overlap['periods']) - 10}"
+        st.warning(f"O arquivo {overlap['file_name']} já importou dados dos mesmos períodos: {periods}")
+
+def show_processed_data(processed_data):
+    """Exibe os dados processados, o resumo e os próximos passos"""
+    # Exibe os dados processados
+    st.markdown(
+        '<div class="sub-header">Dados Processados</div>',
+        unsafe_allow_html=True)
+    st.dataframe(processed_data, use_container_width=True)
+
+    # Mostra o resumo
+    st.markdown(
+        '<div class="sub-header">Resumo dos Dados</div>',
+        unsafe_allow_html=True)
+
+    # Cria métricas de resumo
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Total de Registros", len(processed_data))
+
+    with col2:
+        st.metric("Valor Total",
+                  f"R$ {processed_data['Amount'].sum():,.2f}")
+
+    with col3:
+        st.metric("Total de Parceiros",
+                  processed_data['Partner'].nunique())
+
+    with col4:
+        st.metric("Total de Países",
+                  processed_data['Country'].nunique())
+
+    # Mostra resumo detalhado
+    with st.expander("Ver Resumo Detalhado"):
+        # Por parceiro
+        st.markdown("#### Por Parceiro")
+        partner_summary = processed_data.groupby(
+            'Partner').agg({
+                'Amount': 'sum',
+                'Royalty Amount': 'sum',
+                'Ad Fund Amount': 'sum',
+                'Tax Amount': 'sum',
+                'Total Amount': 'sum'
+            }).reset_index()
+        st.dataframe(partner_summary, use_container_width=True)
+
+        # Por país
+        st.markdown("#### Por País")
+        country_summary = processed_data.groupby(
+            'Country').agg({
+                'Amount': 'sum',
+                'Royalty Amount': 'sum',
+                'Ad Fund Amount': 'sum',
+                'Tax Amount': 'sum',
+                'Total Amount': 'sum'
+            }).reset_index()
+        st.dataframe(country_summary, use_container_width=True)
+
+    # Próximos passos
+    st.success(
+        "Processamento de dados concluído! Agora você pode prosseguir para gerar faturas."
+    )
+    if st.button("Ir para Gerar Faturas"):
+        st.switch_page("pages/02_Gerar_Faturas.py")
 
 # Cabeçalho com logo
 col1, col2 = st.columns([1, 3])
@@ -123,8 +179,8 @@ with tab2:
                 df = st.session_state.manual_records
                 processed_data = process_data(df)
 
-                # Armazena no estado da sessão
-                st.session_state.imported_data = processed_data
+                # Publica o conjunto processado (Parquet compartilhado) e registra na sessão
+                store_imported_data(processed_data)
 
                 # Exibe os dados processados
                 st.markdown('<div class="sub-header">Dados Processados</div>',
@@ -160,118 +216,87 @@ with tab2:
                 if st.button("Ir para Gerar Faturas"):
                     st.switch_page("pages/02_Gerar_Faturas.py")
 
+# Retoma o processamento em andamento do usuário (ex.: sessão reiniciada)
+if not st.session_state.get('process_job_id'):
+    running_job = next((job for job in list_jobs(owner=username)
+                        if job['kind'] == PROCESS_SALES_JOB and job['status'] not in FINAL_STATUSES), None)
+    if running_job is not None:
+        st.session_state.process_job_id = running_job['id']
+
 # Verificação e processamento apenas para o caso do upload de arquivo
 if uploaded_file is not None:
     try:
-        # Lê o arquivo Excel
-        df = pd.read_excel(uploaded_file)
-
-        # Mostra os dados brutos
-        st.markdown(
-            '<div class="sub-header">Visualização dos Dados Brutos</div>',
-            unsafe_allow_html=True)
-        st.dataframe(df.head(10), use_container_width=True)
-
-        # Valida os dados
-        is_valid, error_message = validate_data(df)
-
-        if is_valid:
+        file_bytes = uploaded_file.getvalue()
+        import_key = compute_import_key(file_bytes)
+        cached_import = lookup_import(import_key)
+
+        if cached_import is not None:
+            # Mesmo arquivo com as mesmas configurações: reutiliza o resultado sem ler o Excel
+            load_import_result(import_key, cached_import)
+            imported_at = datetime.fromisoformat(cached_import['imported_at']).strftime('%d/%m/%Y %H:%M')
             st.success(
-                "Validação de dados bem-sucedida! O arquivo enviado possui todas as colunas necessárias."
+                f"Este arquivo já foi processado em {imported_at} ({cached_import['rows']} registros). "
+                "O resultado anterior foi carregado sem reprocessamento."
             )
+            show_import_overlaps(cached_import)
 
-            # Processa os dados
-            if st.button("Processar Dados"):
-                with st.spinner("Processando dados..."):
-                    processed_data = process_data(df)
-
-                    # Armazena no estado da sessão
-                    st.session_state.imported_data = processed_data
-
-                    # Exibe os dados processados
-                    st.markdown(
-                        '<div class="sub-header">Dados Processados</div>',
-                        unsafe_allow_html=True)
-                    st.dataframe(processed_data, use_container_width=True)
-
-                    # Mostra o resumo
-                    st.markdown(
-                        '<div class="sub-header">Resumo dos Dados</div>',
-                        unsafe_allow_html=True)
-
-                    # Cria métricas de resumo
-                    col1, col2, col3, col4 = st.columns(4)
-
-                    with col1:
-                        st.metric("Total de Registros", len(processed_data))
-
-                    with col2:
-                        st.metric("Valor Total",
-                                  f"R$ {processed_data['Amount'].sum():,.2f}")
-
-                    with col3:
-                        st.metric("Total de Parceiros",
-                                  processed_data['Partner'].nunique())
-
-                    with col4:
-                        st.metric("Total de Países",
-                                  processed_data['Country'].nunique())
-
-                    # Mostra resumo detalhado
-                    with st.expander("Ver Resumo Detalhado"):
-                        # Por parceiro
-                        st.markdown("#### Por Parceiro")
-                        partner_summary = processed_data.groupby(
-                            'Partner').agg({
-                                'Amount': 'sum',
-                                'Royalty Amount': 'sum',
-                                'Ad Fund Amount': 'sum',
-                                'Tax Amount': 'sum',
-                                'Total Amount': 'sum'
-                            }).reset_index()
-                        st.dataframe(partner_summary, use_container_width=True)
-
-                        # Por país
-                        st.markdown("#### Por País")
-                        country_summary = processed_data.groupby(
-                            'Country').agg({
-                                'Amount': 'sum',
-                                'Royalty Amount': 'sum',
-                                'Ad Fund Amount': 'sum',
-                                'Tax Amount': 'sum',
-                                'Total Amount': 'sum'
-                            }).reset_index()
-                        st.dataframe(country_summary, use_container_width=True)
-
-                    # Próximos passos
-                    st.success(
-                        "Processamento de dados concluído! Agora você pode prosseguir para gerar faturas."
-                    )
-                    if st.button("Ir para Gerar Faturas"):
-                        st.switch_page("pages/02_Gerar_Faturas.py")
+            if st.button("Ir para Gerar Faturas", key="cached_import_next"):
+                st.switch_page("pages/02_Gerar_Faturas.py")
         else:
-            st.error(f"Falha na validação de dados: {error_message}")
+            # Lê o arquivo Excel (uma única vez por conteúdo, mesmo entre reruns)
+            df = parse_upload(file_hash(file_bytes), file_bytes, uploaded_file.name)
 
-            # Mostra o formato necessário
-            with st.expander("Ver Formato de Dados Necessário"):
-                st.markdown("""
-                O arquivo Excel enviado deve conter as seguintes colunas:
+            # Mostra os dados brutos
+            st.markdown(
+                '<div class="sub-header">Visualização dos Dados Brutos</div>',
+                unsafe_allow_html=True)
+            st.dataframe(df.head(10), use_container_width=True)
+
+            # Valida e converte os dados em uma única passada (todas as linhas com problema)
+            sales_settings = load_country_settings()
+            coerced_data, validation_errors = validate_sales_data(df, sales_settings)
+            is_valid = validation_errors.empty
+
+            if is_valid:
+                st.success(
+                    "Validação de dados bem-sucedida! O arquivo enviado possui todas as colunas necessárias."
+                )
+
+                # Processa os dados em segundo plano (continua mesmo se a página for recarregada)
+                if st.button("Processar Dados", disabled=bool(st.session_state.get('process_job_id'))):
+                    st.session_state.process_job_id = submit_job(
+                        PROCESS_SALES_JOB,
+                        {'data': coerced_data, 'settings': sales_settings,
+                         'import_key': import_key, 'file_name': uploaded_file.name},
+                        owner=username,
+                        description=f"Processamento de {uploaded_file.name}")
+            else:
+                st.error(f"Falha na validação de dados: {summarize_errors(validation_errors)}")
+
+                # Tabela com todas as linhas e motivos de erro
+                with st.expander(f"Ver Erros de Validação ({len(validation_errors)})", expanded=True):
+                    st.dataframe(validation_errors, use_container_width=True, hide_index=True)
+
+                # Mostra o formato necessário
+                with st.expander("Ver Formato de Dados Necessário"):
+                    st.markdown("""
+                    O arquivo Excel enviado deve conter as seguintes colunas:
                 
-                - **Date**: Data da transação (formato necessário: AAAA-MM-DD)
-                - **Partner**: Nome do parceiro/master
-                - **Country**: Código do país (deve ser um dos países suportados)
-                - **Amount**: Valor numérico representando o valor de venda
-                - **Currency**: Código da moeda (ex: USD, EUR, BRL)
+                    - **Date**: Data da transação (formato necessário: AAAA-MM-DD)
+                    - **Partner**: Nome do parceiro/master
+                    - **Country**: Código do país (deve ser um dos países suportados)
+                    - **Amount**: Valor numérico representando o valor de venda
+                    - **Currency**: Código da moeda (ex: USD, EUR, BRL)
                 
-                Exemplo:
+                    Exemplo:
                 
-                | Date       | Partner      | Country | Amount  | Currency |
-                |------------|--------------|---------|---------|----------|
-                | 2023-10-01 | Nome Parceiro| BR      | 10000.0 | BRL      |
-                | 2023-10-02 | Outra Empresa| US      | 8500.5  | USD      |
+                    | Date       | Partner      | Country | Amount  | Currency |
+                    |------------|--------------|---------|---------|----------|
+                    | 2023-10-01 | Nome Parceiro| BR      | 10000.0 | BRL      |
+                    | 2023-10-02 | Outra Empresa| US      | 8500.5  | USD      |
                 
-                Certifique-se de que todas as colunas necessárias estejam presentes e os dados estejam no formato correto.
-                """)
+                    Certifique-se de que todas as colunas necessárias estejam presentes e os dados estejam no formato correto.
+                    """)
 
     except Exception as e:
         st.error(f"Erro ao ler o arquivo: {str(e)}")
@@ -303,3 +328,31 @@ else:
         
         Certifique-se de que todas as colunas necessárias estejam presentes e os dados estejam no formato correto.
         """)
+
+# Acompanha o processamento em segundo plano e publica o resultado quando ele termina
+process_job_id = st.session_state.get('process_job_id')
+if process_job_id:
+    process_job = get_job(process_job_id)
+
+    if process_job is not None and process_job['status'] not in FINAL_STATUSES:
+        render_job_progress(process_job_id)
+    else:
+        del st.session_state['process_job_id']
+        process_result = get_job_result(process_job_id) if process_job else None
+
+        if process_job is not None and process_job['status'] == STATUS_DONE and process_result is not None:
+            processed_data = process_result['data']
+
+            # Registra o conjunto processado na sessão
+            set_imported_data(processed_data, process_result['dataset_id'])
+
+            # A tarefa já registrou a importação no cache; avisa sobre períodos já importados
+            if process_result.get('entry'):
+                show_import_overlaps(process_result['entry'])
+
+            show_processed_data(processed_data)
+        elif process_job is not None and process_job['status'] == STATUS_CANCELLED:
+            st.warning("O processamento dos dados foi cancelado.")
+        else:
+            error = process_job['error'] if process_job else "resultado não encontrado"
+            st.error(f"Falha ao processar os dados: {error}")
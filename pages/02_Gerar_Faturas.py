@@ -6,10 +6,14 @@ import os
 from datetime import datetime, timedelta
 from utils.invoice_generator import generate_invoices_from_data, get_invoice_download_link
 from utils.data_processor import load_country_settings
-from utils.auth import login_required
-from utils.access_control import check_access, show_access_denied
+from utils.permissions import require_page, PAGE_GENERATE_INVOICES
 from assets.logo_header import render_logo
 from utils.exchange_rate import get_bc_exchange_rate, get_exchange_rates_for_countries
+from utils.invoice_grid import render_invoice_grid
+from utils.installments import attach_installments, build_installment_schedule
+from utils.money import to_minor
+from utils.dataset_store import has_imported_data, get_imported_dimensions, get_imported_data
+from assets.static_bundle import apply_page_styles
 
 st.set_page_config(
     page_title="Gerar Faturas - Sistema de Gerenciamento de Faturas",
@@ -17,32 +21,11 @@ st.set_page_config(
     layout="wide"
 )
 
-# Verifica login
-username = login_required()
-
-# Verifica permissão de acesso
-if not check_access(["admin", "gerente"]):
-    show_access_denied()
+# Verifica login e permissão de acesso
+username = require_page(PAGE_GENERATE_INVOICES)
 
 # Estilo personalizado
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+apply_page_styles()
 
 # Cabeçalho
 col1, col2 = st.columns([1, 3])
@@ -53,6 +36,14 @@ with col2:
     st.markdown('<div class="description">Crie faturas com base em dados processados ou manualmente</div>', unsafe_allow_html=True)
 
 # Função para gerar número de fatura único
+# Colunas dos dados importados necessárias para gerar as faturas
+INVOICE_DATA_COLUMNS = [
+    'Date', 'Partner', 'Country', 'Store', 'Month', 'Year', 'Month_Name', 'Sales', 'Currency',
+    'Royalty_Rate', 'Ad_Fund_Rate', 'Tax_Rate', 'Exchange_Rate',
+    'Royalty_Minor', 'Ad_Fund_Minor', 'Tax_Minor', 'Total_Minor', 'USD_Minor',
+    'Royalty_Amount', 'Ad_Fund_Amount', 'Tax_Amount', 'Total_Amount', 'Amount_USD'
+]
+
 def generate_invoice_number(country, partner):
     """Gera um número de fatura único baseado no país, parceiro e data atual"""
     timestamp = datetime.now().strftime('%Y%m%d%H%M')
@@ -66,29 +57,14 @@ def generate_invoice_number(country, partner):
 tabs = st.tabs(["Gerar de Dados Importados", "Gerar Manualmente"])
 
 with tabs[0]:
-    # Verifica se os dados foram importados
-    if 'imported_data' not in st.session_state or st.session_state.imported_data is None:
+    # Verifica se os dados foram importados (na sessão ou no armazenamento em Parquet)
+    if not has_imported_data():
         st.warning("Nenhum dado importado. Por favor, importe dados primeiro.")
         if st.button("Ir para Importar Dados"):
             st.switch_page("pages/01_Importar_Dados.py")
     else:
-        # Exibe resumo dos dados
-        processed_data = st.session_state.imported_data
-        
-        # Métricas de resumo
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("Total de Parceiros", processed_data['Partner'].nunique())
-        
-        with col2:
-            st.metric("Total de Países", processed_data['Country'].nunique())
-        
-        with col3:
-            st.metric("Total de Vendas", f"R$ {processed_data['Amount'].sum():,.2f}")
-        
-        with col4:
-            st.metric("Valor Total das Faturas", f"R$ {processed_data['Total Amount'].sum():,.2f}")
+        # Parceiros e países disponíveis (lidos do manifesto, sem carregar as vendas)
+        all_partners, all_countries = get_imported_dimensions()
         
         # Seção de geração de faturas
         st.markdown('<div class="sub-header">Gerar Faturas</div>', unsafe_allow_html=True)
@@ -99,22 +75,38 @@ with tabs[0]:
         with col1:
             selected_partners = st.multiselect(
                 "Selecionar Parceiros",
-                options=processed_data['Partner'].unique(),
-                default=list(processed_data['Partner'].unique())
+                options=all_partners,
+                default=list(all_partners)
             )
         
         with col2:
             selected_countries = st.multiselect(
                 "Selecionar Países",
-                options=processed_data['Country'].unique(),
-                default=list(processed_data['Country'].unique())
+                options=all_countries,
+                default=list(all_countries)
             )
         
-        # Filtrar dados
-        filtered_data = processed_data[
-            processed_data['Partner'].isin(selected_partners) &
-            processed_data['Country'].isin(selected_countries)
-        ]
+        # Ler apenas as partições e colunas necessárias para gerar as faturas
+        filtered_data = get_imported_data(
+            columns=INVOICE_DATA_COLUMNS,
+            countries=selected_countries,
+            partners=selected_partners
+        )
+        
+        # Métricas de resumo
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Total de Parceiros", len(all_partners))
+        
+        with col2:
+            st.metric("Total de Países", len(all_countries))
+        
+        with col3:
+            st.metric("Total de Vendas", f"R$ {filtered_data['Sales'].sum():,.2f}")
+        
+        with col4:
+            st.metric("Valor Total das Faturas", f"R$ {filtered_data['Total_Amount'].sum():,.2f}")
         
         # Configurações avançadas
         with st.expander("Configurações Avançadas de Faturamento"):
@@ -229,48 +221,12 @@ with tabs[0]:
                     if use_bc_exchange_rate and 'current_bc_rate' in st.session_state:
                         invoice['exchange_rate'] = st.session_state.current_bc_rate
                         invoice['amount_usd'] = invoice['total_amount'] / st.session_state.current_bc_rate
-                    
-                    # Adicionar informações de parcelamento se habilitado
-                    if 'installment_config' in st.session_state and st.session_state.installment_config.get('enabled', False):
-                        config = st.session_state.installment_config
-                        
-                        # Calcular datas e valores das parcelas
-                        installments = []
-                        
-                        # Usar distribuição percentual se escolhida
-                        if config['distribution'] == "Percentual" and 'installment_percentages' in st.session_state:
-                            percentages = st.session_state.installment_percentages
-                            
-                            # Ajustar para garantir que a soma seja exatamente 100%
-                            if abs(sum(percentages) - 100.0) > 0.01:
-                                adjustment = 100.0 - sum(percentages)
-                                percentages[-1] += adjustment
-                            
-                            # Criar parcelas com valores baseados nas porcentagens
-                            for i in range(config['num_installments']):
-                                due_date = issue_date + timedelta(days=config['first_due_days'] + (i * config['days_between']))
-                                amount = invoice['total_amount'] * (percentages[i] / 100.0)
-                                
-                                installments.append({
-                                    'number': i+1,
-                                    'due_date': due_date,
-                                    'amount': amount
-                                })
-                        else:
-                            # Divisão igual entre parcelas
-                            equal_amount = invoice['total_amount'] / config['num_installments']
-                            
-                            for i in range(config['num_installments']):
-                                due_date = issue_date + timedelta(days=config['first_due_days'] + (i * config['days_between']))
-                                
-                                installments.append({
-                                    'number': i+1,
-                                    'due_date': due_date,
-                                    'amount': equal_amount
-                                })
-                        
-                        # Adicionar à fatura
-                        invoice['installments'] = installments
+                
+                # Adicionar informações de parcelamento se habilitado (plano do lote inteiro de uma vez)
+                if 'installment_config' in st.session_state and st.session_state.installment_config.get('enabled', False):
+                    config = st.session_state.installment_config
+                    percentages = st.session_state.get('installment_percentages') if config['distribution'] == "Percentual" else None
+                    attach_installments(invoices, issue_date, config, percentages)
                 
                 # Armazenar no estado da sessão (adicionar às faturas existentes, se houver)
                 if 'invoices' not in st.session_state:
@@ -284,35 +240,42 @@ with tabs[0]:
                 
                 st.success(f"{len(new_invoices)} faturas geradas com sucesso!")
     
-    if 'imported_data' in st.session_state and st.session_state.imported_data is not None:
+    if has_imported_data():
         # Display faturas geradas (only if data is imported)
         if 'invoices' in st.session_state and st.session_state.invoices:
             st.markdown('<div class="sub-header">Faturas Geradas</div>', unsafe_allow_html=True)
             
-            # Converter para DataFrame para exibição mais fácil
-            invoices_df = pd.DataFrame([
-                {
-                    "Fatura #": inv['invoice_number'],
-                    "Parceiro": inv['partner'],
-                    "País": inv['country'],
-                    "Período": f"{inv['month_name']} {inv['year']}",
-                    "Valor Total": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                    "Data de Geração": inv['created_at'].strftime("%d/%m/%Y") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
-                    "Status": "Enviada" if inv.get('sent', False) else "Gerada"
-                } for inv in st.session_state.invoices
-            ])
-            
-            st.dataframe(invoices_df, use_container_width=True)
-            
-            # Detalhes da fatura e download
+            # Tabela paginada das faturas geradas
+            grid = render_invoice_grid(
+                st.session_state.invoices,
+                key="faturas_importadas",
+                columns={
+                    "Fatura #": lambda inv: inv['invoice_number'],
+                    "Parceiro": lambda inv: inv['partner'],
+                    "País": lambda inv: inv['country'],
+                    "Período": lambda inv: f"{inv['month_name']} {inv['year']}",
+                    "Valor Total": lambda inv: f"{inv['currency']} {inv['total_amount']:,.2f}",
+                    "Data de Geração": lambda inv: inv['created_at'].strftime("%d/%m/%Y") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
+                    "Status": lambda inv: "Enviada" if inv.get('sent', False) else "Gerada"
+                },
+                sort_options={
+                    "Fatura #": lambda inv: inv['invoice_number'],
+                    "Parceiro": lambda inv: inv['partner'],
+                    "Valor Total": lambda inv: inv['total_amount']
+                },
+                search_fields=['invoice_number', 'partner', 'country']
+            )
+            page_invoices = grid['records']
+            
+            # Detalhes da fatura e download (opções limitadas à página visível)
             selected_invoice_idx = st.selectbox(
                 "Selecione uma fatura para ver detalhes",
-                options=range(len(st.session_state.invoices)),
-                format_func=lambda i: f"{st.session_state.invoices[i]['invoice_number']} - {st.session_state.invoices[i]['partner']} ({st.session_state.invoices[i]['month_name']} {st.session_state.invoices[i]['year']})"
+                options=range(len(page_invoices)),
+                format_func=lambda i: f"{page_invoices[i]['invoice_number']} - {page_invoices[i]['partner']} ({page_invoices[i]['month_name']} {page_invoices[i]['year']})"
             )
             
             if selected_invoice_idx is not None:
-                selected_invoice = st.session_state.invoices[selected_invoice_idx]
+                selected_invoice = page_invoices[selected_invoice_idx]
                 
                 # Exibir detalhes da fatura
                 with st.expander("Detalhes da Fatura", expanded=True):
@@ -568,8 +531,11 @@ with tabs[1]:
                 subtotal = royalty_amount + ad_fund_amount
                 total_amount = subtotal + tax_amount
                 
-                # Distribuir em parcelas iguais por padrão
-                equal_amount = total_amount / num_installments
+                # Plano padrão: parcelas iguais a cada 30 dias a partir da primeira (unidades menores exatas)
+                default_schedule = build_installment_schedule([total_amount], first_due_date, num_installments,
+                                                              first_due_days=0, currency=currency)
+                default_due_dates = default_schedule['due_dates'][0].astype(object)
+                default_amounts = default_schedule['amounts'][0]
                 
                 # Interface para configurar cada parcela
                 installments_data = []
@@ -581,15 +547,15 @@ with tabs[1]:
                         st.markdown(f"**Parcela {i+1}**")
                     
                     with col_inst_date:
-                        # Calcular data de vencimento desta parcela (30 dias entre parcelas)
-                        due_date = first_due_date + timedelta(days=i*30)
+                        # Data de vencimento desta parcela (30 dias entre parcelas)
+                        due_date = default_due_dates[i]
                         due_date_str = due_date.strftime("%d/%m/%Y")
                         st.text_input(f"Vencimento parcela {i+1}", value=due_date_str, key=f"due_date_{i}", disabled=True)
                     
                     with col_inst_amount:
                         inst_amount = st.number_input(f"Valor parcela {i+1}", 
                                                    min_value=0.01, 
-                                                   value=round(equal_amount, 2),
+                                                   value=max(float(default_amounts[i]), 0.01),
                                                    format="%.2f",
                                                    key=f"inst_amount_{i}")
                     
@@ -602,7 +568,7 @@ with tabs[1]:
                 
                 # Verificar se a soma das parcelas é igual ao valor total
                 total_installments = sum(inst['amount'] for inst in installments_data)
-                if abs(total_installments - total_amount) > 0.01:
+                if to_minor([inst['amount'] for inst in installments_data], currency).sum() != to_minor(total_amount, currency):
                     st.warning(f"A soma das parcelas ({total_installments:.2f}) é diferente do valor total da fatura ({total_amount:.2f}).")
             
             # Taxa de câmbio
@@ -865,7 +831,6 @@ with tabs[1]:
     if 'invoices' in st.session_state and st.session_state.invoices:
         st.markdown('<div class="sub-header">Faturas Geradas</div>', unsafe_allow_html=True)
         
-        # Converter para DataFrame para exibição mais fácil
         # Mapeamento de códigos de país para nomes completos (atualizados para 3 letras)
         country_names = {
             'BRA': 'Brasil',
@@ -913,20 +878,26 @@ with tabs[1]:
             'QA': 'Qatar',
         }
             
-        invoices_df = pd.DataFrame([
-            {
-                "Fatura #": inv['invoice_number'],
-                "Parceiro": inv['partner'],
-                "País": country_names.get(inv['country'], inv['country']),  # Nome completo do país
-                "Categoria": inv.get('invoice_category', 'Royaltie'),  # Valor padrão para faturas antigas
-                "Período": f"{inv['month_name']} {inv['year']}",
-                "Valor Total": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                "Data de Geração": inv['created_at'].strftime("%d/%m/%Y") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
-                "Status": "Enviada" if inv.get('sent', False) else "Gerada"
-            } for inv in st.session_state.invoices
-        ])
-        
-        st.dataframe(invoices_df, use_container_width=True)
+        render_invoice_grid(
+            st.session_state.invoices,
+            key="faturas_manuais",
+            columns={
+                "Fatura #": lambda inv: inv['invoice_number'],
+                "Parceiro": lambda inv: inv['partner'],
+                "País": lambda inv: country_names.get(inv['country'], inv['country']),  # Nome completo do país
+                "Categoria": lambda inv: inv.get('invoice_category', 'Royaltie'),  # Valor padrão para faturas antigas
+                "Período": lambda inv: f"{inv['month_name']} {inv['year']}",
+                "Valor Total": lambda inv: f"{inv['currency']} {inv['total_amount']:,.2f}",
+                "Data de Geração": lambda inv: inv['created_at'].strftime("%d/%m/%Y") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
+                "Status": lambda inv: "Enviada" if inv.get('sent', False) else "Gerada"
+            },
+            sort_options={
+                "Fatura #": lambda inv: inv['invoice_number'],
+                "Parceiro": lambda inv: inv['partner'],
+                "Valor Total": lambda inv: inv['total_amount']
+            },
+            search_fields=['invoice_number', 'partner', 'country']
+        )
         
         # Próximos passos
         st.markdown("#### Próximos Passos")
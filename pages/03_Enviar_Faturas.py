@@ -1,8 +1,15 @@
 import streamlit as st
 import pandas as pd
-from utils.email_sender import send_invoice_email, get_default_email_template, send_bulk_invoices
-import json
+from utils.email_templates import (LANGUAGES, TEMPLATE_VARIABLES, TemplateError, default_templates, invoice_language,
+                                   make_renderer, render_invoice_email, validate_template)
+from utils.email_outbox import (enqueue_invoices, mark_sent_invoices, render_outbox_progress, list_messages,
+                                retry_failed, STATUS_FAILED, STATUS_QUEUED, STATUS_SENT)
+from utils.invoice_grid import render_invoice_grid, clear_grid_selection
 import os
+from assets.static_bundle import apply_page_styles
+from utils.partner_directory import (get_partner_directory, import_partners_file, export_partners_csv,
+                                     split_list, EXPORT_COLUMNS)
+from utils.permissions import require_page, can, PAGE_SEND_INVOICES, ACTION_SEND_INVOICES
 
 st.set_page_config(
     page_title="Send Invoices - Invoice Management System",
@@ -10,25 +17,11 @@ st.set_page_config(
     layout="wide"
 )
 
+# Check login and page access
+username = require_page(PAGE_SEND_INVOICES)
+
 # Custom styling
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+apply_page_styles()
 
 # Header
 st.markdown('<div class="main-header">Send Invoices</div>', unsafe_allow_html=True)
@@ -40,18 +33,10 @@ if 'invoices' not in st.session_state or not st.session_state.invoices:
     if st.button("Go to Generate Invoices"):
         st.switch_page("pages/02_Gerar_Faturas.py")
 else:
-    # Initialize partner emails in session state if not exists
+    # Initialize partner emails in session state from the partner directory
     if 'partner_emails' not in st.session_state:
-        # Create data directory if it doesn't exist
-        os.makedirs('data', exist_ok=True)
-        
-        # Try to load from file
-        try:
-            with open('data/partner_emails.json', 'r') as f:
-                st.session_state.partner_emails = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Create empty dictionary if file doesn't exist or is invalid
-            st.session_state.partner_emails = {}
+        st.session_state.partner_emails = get_partner_directory().email_mapping(
+            {inv['partner'] for inv in st.session_state.invoices})
     
     # Email configuration
     with st.expander("Email Configuration", expanded=False):
@@ -87,42 +72,127 @@ else:
             st.session_state.sender_email = sender_email
             st.success("Email configuration saved!")
     
-    # Partner email management
-    with st.expander("Partner Email Management", expanded=False):
+    # Partner directory (contacts, billing address and tax ID used in emails, PDFs and reconciliation)
+    with st.expander("Partner Directory", expanded=False):
         # Get unique partners from invoices
         partners = sorted(list({inv['partner'] for inv in st.session_state.invoices}))
+        directory = get_partner_directory()
         
-        # Display current partner emails
-        st.markdown("#### Current Partner Emails")
+        st.markdown("#### Partners in Current Invoices")
+        st.caption("Separate several emails or aliases with commas. Every listed email receives the invoices.")
         
-        partner_emails_df = pd.DataFrame([
-            {"Partner": partner, "Email": st.session_state.partner_emails.get(partner, "")}
-            for partner in partners
-        ])
+        partner_rows = []
+        for partner in partners:
+            record = directory.get(partner) or {}
+            address = record.get('billing_address') or {}
+            partner_rows.append({
+                "Partner": partner,
+                "Emails": st.session_state.partner_emails.get(partner, ""),
+                "Aliases": ", ".join(record.get('aliases') or []),
+                "Tax ID": record.get('tax_id', ""),
+                "Language": record.get('language', ""),
+                "Address": address.get('line1', ""),
+                "City": address.get('city', ""),
+                "State": address.get('state', ""),
+                "Postal Code": address.get('postal_code', "")
+            })
         
         # Use Streamlit's editable dataframe
         edited_df = st.data_editor(
-            partner_emails_df,
+            pd.DataFrame(partner_rows),
             use_container_width=True,
             column_config={
                 "Partner": st.column_config.TextColumn("Partner", disabled=True),
-                "Email": st.column_config.TextColumn("Email Address")
+                "Emails": st.column_config.TextColumn("Email Addresses"),
+                "Language": st.column_config.SelectboxColumn("Email Language", options=list(LANGUAGES),
+                                                             help="Empty: language of the invoice country")
             },
-            hide_index=True
+            hide_index=True,
+            key="partner_directory_editor"
         )
         
         # Save button
-        if st.button("Save Partner Emails"):
-            # Update session state with edited values
-            for _, row in edited_df.iterrows():
-                st.session_state.partner_emails[row['Partner']] = row['Email']
+        if st.button("Save Partners"):
+            records = []
+            for row in edited_df.to_dict('records'):
+                st.session_state.partner_emails[row['Partner']] = row['Emails'] or ""
+                existing = directory.get(row['Partner']) or {}
+                records.append({
+                    'name': directory.resolve(row['Partner']) or row['Partner'],
+                    'aliases': split_list(row['Aliases']),
+                    'tax_id': (row['Tax ID'] or "").strip(),
+                    'language': row['Language'] if row['Language'] in LANGUAGES else "",
+                    'billing_address': {
+                        **(existing.get('billing_address') or {}),
+                        'line1': row['Address'], 'city': row['City'],
+                        'state': row['State'], 'postal_code': row['Postal Code']
+                    }
+                })
             
-            # Save to file
-            os.makedirs('data', exist_ok=True)
-            with open('data/partner_emails.json', 'w') as f:
-                json.dump(st.session_state.partner_emails, f, indent=4)
+            # Save to the partner directory
+            directory.upsert(records)
+            directory.set_emails({row['Partner']: row['Emails'] for row in edited_df.to_dict('records')})
             
-            st.success("Partner emails saved successfully!")
+            st.success("Partners saved successfully!")
+        
+        # Batch import / export
+        st.markdown("#### Import / Export")
+        col1, col2 = st.columns(2)
+        with col1:
+            partners_file = st.file_uploader("Import partners (CSV or Excel)", type=["csv", "xlsx", "xls"],
+                                             key="partners_import_file",
+                                             help="Columns: " + ", ".join(EXPORT_COLUMNS) + ". One row per contact.")
+            if partners_file is not None and st.button("Import Partners"):
+                imported, import_errors = import_partners_file(partners_file)
+                for error in import_errors:
+                    st.warning(error)
+                if imported:
+                    # Reload recipient emails from the directory
+                    st.session_state.partner_emails = directory.email_mapping(partners)
+                    st.success(f"{imported} partners imported.")
+        with col2:
+            st.download_button("Export Partners (CSV)", data=export_partners_csv(),
+                               file_name="partners.csv", mime="text/csv")
+    
+    # Invoices delivered by the outbox since the last run
+    mark_sent_invoices(st.session_state.invoices)
+    
+    # Delivery progress of the last queued batch (emails are sent in the background)
+    if st.session_state.get('outbox_batch_id'):
+        render_outbox_progress(st.session_state.outbox_batch_id)
+    
+    last_result = st.session_state.pop('outbox_last_result', None)
+    if last_result:
+        if last_result.get(STATUS_FAILED):
+            st.warning(f"Sent {last_result.get(STATUS_SENT, 0)} invoices, but {last_result[STATUS_FAILED]} failed.")
+        else:
+            st.success(f"Successfully sent {last_result.get(STATUS_SENT, 0)} invoices!")
+    
+    # Emails of this user waiting for a retry (e.g. SMTP password missing after a restart)
+    waiting_messages = list_messages(statuses=[STATUS_QUEUED], owner=username, with_error=True, limit=50)
+    if waiting_messages:
+        with st.expander(f"Emails Waiting to Retry ({len(waiting_messages)})"):
+            st.dataframe(pd.DataFrame([{
+                'Invoice #': message['invoice_number'],
+                'Partner': message['partner'],
+                'Recipients': message['recipients'],
+                'Attempts': message['attempts'],
+                'Error': message['last_error']
+            } for message in waiting_messages]), use_container_width=True, hide_index=True)
+    
+    failed_messages = list_messages(statuses=[STATUS_FAILED], owner=username, limit=50)
+    if failed_messages:
+        with st.expander(f"Failed Emails ({len(failed_messages)})"):
+            st.dataframe(pd.DataFrame([{
+                'Invoice #': message['invoice_number'],
+                'Partner': message['partner'],
+                'Recipients': message['recipients'],
+                'Attempts': message['attempts'],
+                'Error': message['last_error']
+            } for message in failed_messages]), use_container_width=True, hide_index=True)
+            if st.button("Retry Failed Emails", disabled=not can(ACTION_SEND_INVOICES)):
+                retry_failed(owner=username)
+                st.rerun()
     
     # Display invoices to send
     st.markdown('<div class="sub-header">Invoices to Send</div>', unsafe_allow_html=True)
@@ -133,26 +203,27 @@ else:
     if not unsent_invoices:
         st.info("All invoices have been sent.")
     else:
-        # Convert to DataFrame for easier display
-        invoices_df = pd.DataFrame([
-            {
-                "Select": False,
-                "Invoice #": inv['invoice_number'],
-                "Partner": inv['partner'],
-                "Country": inv['country'],
-                "Period": f"{inv['month_name']} {inv['year']}",
-                "Total Amount": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                "Generated Date": inv['created_at'].strftime("%Y-%m-%d") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
-                "Recipient Email": st.session_state.partner_emails.get(inv['partner'], "")
-            } for inv in unsent_invoices
-        ])
-        
-        # Use Streamlit's editable dataframe for selection
-        selected_df = st.data_editor(
-            invoices_df,
-            use_container_width=True,
+        # Paginated, selectable grid; selection is kept across pages
+        grid = render_invoice_grid(
+            unsent_invoices,
+            key="unsent_invoices",
+            columns={
+                "Invoice #": lambda inv: inv['invoice_number'],
+                "Partner": lambda inv: inv['partner'],
+                "Country": lambda inv: inv['country'],
+                "Period": lambda inv: f"{inv['month_name']} {inv['year']}",
+                "Total Amount": lambda inv: f"{inv['currency']} {inv['total_amount']:,.2f}",
+                "Generated Date": lambda inv: inv['created_at'].strftime("%Y-%m-%d") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
+                "Recipient Email": lambda inv: st.session_state.partner_emails.get(inv['partner'], "")
+            },
+            sort_options={
+                "Invoice #": lambda inv: inv['invoice_number'],
+                "Partner": lambda inv: inv['partner'],
+                "Total Amount": lambda inv: inv['total_amount']
+            },
+            search_fields=['invoice_number', 'partner', 'country'],
+            selectable=True,
             column_config={
-                "Select": st.column_config.CheckboxColumn("Select", default=False),
                 "Invoice #": st.column_config.TextColumn("Invoice #", disabled=True),
                 "Partner": st.column_config.TextColumn("Partner", disabled=True),
                 "Country": st.column_config.TextColumn("Country", disabled=True),
@@ -160,66 +231,102 @@ else:
                 "Total Amount": st.column_config.TextColumn("Total Amount", disabled=True),
                 "Generated Date": st.column_config.TextColumn("Generated Date", disabled=True),
                 "Recipient Email": st.column_config.TextColumn("Recipient Email")
-            },
-            hide_index=True
+            }
         )
         
-        # Filtering selected invoices
-        selected_invoices_df = selected_df[selected_df['Select']]
+        # Keep recipient emails edited on the visible page
+        for partner, email in zip(grid['frame']['Partner'], grid['frame']['Recipient Email']):
+            if (email or "") != st.session_state.partner_emails.get(partner, ""):
+                st.session_state.partner_emails[partner] = email or ""
+        
+        # Selected invoices (from every page)
+        selected_invoices = [inv for inv in unsent_invoices if inv['invoice_number'] in grid['selected']]
         
         # Email template
-        if not selected_invoices_df.empty:
+        if selected_invoices:
             st.markdown('<div class="sub-header">Email Template</div>', unsafe_allow_html=True)
+            st.caption(f"{len(selected_invoices)} invoice(s) selected")
+            
+            # Each partner language has its own template; edits apply to every selected invoice in that language
+            invoice_languages = {inv['invoice_number']: invoice_language(inv) for inv in selected_invoices}
+            languages = sorted(set(invoice_languages.values()))
+            overrides = st.session_state.setdefault('email_template_overrides', {})
+            
+            if len(languages) > 1:
+                language = st.selectbox("Template Language", languages, format_func=lambda code: LANGUAGES[code])
+            else:
+                language = languages[0]
             
-            # Get the first selected invoice for template preview
-            first_selected_idx = selected_df[selected_df['Select']].index[0]
-            first_selected_invoice_number = selected_df.loc[first_selected_idx, 'Invoice #']
-            selected_invoice = next((inv for inv in unsent_invoices if inv['invoice_number'] == first_selected_invoice_number), None)
+            # Selected invoices in this language; the first one is used for the preview
+            language_invoices = [inv for inv in selected_invoices if invoice_languages[inv['invoice_number']] == language]
+            selected_invoice = language_invoices[0]
             
             if selected_invoice:
-                # Get default template
-                template = get_default_email_template(selected_invoice)
+                # Get template (edited or default)
+                default = default_templates(language)
+                template = overrides.get(language, default)
                 
                 # Allow customization
-                email_subject = st.text_input("Email Subject", value=template['subject'])
-                email_body = st.text_area("Email Body", value=template['body'], height=300)
+                st.caption("Placeholders: " + ", ".join("{{ " + name + " }}" for name in TEMPLATE_VARIABLES)
+                           + ". Filters: money, date, upper, lower, title, default, e.g. {{ total_amount|money }}.")
+                email_subject = st.text_input("Email Subject", value=template['subject'], key=f"email_subject_{language}")
+                email_body = st.text_area("Email Body", value=template['body'], height=300, key=f"email_body_{language}")
+                
+                template_errors = validate_template(email_subject, email_body, language_invoices, language)
+                if template_errors:
+                    for error in template_errors:
+                        st.error(error)
+                elif email_subject == default['subject'] and email_body == default['body']:
+                    overrides.pop(language, None)
+                else:
+                    overrides[language] = {'subject': email_subject, 'body': email_body}
+                
+                if not template_errors:
+                    with st.expander("Preview", expanded=False):
+                        try:
+                            preview = render_invoice_email(selected_invoice, overrides)
+                        except TemplateError as e:
+                            st.error(f"Cannot render the email template: {e}")
+                        else:
+                            st.markdown(f"**Subject:** {preview['subject']}")
+                            st.markdown(preview['body'], unsafe_allow_html=True)
                 
                 # Send emails
-                if st.button("Send Selected Invoices"):
+                if st.button("Send Selected Invoices", disabled=not can(ACTION_SEND_INVOICES) or bool(template_errors)):
                     # Check if all selected invoices have recipient emails
-                    missing_emails = selected_df[(selected_df['Select']) & (selected_df['Recipient Email'] == "")]
+                    missing_emails = {inv['partner'] for inv in selected_invoices
+                                      if not st.session_state.partner_emails.get(inv['partner'], "")}
                     
-                    if not missing_emails.empty:
+                    if missing_emails:
                         st.error(f"Missing recipient emails for {len(missing_emails)} partners. Please add all recipient emails before sending.")
                     else:
-                        with st.spinner("Sending invoices..."):
-                            # Create email mapping
-                            email_mapping = {}
-                            for _, row in selected_df[selected_df['Select']].iterrows():
-                                email_mapping[row['Partner']] = row['Recipient Email']
-                                # Also update the partner_emails session state
-                                st.session_state.partner_emails[row['Partner']] = row['Recipient Email']
-                            
-                            # Save updated partner emails to file
-                            with open('data/partner_emails.json', 'w') as f:
-                                json.dump(st.session_state.partner_emails, f, indent=4)
+                        # Create email mapping
+                        email_mapping = {inv['partner']: st.session_state.partner_emails[inv['partner']]
+                                         for inv in selected_invoices}
+                        
+                        # Save updated partner emails to the partner directory
+                        get_partner_directory().set_emails(email_mapping)
+                        
+                        # Queue emails; the outbox workers send them in the background
+                        try:
+                            batch_id, queued_count, skipped = enqueue_invoices(selected_invoices, email_mapping,
+                                                                               owner=username,
+                                                                               render=make_renderer(overrides))
+                        except TemplateError as e:
+                            # Nothing is queued when a template cannot be rendered for one of the invoices
+                            st.error(f"Cannot render the email template: {e}")
+                        else:
+                            clear_grid_selection("unsent_invoices")
                             
-                            # Get selected invoices
-                            selected_invoice_numbers = selected_df[selected_df['Select']]['Invoice #'].tolist()
-                            selected_invoices = [inv for inv in unsent_invoices if inv['invoice_number'] in selected_invoice_numbers]
-                            
-                            # Send emails
-                            success_count, fail_count, failed_invoices = send_bulk_invoices(selected_invoices, email_mapping)
-                            
-                            if fail_count == 0:
-                                st.success(f"Successfully sent {success_count} invoices!")
-                            else:
-                                st.warning(f"Sent {success_count} invoices, but {fail_count} failed.")
-                                
-                                # Show failed invoices
-                                st.error("Failed Invoices:")
-                                for failed in failed_invoices:
+                            if queued_count:
+                                st.session_state.outbox_batch_id = batch_id
+                                st.success(f"{queued_count} invoices queued for sending.")
+                            if skipped:
+                                st.warning(f"{len(skipped)} invoices were not queued.")
+                                for failed in skipped:
                                     st.markdown(f"- **{failed['invoice_number']}** ({failed['partner']}): {failed['error']}")
+                            if queued_count:
+                                render_outbox_progress(batch_id)
         
         # View sent invoices
         st.markdown('<div class="sub-header">Sent Invoices</div>', unsafe_allow_html=True)
@@ -230,20 +337,26 @@ else:
         if not sent_invoices:
             st.info("No invoices have been sent yet.")
         else:
-            # Convert to DataFrame for easier display
-            sent_invoices_df = pd.DataFrame([
-                {
-                    "Invoice #": inv['invoice_number'],
-                    "Partner": inv['partner'],
-                    "Country": inv['country'],
-                    "Period": f"{inv['month_name']} {inv['year']}",
-                    "Total Amount": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                    "Generated Date": inv['created_at'].strftime("%Y-%m-%d") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
-                    "Status": "Paid" if inv.get('paid', False) else "Sent"
-                } for inv in sent_invoices
-            ])
-            
-            st.dataframe(sent_invoices_df, use_container_width=True)
+            render_invoice_grid(
+                sent_invoices,
+                key="sent_invoices",
+                columns={
+                    "Invoice #": lambda inv: inv['invoice_number'],
+                    "Partner": lambda inv: inv['partner'],
+                    "Country": lambda inv: inv['country'],
+                    "Period": lambda inv: f"{inv['month_name']} {inv['year']}",
+                    "Total Amount": lambda inv: f"{inv['currency']} {inv['total_amount']:,.2f}",
+                    "Generated Date": lambda inv: inv['created_at'].strftime("%Y-%m-%d") if hasattr(inv['created_at'], 'strftime') else inv['created_at'],
+                    "Status": lambda inv: "Paid" if inv.get('paid', False) else "Sent"
+                },
+                sort_options={
+                    "Invoice #": lambda inv: inv['invoice_number'],
+                    "Partner": lambda inv: inv['partner'],
+                    "Total Amount": lambda inv: inv['total_amount']
+                },
+                search_fields=['invoice_number', 'partner', 'country'],
+                styled_columns=["Status"]
+            )
         
         # Next steps
         st.markdown("#### Next Steps")
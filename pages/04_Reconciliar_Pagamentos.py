@@ -2,11 +2,16 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from utils.data_processor import import_payment_data
-from utils.payment_reconciliation import reconcile_payments, find_potential_matches, manually_reconcile_payment
+from utils.payment_reconciliation import RECONCILE_JOB, apply_reconciliation, find_potential_matches, manually_reconcile_payment
+from utils.jobs import (submit_job, get_job, get_job_result, list_jobs, render_job_progress, FINAL_STATUSES,
+                        STATUS_DONE, STATUS_CANCELLED)
 from utils.invoice_generator import create_invoice_pdf, get_invoice_download_link
-from utils.auth import login_required
+from utils.audit_log import log_event, ACTION_PAYMENT_RECONCILED
+from utils.permissions import require_page, can, PAGE_RECONCILE_PAYMENTS, ACTION_RECONCILE, ACTION_REGISTER_PAYMENT
+from utils.invoice_grid import render_invoice_grid
 from assets.logo_header import render_logo, render_icon
 import base64
+from assets.static_bundle import apply_page_styles
 
 st.set_page_config(
     page_title="Reconciliar Pagamentos - Sistema de Gerenciamento de Faturas",
@@ -14,28 +19,11 @@ st.set_page_config(
     layout="wide"
 )
 
-# Verifica login
-username = login_required()
+# Verifica login e permissão de acesso
+username = require_page(PAGE_RECONCILE_PAYMENTS)
 
 # Estilo personalizado
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+apply_page_styles()
 
 # Cabeçalho com logo
 col1, col2 = st.columns([1, 3])
@@ -47,6 +35,26 @@ with col2:
     st.markdown('<div class="main-header">Reconciliar Pagamentos</div>', unsafe_allow_html=True)
     st.markdown('<div class="description">Associe pagamentos do extrato bancário com faturas</div>', unsafe_allow_html=True)
 
+# Colunas da tabela de status das faturas (formatadas apenas para a página visível)
+INVOICE_STATUS_COLUMNS = {
+    "Fatura #": lambda inv: inv['invoice_number'],
+    "Parceiro": lambda inv: inv['partner'],
+    "País": lambda inv: inv['country'],
+    "Período": lambda inv: f"{inv['month_name']} {inv['year']}",
+    "Valor Total": lambda inv: f"{inv['currency']} {inv['total_amount']:,.2f}",
+    "Valor Pago": lambda inv: f"{inv['currency']} {inv.get('payment_amount', 0):,.2f}",
+    "Valor Restante": lambda inv: f"{inv['currency']} {inv['total_amount'] - inv.get('payment_amount', 0):,.2f}",
+    "Status": lambda inv: "Paga" if inv.get('paid', False) else "Parcialmente Paga" if inv.get('payment_amount', 0) > 0 else "Não Paga",
+    "Data de Pagamento": lambda inv: inv.get('payment_date', '').strftime("%d/%m/%Y") if hasattr(inv.get('payment_date', ''), 'strftime') else inv.get('payment_date', '')
+}
+
+INVOICE_STATUS_SORT_OPTIONS = {
+    "Fatura #": lambda inv: inv['invoice_number'],
+    "Parceiro": lambda inv: inv['partner'],
+    "Valor Total": lambda inv: inv['total_amount'],
+    "Valor Restante": lambda inv: inv['total_amount'] - inv.get('payment_amount', 0)
+}
+
 # Inicializa estados da sessão se necessário
 if 'payments' not in st.session_state:
     st.session_state.payments = None
@@ -59,6 +67,49 @@ if 'invoices' not in st.session_state or not st.session_state.invoices:
     if st.button("Ir para Gerar Faturas"):
         st.switch_page("pages/02_Gerar_Faturas.py")
 else:
+    # Retoma a reconciliação em andamento do usuário (ex.: sessão reiniciada)
+    if not st.session_state.get('reconcile_job_id'):
+        running_job = next((job for job in list_jobs(owner=username)
+                            if job['kind'] == RECONCILE_JOB and job['status'] not in FINAL_STATUSES), None)
+        if running_job is not None:
+            st.session_state.reconcile_job_id = running_job['id']
+    
+    # Acompanha a reconciliação mesmo sem o extrato carregado (ex.: ao voltar de outra página)
+    reconcile_job_id = st.session_state.get('reconcile_job_id')
+    if reconcile_job_id:
+        reconcile_job = get_job(reconcile_job_id)
+        
+        if reconcile_job is not None and reconcile_job['status'] not in FINAL_STATUSES:
+            render_job_progress(reconcile_job_id)
+        else:
+            del st.session_state['reconcile_job_id']
+            reconcile_result = get_job_result(reconcile_job_id) if reconcile_job else None
+            
+            if reconcile_job is not None and reconcile_job['status'] == STATUS_DONE and reconcile_result is not None:
+                reconciled_payments, invoice_changes = reconcile_result
+                
+                # Aplica apenas os campos de pagamento às faturas atuais
+                applied, skipped = apply_reconciliation(st.session_state.invoices, reconciled_payments, invoice_changes)
+                st.session_state.reconciled_payments = reconciled_payments
+                
+                for payment in reconciled_payments:
+                    if payment['reconciled']:
+                        log_event(ACTION_PAYMENT_RECONCILED, payment['matched_invoice'], automatic=True,
+                                  amount=payment['Amount'], payment_date=payment['Date'],
+                                  description=payment['Description'])
+                
+                st.success(f"Pagamentos reconciliados com sucesso! {len(applied)} fatura(s) atualizada(s).")
+                if skipped:
+                    st.warning(f"{len(skipped)} fatura(s) foram alteradas ou excluídas durante a reconciliação "
+                               f"e não foram atualizadas: {', '.join(skipped[:10])}"
+                               + (f" e mais {len(skipped) - 10}" if len(skipped) > 10 else "")
+                               + ". Os pagamentos correspondentes ficaram sem associação.")
+            elif reconcile_job is not None and reconcile_job['status'] == STATUS_CANCELLED:
+                st.warning("A reconciliação foi cancelada.")
+            else:
+                error = reconcile_job['error'] if reconcile_job else "resultado não encontrado"
+                st.error(f"Falha ao reconciliar pagamentos: {error}")
+    
     # Seção de importação de pagamentos
     st.markdown('<div class="sub-header">Importar Extrato Bancário</div>', unsafe_allow_html=True)
     
@@ -94,19 +145,17 @@ else:
             # Seção de reconciliação
             st.markdown('<div class="sub-header">Reconciliar Pagamentos</div>', unsafe_allow_html=True)
             
-            if st.button("Associar Pagamentos com Faturas"):
-                with st.spinner("Reconciliando pagamentos..."):
-                    # Filtra apenas pagamentos de entrada (valores positivos)
-                    incoming_payments = payments_df[payments_df['Amount'] > 0]
-                    
-                    # Reconcilia pagamentos
-                    reconciled_payments, updated_invoices = reconcile_payments(incoming_payments, st.session_state.invoices)
-                    
-                    # Armazena dados reconciliados
-                    st.session_state.reconciled_payments = reconciled_payments
-                    st.session_state.invoices = updated_invoices
-                    
-                    st.success("Pagamentos reconciliados com sucesso!")
+            if st.button("Associar Pagamentos com Faturas", disabled=bool(st.session_state.get('reconcile_job_id')) or not can(ACTION_RECONCILE)):
+                # Filtra apenas pagamentos de entrada (valores positivos)
+                incoming_payments = payments_df[payments_df['Amount'] > 0]
+                
+                # Reconcilia pagamentos em segundo plano
+                st.session_state.reconcile_job_id = submit_job(
+                    RECONCILE_JOB,
+                    {'payments': incoming_payments, 'invoices': st.session_state.invoices},
+                    owner=username,
+                    description="Reconciliação de pagamentos")
+                st.rerun()
             
             # Exibe resultados da reconciliação
             if 'reconciled_payments' in st.session_state and st.session_state.reconciled_payments:
@@ -115,18 +164,24 @@ else:
                 
                 matched_payments = [p for p in st.session_state.reconciled_payments if p['reconciled']]
                 if matched_payments:
-                    matched_df = pd.DataFrame([
-                        {
-                            "Data": p['Date'].strftime("%d/%m/%Y") if hasattr(p['Date'], 'strftime') else p['Date'],
-                            "Valor": f"R$ {p['Amount']:,.2f}",
-                            "Descrição": p['Description'],
-                            "Referência": p['Reference'],
-                            "Fatura Associada": p['matched_invoice'],
-                            "Confiança": f"{p['match_score']}%"
-                        } for p in matched_payments
-                    ])
-                    
-                    st.dataframe(matched_df, use_container_width=True)
+                    render_invoice_grid(
+                        matched_payments,
+                        key="pagamentos_associados",
+                        columns={
+                            "Data": lambda p: p['Date'].strftime("%d/%m/%Y") if hasattr(p['Date'], 'strftime') else p['Date'],
+                            "Valor": lambda p: f"R$ {p['Amount']:,.2f}",
+                            "Descrição": lambda p: p['Description'],
+                            "Referência": lambda p: p['Reference'],
+                            "Fatura Associada": lambda p: p['matched_invoice'],
+                            "Confiança": lambda p: f"{p['match_score']}%"
+                        },
+                        sort_options={
+                            "Data": lambda p: p['Date'],
+                            "Valor": lambda p: p['Amount'],
+                            "Confiança": lambda p: p['match_score']
+                        },
+                        search_fields=['Description', 'Reference', 'matched_invoice']
+                    )
                 else:
                     st.info("Nenhum pagamento foi automaticamente associado às faturas.")
                 
@@ -135,29 +190,35 @@ else:
                 
                 unmatched_payments = [p for p in st.session_state.reconciled_payments if not p['reconciled']]
                 if unmatched_payments:
-                    unmatched_df = pd.DataFrame([
-                        {
-                            "Data": p['Date'].strftime("%d/%m/%Y") if hasattr(p['Date'], 'strftime') else p['Date'],
-                            "Valor": f"R$ {p['Amount']:,.2f}",
-                            "Descrição": p['Description'],
-                            "Referência": p['Reference']
-                        } for p in unmatched_payments
-                    ])
-                    
-                    st.dataframe(unmatched_df, use_container_width=True)
+                    unmatched_grid = render_invoice_grid(
+                        unmatched_payments,
+                        key="pagamentos_nao_associados",
+                        columns={
+                            "Data": lambda p: p['Date'].strftime("%d/%m/%Y") if hasattr(p['Date'], 'strftime') else p['Date'],
+                            "Valor": lambda p: f"R$ {p['Amount']:,.2f}",
+                            "Descrição": lambda p: p['Description'],
+                            "Referência": lambda p: p['Reference']
+                        },
+                        sort_options={
+                            "Data": lambda p: p['Date'],
+                            "Valor": lambda p: p['Amount']
+                        },
+                        search_fields=['Description', 'Reference']
+                    )
+                    unmatched_page = unmatched_grid['records']
                     
                     # Reconciliação manual
                     st.markdown("#### Reconciliação Manual")
                     
-                    # Seleciona pagamento não associado
+                    # Seleciona pagamento não associado (opções limitadas à página visível)
                     selected_payment_idx = st.selectbox(
                         "Selecione um pagamento não associado",
-                        options=range(len(unmatched_payments)),
-                        format_func=lambda i: f"{unmatched_payments[i]['Date'].strftime('%d/%m/%Y') if hasattr(unmatched_payments[i]['Date'], 'strftime') else unmatched_payments[i]['Date']} - R$ {unmatched_payments[i]['Amount']:,.2f} - {unmatched_payments[i]['Description'][:30]}..."
+                        options=range(len(unmatched_page)),
+                        format_func=lambda i: f"{unmatched_page[i]['Date'].strftime('%d/%m/%Y') if hasattr(unmatched_page[i]['Date'], 'strftime') else unmatched_page[i]['Date']} - R$ {unmatched_page[i]['Amount']:,.2f} - {unmatched_page[i]['Description'][:30]}..."
                     )
                     
                     if selected_payment_idx is not None:
-                        selected_payment = unmatched_payments[selected_payment_idx]
+                        selected_payment = unmatched_page[selected_payment_idx]
                         
                         # Mostra detalhes do pagamento
                         st.markdown(f"**Data do Pagamento:** {selected_payment['Date'].strftime('%d/%m/%Y') if hasattr(selected_payment['Date'], 'strftime') else selected_payment['Date']}")
@@ -207,7 +268,7 @@ else:
                                 )
                                 
                                 # Aplica pagamento
-                                if st.button("Aplicar Pagamento"):
+                                if st.button("Aplicar Pagamento", disabled=not can(ACTION_REGISTER_PAYMENT)):
                                     with st.spinner("Aplicando pagamento..."):
                                         # Atualiza o pagamento e as faturas
                                         updated_payment, updated_invoices = manually_reconcile_payment(
@@ -229,6 +290,9 @@ else:
                                             st.session_state.reconciled_payments[payment_idx] = updated_payment
                                         
                                         st.session_state.invoices = updated_invoices
+                                        log_event(ACTION_PAYMENT_RECONCILED, selected_invoice['invoice_number'],
+                                                  amount=payment_amount, payment_date=selected_payment['Date'],
+                                                  description=selected_payment['Description'])
                                         
                                         st.success(f"Pagamento de R$ {payment_amount:,.2f} aplicado à fatura {selected_invoice['invoice_number']}!")
                                         st.rerun()
@@ -240,22 +304,15 @@ else:
             # Seção de status de pagamento das faturas
             st.markdown('<div class="sub-header">Status de Pagamento das Faturas</div>', unsafe_allow_html=True)
             
-            # Converte para DataFrame para exibição mais fácil
-            invoice_status_df = pd.DataFrame([
-                {
-                    "Fatura #": inv['invoice_number'],
-                    "Parceiro": inv['partner'],
-                    "País": inv['country'],
-                    "Período": f"{inv['month_name']} {inv['year']}",
-                    "Valor Total": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                    "Valor Pago": f"{inv['currency']} {inv.get('payment_amount', 0):,.2f}",
-                    "Valor Restante": f"{inv['currency']} {inv['total_amount'] - inv.get('payment_amount', 0):,.2f}",
-                    "Status": "Paga" if inv.get('paid', False) else "Parcialmente Paga" if inv.get('payment_amount', 0) > 0 else "Não Paga",
-                    "Data de Pagamento": inv.get('payment_date', '').strftime("%d/%m/%Y") if hasattr(inv.get('payment_date', ''), 'strftime') else inv.get('payment_date', '')
-                } for inv in st.session_state.invoices
-            ])
-            
-            st.dataframe(invoice_status_df, use_container_width=True)
+            # Tabela paginada do status das faturas
+            render_invoice_grid(
+                st.session_state.invoices,
+                key="status_faturas",
+                columns=INVOICE_STATUS_COLUMNS,
+                sort_options=INVOICE_STATUS_SORT_OPTIONS,
+                search_fields=['invoice_number', 'partner', 'country'],
+                styled_columns=["Status"]
+            )
             
             # Métricas de resumo
             col1, col2, col3, col4 = st.columns(4)
@@ -278,15 +335,16 @@ else:
             # Visualização direta de faturas
             st.markdown('<div class="sub-header">Visualizar Faturas</div>', unsafe_allow_html=True)
             
-            # Seleciona uma fatura para visualizar
-            selected_invoice_view_idx = st.selectbox(
-                "Selecione uma fatura para visualizar",
-                options=range(len(st.session_state.invoices)),
-                format_func=lambda i: f"{st.session_state.invoices[i]['invoice_number']} - {st.session_state.invoices[i]['partner']} ({st.session_state.invoices[i]['currency']} {st.session_state.invoices[i]['total_amount']:,.2f})"
-            )
+            # Seleciona uma fatura para visualizar (busca pelo número em vez de listar todas)
+            invoice_number_view = st.text_input("Número da fatura para visualizar",
+                                                placeholder="Ex: INV-BRA-ABC-202501")
+            selected_invoice_view = next((inv for inv in st.session_state.invoices
+                                          if inv['invoice_number'] == invoice_number_view.strip()), None)
             
-            if selected_invoice_view_idx is not None:
-                selected_invoice_view = st.session_state.invoices[selected_invoice_view_idx]
+            if invoice_number_view and selected_invoice_view is None:
+                st.info("Fatura não encontrada.")
+            
+            if selected_invoice_view is not None:
                 
                 # Cria o PDF da fatura
                 invoice_pdf = create_invoice_pdf(selected_invoice_view)
@@ -361,19 +419,12 @@ else:
         if st.session_state.invoices:
             st.markdown('<div class="sub-header">Status Atual das Faturas</div>', unsafe_allow_html=True)
             
-            # Converte para DataFrame para exibição mais fácil
-            invoice_status_df = pd.DataFrame([
-                {
-                    "Fatura #": inv['invoice_number'],
-                    "Parceiro": inv['partner'],
-                    "País": inv['country'],
-                    "Período": f"{inv['month_name']} {inv['year']}",
-                    "Valor Total": f"{inv['currency']} {inv['total_amount']:,.2f}",
-                    "Valor Pago": f"{inv['currency']} {inv.get('payment_amount', 0):,.2f}",
-                    "Valor Restante": f"{inv['currency']} {inv['total_amount'] - inv.get('payment_amount', 0):,.2f}",
-                    "Status": "Paga" if inv.get('paid', False) else "Parcialmente Paga" if inv.get('payment_amount', 0) > 0 else "Não Paga",
-                    "Data de Pagamento": inv.get('payment_date', '').strftime("%d/%m/%Y") if hasattr(inv.get('payment_date', ''), 'strftime') else inv.get('payment_date', '')
-                } for inv in st.session_state.invoices
-            ])
-            
-            st.dataframe(invoice_status_df, use_container_width=True)
+            # Tabela paginada do status das faturas
+            render_invoice_grid(
+                st.session_state.invoices,
+                key="status_faturas_atual",
+                columns=INVOICE_STATUS_COLUMNS,
+                sort_options=INVOICE_STATUS_SORT_OPTIONS,
+                search_fields=['invoice_number', 'partner', 'country'],
+                styled_columns=["Status"]
+            )
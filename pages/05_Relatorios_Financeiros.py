@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 from utils.report_generator import generate_invoice_summary_df, get_excel_download_link, generate_charts
+from utils.invoice_grid import render_invoice_grid
 import datetime
+from assets.static_bundle import apply_page_styles
+from utils.permissions import require_page, PAGE_FINANCIAL_REPORTS
 
 st.set_page_config(
     page_title="Financial Reports - Invoice Management System",
@@ -10,25 +13,11 @@ st.set_page_config(
     layout="wide"
 )
 
+# Check login and page access
+username = require_page(PAGE_FINANCIAL_REPORTS)
+
 # Custom styling
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+apply_page_styles()
 
 # Header
 st.markdown('<div class="main-header">Financial Reports</div>', unsafe_allow_html=True)
@@ -97,7 +86,13 @@ else:
     st.markdown('<div class="sub-header">Invoice Summary</div>', unsafe_allow_html=True)
     
     if not summary_df.empty:
-        st.dataframe(summary_df, use_container_width=True)
+        render_invoice_grid(
+            summary_df,
+            key="invoice_summary",
+            sort_options=['Invoice Number', 'Partner', 'Country', 'Total Amount', 'Balance', 'Created Date'],
+            search_fields=['Invoice Number', 'Partner', 'Country', 'Period'],
+            styled_columns=['Status']
+        )
         
         # Download button for Excel report
         st.markdown("#### Download Full Report")
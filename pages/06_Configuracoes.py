@@ -1,8 +1,16 @@
 import streamlit as st
 import json
 import os
-from utils.data_processor import load_country_settings, save_country_settings
+from utils.config_store import ConfigConflictError
+from utils.data_processor import load_country_settings, save_country_settings, country_settings_version
+from utils.dataset_store import has_imported_data as imported_data_available, clear_active_dataset
+from utils.rate_table import store_overrides_frame, apply_store_overrides, schedule_rate_change, rate_versions
+from datetime import date
 import pandas as pd
+from assets.static_bundle import apply_page_styles
+from utils.audit_log import (log_event, query_events, events_frame, ACTION_SETTINGS_SAVED,
+                             ACTION_STORE_OVERRIDES_SAVED, ACTION_EMAIL_SETTINGS_SAVED, ACTION_DATA_RESET)
+from utils.permissions import require_page, can, PAGE_SETTINGS, ACTION_SAVE_SETTINGS, ACTION_RESET_DATA
 
 st.set_page_config(
     page_title="Settings - Invoice Management System",
@@ -10,25 +18,11 @@ st.set_page_config(
     layout="wide"
 )
 
+# Check login and page access
+username = require_page(PAGE_SETTINGS)
+
 # Custom styling
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+apply_page_styles()
 
 # Header
 st.markdown('<div class="main-header">Settings</div>', unsafe_allow_html=True)
@@ -38,8 +32,47 @@ st.markdown('<div class="description">Configure system settings and preferences<
 st.markdown('<div class="sub-header">Country Settings</div>', unsafe_allow_html=True)
 st.markdown("Configure royalty rates, ad fund rates, and tax rates for each country")
 
-# Load current settings
+# Editors whose pending changes are based on the loaded settings
+SETTINGS_EDITORS = ("country_settings_editor", "store_overrides_editor")
+
+def settings_edits_pending():
+    """Indica se algum editor de configurações tem alterações ainda não gravadas"""
+    for key in SETTINGS_EDITORS:
+        state = st.session_state.get(key) or {}
+        if state.get("edited_rows") or state.get("added_rows") or state.get("deleted_rows"):
+            return True
+    return False
+
+def save_settings(settings):
+    """
+    Grava as configurações se nenhuma outra sessão as alterou desde que a edição começou
+
+    Retorna:
+    - bool: True se gravou; em caso de conflito mostra o erro e retorna False
+    """
+    try:
+        st.session_state.country_settings_version = save_country_settings(
+            settings, st.session_state.country_settings_version)
+        return True
+    except ConfigConflictError:
+        st.session_state.settings_conflict = True
+        st.error("Settings were changed by another user since you started editing. "
+                 "Reload the settings and apply your changes again.")
+        return False
+
+# Load current settings (a versão lida só é renovada quando não há edições pendentes)
+loaded_version = country_settings_version()
 country_settings = load_country_settings()
+if 'country_settings_version' not in st.session_state or not settings_edits_pending():
+    st.session_state.country_settings_version = loaded_version
+
+if st.session_state.get('settings_conflict'):
+    st.warning("Your pending changes are based on an older version of the settings.")
+    if st.button("Reload Settings"):
+        for key in SETTINGS_EDITORS:
+            st.session_state.pop(key, None)
+        st.session_state.settings_conflict = False
+        st.rerun()
 
 # Mapeamento de códigos de país para nomes completos
 country_names = {
@@ -110,7 +143,8 @@ edited_df = st.data_editor(
             format="%.1f %%"
         )
     },
-    num_rows="dynamic"
+    num_rows="dynamic",
+    key="country_settings_editor"
 )
 
 # Add new country
@@ -137,30 +171,125 @@ with st.expander("Add New Country"):
                 }
                 
                 # Save settings
-                save_country_settings(country_settings)
-                
-                # Obter o nome completo do país, se disponível
-                country_name = country_names.get(new_country_upper, new_country_upper)
-                st.success(f"País {country_name} ({new_country_upper}) adicionado com sucesso!")
-                st.rerun()
+                if save_settings(country_settings):
+                    # Obter o nome completo do país, se disponível
+                    country_name = country_names.get(new_country_upper, new_country_upper)
+                    st.success(f"País {country_name} ({new_country_upper}) adicionado com sucesso!")
+                    st.rerun()
+
+# Data de início das taxas alteradas (as taxas anteriores continuam valendo para vendas antigas)
+effective_from = st.date_input(
+    "Rate changes effective from",
+    value=date.today(),
+    help="Sales dated before this day keep being billed with the previous rates."
+)
 
 # Save settings button
-if st.button("Save Settings"):
+if st.button("Save Settings", disabled=not can(ACTION_SAVE_SETTINGS)):
     # Update settings from edited DataFrame
     updated_settings = {}
     for _, row in edited_df.iterrows():
         # Importante: Usamos o código do país (não o nome completo) ao salvar as configurações
         country_code = row["Country Code"]
-        updated_settings[country_code] = {
+        rates = {
             "royalty_rate": row["Royalty Rate (%)"] / 100,
             "ad_fund_rate": row["Ad Fund Rate (%)"] / 100,
             "tax_rate": row["Tax Rate (%)"] / 100
         }
+        current = country_settings.get(country_code)
+        
+        if current is None:
+            updated_settings[country_code] = rates
+        elif any(current.get(field) is None or abs(current[field] - value) > 1e-9
+                 for field, value in rates.items()):
+            # Nova versão das taxas a partir da data informada; preserva moeda, câmbio, lojas e histórico
+            updated_settings[country_code] = schedule_rate_change(current, rates, effective_from)
+        else:
+            updated_settings[country_code] = current
     
     # Save updated settings
-    save_country_settings(updated_settings)
-    
-    st.success("Settings saved successfully!")
+    if save_settings(updated_settings):
+        changed = sorted(code for code, config in updated_settings.items() if config != country_settings.get(code))
+        removed = sorted(set(country_settings) - set(updated_settings))
+        log_event(ACTION_SETTINGS_SAVED, changed_countries=changed, removed_countries=removed,
+                  effective_from=effective_from)
+        
+        st.success("Settings saved successfully!")
+
+# Rate history
+with st.expander("Rate History"):
+    history_rows = []
+    for country_code, config in country_settings.items():
+        for version in rate_versions(config):
+            history_rows.append({
+                "Country Code": country_code,
+                "Valid From": version.get("valid_from") or "—",
+                "Royalty Rate (%)": version.get("royalty_rate", 0) * 100,
+                "Ad Fund Rate (%)": version.get("ad_fund_rate", 0) * 100,
+                "Tax Rate (%)": version.get("tax_rate", 0) * 100,
+                "Store Overrides": len(version.get("stores") or {})
+            })
+    st.dataframe(pd.DataFrame(history_rows), use_container_width=True, hide_index=True)
+
+# Store overrides
+with st.expander("Store Rate Overrides"):
+    st.markdown(
+        "Stores listed here use their own royalty and ad fund rates. "
+        "Leave a rate empty to use the country rate; the store `default` applies to every store without its own row. "
+        "Changes apply to sales from the \"Rate changes effective from\" date above."
+    )
+
+    overrides_df = store_overrides_frame(country_settings)
+    overrides_df["royalty_rate"] = overrides_df["royalty_rate"] * 100
+    overrides_df["ad_fund_rate"] = overrides_df["ad_fund_rate"] * 100
+    overrides_df = overrides_df.rename(columns={
+        "Country": "Country Code",
+        "royalty_rate": "Royalty Rate (%)",
+        "ad_fund_rate": "Ad Fund Rate (%)"
+    })
+
+    edited_overrides = st.data_editor(
+        overrides_df,
+        use_container_width=True,
+        column_config={
+            "Country Code": st.column_config.SelectboxColumn(
+                "Country Code",
+                options=list(country_settings.keys()),
+                required=True
+            ),
+            "Store": st.column_config.TextColumn("Store", required=True),
+            "Royalty Rate (%)": st.column_config.NumberColumn(
+                "Royalty Rate (%)",
+                min_value=0.0,
+                max_value=100.0,
+                step=0.1,
+                format="%.1f %%"
+            ),
+            "Ad Fund Rate (%)": st.column_config.NumberColumn(
+                "Ad Fund Rate (%)",
+                min_value=0.0,
+                max_value=100.0,
+                step=0.1,
+                format="%.1f %%"
+            )
+        },
+        num_rows="dynamic",
+        key="store_overrides_editor"
+    )
+
+    if st.button("Save Store Overrides", disabled=not can(ACTION_SAVE_SETTINGS)):
+        overrides = edited_overrides.rename(columns={
+            "Country Code": "Country",
+            "Royalty Rate (%)": "royalty_rate",
+            "Ad Fund Rate (%)": "ad_fund_rate"
+        })
+        overrides["royalty_rate"] = overrides["royalty_rate"] / 100
+        overrides["ad_fund_rate"] = overrides["ad_fund_rate"] / 100
+
+        if save_settings(apply_store_overrides(country_settings, overrides, effective_from)):
+            log_event(ACTION_STORE_OVERRIDES_SAVED, stores=len(overrides))
+            st.success("Store overrides saved successfully!")
+            st.rerun()
 
 # Email Settings
 st.markdown('<div class="sub-header">Email Settings</div>', unsafe_allow_html=True)
@@ -190,12 +319,14 @@ sender_email = st.text_input(
 )
 
 # Save email settings
-if st.button("Save Email Settings"):
+if st.button("Save Email Settings", disabled=not can(ACTION_SAVE_SETTINGS)):
     st.session_state.smtp_server = smtp_server
     st.session_state.smtp_port = smtp_port
     st.session_state.smtp_username = smtp_username
     st.session_state.smtp_password = smtp_password
     st.session_state.sender_email = sender_email
+    log_event(ACTION_EMAIL_SETTINGS_SAVED, smtp_server=smtp_server, smtp_port=smtp_port,
+              smtp_username=smtp_username, sender_email=sender_email)
     
     st.success("Email settings saved successfully!")
 
@@ -211,21 +342,37 @@ with st.expander("Data Overview"):
         st.metric("Total Invoices", num_invoices)
     
     with col2:
-        has_imported_data = "Yes" if 'imported_data' in st.session_state and st.session_state.imported_data is not None else "No"
+        has_imported_data = "Yes" if imported_data_available() else "No"
         st.metric("Data Imported", has_imported_data)
     
     with col3:
         num_countries = len(country_settings)
         st.metric("Configured Countries", num_countries)
 
+with st.expander("Audit Log"):
+    col1, col2 = st.columns(2)
+    with col1:
+        audit_user = st.text_input("Filter by user", key="audit_user_filter").strip()
+    with col2:
+        audit_invoice = st.text_input("Filter by invoice #", key="audit_invoice_filter").strip()
+    
+    audit_events = query_events(invoice_number=audit_invoice or None, user=audit_user or None, limit=200)
+    if audit_events:
+        st.dataframe(pd.DataFrame(events_frame(audit_events)), use_container_width=True, hide_index=True)
+    else:
+        st.info("No audit events found.")
+
 with st.expander("Reset Application Data"):
     st.warning("⚠️ This will reset all application data. This action cannot be undone.")
     
-    if st.button("Reset All Data"):
+    if st.button("Reset All Data", disabled=not can(ACTION_RESET_DATA)):
+        log_event(ACTION_DATA_RESET)
+        
         # Clear session state
         for key in list(st.session_state.keys()):
             if key != "_is_running":
                 del st.session_state[key]
+        clear_active_dataset()
         
         st.success("Application data has been reset.")
         st.rerun()
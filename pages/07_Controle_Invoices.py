@@ -2,8 +2,17 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+import hashlib
 from utils.invoice_generator import get_invoice_download_link
+from utils.invoice_index import get_aging_index, get_due_date
+from utils.invoice_grid import render_invoice_grid
+from utils.payment_service import parse_payment_batch, post_payments, toggle_paid
+from utils.audit_log import (log_event, query_events, events_frame, ACTION_PAYMENT_REGISTERED, ACTION_PAYMENT_BATCH,
+                             ACTION_INVOICE_PAID_TOGGLED, ACTION_INVOICE_EDITED, ACTION_INVOICE_DELETED)
 import json
+from assets.static_bundle import apply_page_styles
+from utils.permissions import (require_page, can, requires_permission, PAGE_INVOICE_CONTROL,
+                               ACTION_REGISTER_PAYMENT, ACTION_EDIT_INVOICE, ACTION_DELETE_INVOICE)
 
 st.set_page_config(
     page_title="Controle de Invoices - Sistema de Gerenciamento de Faturas",
@@ -11,34 +20,64 @@ st.set_page_config(
     layout="wide"
 )
 
+# Verifica login e permissão de acesso (login_required também aplica o tema)
+username = require_page(PAGE_INVOICE_CONTROL)
+
 # Estilo personalizado
-try:
-    with open('assets/style.css') as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-except:
-    pass
-
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2rem;
-        font-weight: bold;
-        color: #4A1F60;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #3A174E;
-        margin-top: 1rem;
-    }
-    .description {
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-    .action-button {
-        margin: 0.2rem;
+apply_page_styles()
+
+# Callbacks de pagamento: executados antes do rerun automático do Streamlit,
+# alterando apenas as faturas afetadas (sem st.rerun() adicional)
+def open_payment_form(invoice_number):
+    st.session_state.payment_form_invoice = invoice_number
+
+def close_payment_form():
+    st.session_state.payment_form_invoice = None
+
+@requires_permission(ACTION_REGISTER_PAYMENT)
+def submit_payment_form(invoice_number):
+    record = {
+        'invoice_number': invoice_number,
+        'amount': st.session_state.payment_form_amount,
+        'date': st.session_state.payment_form_date,
+        'exchange_variation': st.session_state.payment_form_variation
     }
-    </style>
-    """, unsafe_allow_html=True)
+    posted, _, errors = post_payments([record], get_aging_index(st.session_state.invoices))
+
+    if errors:
+        st.session_state.payment_feedback = ('error', errors[0]['error'])
+    else:
+        log_event(ACTION_PAYMENT_REGISTERED, invoice_number, amount=record['amount'], date=record['date'],
+                  exchange_variation=record['exchange_variation'])
+        st.session_state.payment_feedback = ('success', f"Pagamento de {record['amount']:,.2f} registrado com sucesso na fatura {invoice_number}!")
+        st.session_state.payment_form_invoice = None
+
+@requires_permission(ACTION_REGISTER_PAYMENT)
+def toggle_invoice_paid(invoice_number):
+    invoice = toggle_paid(invoice_number, get_aging_index(st.session_state.invoices))
+    if invoice is not None:
+        log_event(ACTION_INVOICE_PAID_TOGGLED, invoice_number, paid=invoice['paid'])
+        st.session_state.payment_feedback = ('success', f"Fatura {invoice_number} marcada como {'paga' if invoice['paid'] else 'não paga'}!")
+
+@requires_permission(ACTION_REGISTER_PAYMENT)
+def apply_payment_batch(batch_df, batch_hash):
+    # Um mesmo arquivo só é lançado uma vez por sessão (evita somar o lote de novo)
+    posted_batches = st.session_state.setdefault('posted_payment_batches', set())
+    if batch_hash in posted_batches:
+        st.session_state.payment_feedback = ('warning', "Este lote de pagamentos já foi registrado.")
+        return
+
+    posted, affected, errors = post_payments(batch_df, get_aging_index(st.session_state.invoices))
+    st.session_state.payment_batch_errors = errors
+
+    if not errors:
+        posted_batches.add(batch_hash)
+        for record in batch_df.to_dict('records'):
+            log_event(ACTION_PAYMENT_BATCH, record['invoice_number'], amount=record['amount'], date=record['date'],
+                      exchange_variation=record.get('exchange_variation', 0.0))
+        st.session_state.payment_feedback = ('success', f"{posted} pagamentos registrados em {len(affected)} faturas.")
+        # Nova chave esvazia o seletor de arquivo
+        st.session_state.payment_batch_upload = st.session_state.get('payment_batch_upload', 0) + 1
 
 # Título da página
 st.markdown('<div class="main-header">Controle de Invoices</div>', unsafe_allow_html=True)
@@ -50,38 +89,13 @@ if 'invoices' not in st.session_state or not st.session_state.invoices:
     if st.button("Ir para Gerar Faturas"):
         st.switch_page("pages/02_Gerar_Faturas.py")
 else:
-    # Definir função para classificar faturas por status de vencimento
-    def classificar_fatura_por_vencimento(invoice):
-        try:
-            # Extrair data de vencimento (assumindo que seja 30 dias após a criação)
-            if 'created_at' in invoice:
-                if isinstance(invoice['created_at'], str):
-                    created_date = datetime.strptime(invoice['created_at'], "%Y-%m-%d")
-                else:
-                    created_date = invoice['created_at']
-                
-                due_date = created_date + timedelta(days=30)
-                
-                # Verificar se a fatura está paga
-                if invoice.get('paid', False):
-                    return "Liquidada"
-                
-                # Verificar se está vencida
-                today = datetime.now()
-                if due_date < today:
-                    return "Vencida"
-                else:
-                    return "A Vencer"
-            else:
-                return "N/A"
-        except Exception as e:
-            st.error(f"Erro ao classificar fatura: {e}")
-            return "Erro"
+    # Índice de vencimento (ordenado por data, buckets de status e trigramas)
+    aging_index = get_aging_index(st.session_state.invoices)
 
-    # Adicionar classificação de vencimento para todas as faturas
-    for invoice in st.session_state.invoices:
-        if 'due_status' not in invoice:
-            invoice['due_status'] = classificar_fatura_por_vencimento(invoice)
+    # Mensagem da última ação de pagamento
+    feedback = st.session_state.pop('payment_feedback', None)
+    if feedback:
+        getattr(st, feedback[0])(feedback[1])
 
     # Filtros
     st.markdown('<div class="sub-header">Filtros</div>', unsafe_allow_html=True)
@@ -90,12 +104,12 @@ else:
     
     with col1:
         # Filtro por país
-        paises = sorted(list({inv.get('country', 'N/A') for inv in st.session_state.invoices}))
+        paises = aging_index.countries()
         pais_selecionado = st.selectbox("Filtrar por País", options=["Todos"] + paises)
     
     with col2:
         # Filtro por Master (parceiro)
-        masters = sorted(list({inv.get('partner', 'N/A') for inv in st.session_state.invoices}))
+        masters = aging_index.partners()
         master_selecionado = st.selectbox("Filtrar por Master", options=["Todos"] + masters)
     
     with col3:
@@ -106,20 +120,13 @@ else:
     # Filtro por número de invoice
     numero_invoice = st.text_input("Filtrar por Número de Invoice", "")
 
-    # Aplicar filtros
-    faturas_filtradas = st.session_state.invoices
-    
-    if pais_selecionado != "Todos":
-        faturas_filtradas = [inv for inv in faturas_filtradas if inv.get('country', 'N/A') == pais_selecionado]
-    
-    if master_selecionado != "Todos":
-        faturas_filtradas = [inv for inv in faturas_filtradas if inv.get('partner', 'N/A') == master_selecionado]
-    
-    if status_selecionado != "Todos":
-        faturas_filtradas = [inv for inv in faturas_filtradas if inv.get('due_status', 'N/A') == status_selecionado]
-    
-    if numero_invoice:
-        faturas_filtradas = [inv for inv in faturas_filtradas if numero_invoice.lower() in inv.get('invoice_number', '').lower()]
+    # Aplicar filtros (interseção dos índices, resultado ordenado por vencimento)
+    faturas_filtradas = aging_index.filter(
+        country=pais_selecionado,
+        partner=master_selecionado,
+        status=status_selecionado,
+        number_query=numero_invoice
+    )
 
     # Exibir resultados
     st.markdown('<div class="sub-header">Invoices</div>', unsafe_allow_html=True)
@@ -127,53 +134,40 @@ else:
     if not faturas_filtradas:
         st.info("Nenhuma fatura encontrada com os filtros aplicados.")
     else:
-        # Preparar dados para exibição
-        faturas_display = []
-        for idx, inv in enumerate(faturas_filtradas):
-            # Criar um dicionário com os dados para exibição
-            faturas_display.append({
-                "ID": idx,
-                "Fatura #": inv.get('invoice_number', 'N/A'),
-                "Master": inv.get('partner', 'N/A'),
-                "País": inv.get('country', 'N/A'),
-                "Período": f"{inv.get('month_name', 'N/A')} {inv.get('year', 'N/A')}",
-                "Valor USD": f"USD {inv.get('amount_usd', 0):,.2f}",
-                "Valor Local": f"{inv.get('currency', '')} {inv.get('total_amount', 0):,.2f}",
-                "Status": inv.get('due_status', 'N/A'),
-                "Data Criação": inv.get('created_at', 'N/A').strftime("%d/%m/%Y") if hasattr(inv.get('created_at', 'N/A'), 'strftime') else inv.get('created_at', 'N/A')
-            })
-
-        # Exibir na tabela
-        faturas_df = pd.DataFrame(faturas_display)
-        
-        # Adicionar estilos para status
-        def highlight_status(val):
-            if val == "Liquidada":
-                return 'background-color: #d4edda; color: #155724'
-            elif val == "Vencida":
-                return 'background-color: #f8d7da; color: #721c24'
-            elif val == "A Vencer":
-                return 'background-color: #fff3cd; color: #856404'
-            return ''
-        
-        # Aplicar estilo
-        styled_df = faturas_df.style.applymap(highlight_status, subset=['Status'])
-        
-        # Remover a coluna ID da visualização, mas manter para referência
-        cols_to_display = [col for col in faturas_df.columns if col != "ID"]
-        
-        # Exibir a tabela
-        st.dataframe(faturas_df[cols_to_display], use_container_width=True)
+        # Tabela paginada: apenas a página visível é formatada e estilizada
+        grid = render_invoice_grid(
+            faturas_filtradas,
+            key="controle_invoices",
+            columns={
+                "Fatura #": lambda inv: inv.get('invoice_number', 'N/A'),
+                "Master": lambda inv: inv.get('partner', 'N/A'),
+                "País": lambda inv: inv.get('country', 'N/A'),
+                "Período": lambda inv: f"{inv.get('month_name', 'N/A')} {inv.get('year', 'N/A')}",
+                "Valor USD": lambda inv: f"USD {inv.get('amount_usd', 0):,.2f}",
+                "Valor Local": lambda inv: f"{inv.get('currency', '')} {inv.get('total_amount', 0):,.2f}",
+                "Status": lambda inv: inv.get('due_status', 'N/A'),
+                "Data Criação": lambda inv: inv.get('created_at', 'N/A').strftime("%d/%m/%Y") if hasattr(inv.get('created_at', 'N/A'), 'strftime') else inv.get('created_at', 'N/A')
+            },
+            sort_options={
+                "Vencimento": get_due_date,
+                "Fatura #": lambda inv: inv.get('invoice_number', ''),
+                "Master": lambda inv: inv.get('partner', ''),
+                "Valor USD": lambda inv: inv.get('amount_usd', 0),
+                "Valor Local": lambda inv: inv.get('total_amount', 0)
+            },
+            styled_columns=["Status"]
+        )
+        faturas_pagina = grid['records']
         
         # Ações para faturas selecionadas
         st.markdown('<div class="sub-header">Ações</div>', unsafe_allow_html=True)
         
-        # Selecionar fatura para ação
+        # Selecionar fatura para ação (opções limitadas à página visível)
         selected_invoice_idx = st.selectbox("Selecione uma fatura para realizar ações:", 
-                                        options=list(range(len(faturas_filtradas))),
-                                        format_func=lambda x: f"{faturas_filtradas[x].get('invoice_number', 'N/A')} - {faturas_filtradas[x].get('partner', 'N/A')} ({faturas_filtradas[x].get('country', 'N/A')})")
+                                        options=list(range(len(faturas_pagina))),
+                                        format_func=lambda x: f"{faturas_pagina[x].get('invoice_number', 'N/A')} - {faturas_pagina[x].get('partner', 'N/A')} ({faturas_pagina[x].get('country', 'N/A')})")
         
-        selected_invoice = faturas_filtradas[selected_invoice_idx]
+        selected_invoice = faturas_pagina[selected_invoice_idx]
         
         # Exibir informações detalhadas da fatura selecionada
         st.markdown("#### Detalhes da Fatura Selecionada")
@@ -240,78 +234,33 @@ else:
             st.markdown(pdf_link, unsafe_allow_html=True)
         
         with col3:
-            # Botão para registrar pagamento
-            if st.button("Registrar Pagamento", use_container_width=True, key="register_payment"):
-                payment_form = st.form("payment_form")
-                with payment_form:
-                    received_amount = st.number_input(
-                        f"Valor Recebido ({selected_invoice.get('currency', 'USD')})",
-                        min_value=0.0,
-                        max_value=float(selected_invoice.get('total_amount', 0)),
-                        value=0.0
-                    )
-                    
-                    payment_date = st.date_input(
-                        "Data do Recebimento",
-                        value=datetime.now()
-                    )
-                    
-                    exchange_variation = st.number_input(
-                        "Variação Cambial (+ ou -)",
-                        value=0.0
-                    )
-                    
-                    submit_payment = st.form_submit_button("Confirmar Pagamento")
-                    
-                    if submit_payment:
-                        # Encontrar a invoice original na lista de sessão e atualizar
-                        for inv in st.session_state.invoices:
-                            if inv.get('invoice_number') == selected_invoice.get('invoice_number'):
-                                if 'payments' not in inv:
-                                    inv['payments'] = []
-                                    
-                                payment_info = {
-                                    'date': payment_date,
-                                    'amount': received_amount,
-                                    'exchange_variation': exchange_variation,
-                                    'currency': inv.get('currency', 'USD')
-                                }
-                                
-                                inv['payments'].append(payment_info)
-                                inv['payment_amount'] = sum(p['amount'] for p in inv['payments'])
-                                inv['paid'] = inv['payment_amount'] >= inv['total_amount']
-                                
-                                if inv['paid']:
-                                    inv['payment_date'] = payment_date
-                                
-                        st.success(f"Pagamento de {selected_invoice.get('currency')} {received_amount:,.2f} registrado com sucesso!")
-                        st.rerun()
-                
-                # Encontrar a invoice original na lista de sessão e atualizar
-                for inv in st.session_state.invoices:
-                    if inv.get('invoice_number') == selected_invoice.get('invoice_number'):
-                        inv['paid'] = not inv.get('paid', False)
-                        inv['due_status'] = "Liquidada" if inv['paid'] else classificar_fatura_por_vencimento(inv)
-                        if inv['paid']:
-                            inv['payment_date'] = datetime.now()
-                            inv['payment_amount'] = inv.get('total_amount', 0)
-                        else:
-                            inv.pop('payment_date', None)
-                            inv['payment_amount'] = 0
-                
-                st.success(f"Fatura {selected_invoice.get('invoice_number')} marcada como {'paga' if not selected_invoice.get('paid', False) else 'não paga'}!")
-                st.rerun()
-        
+            # Botão para registrar pagamento (abre o formulário abaixo)
+            st.button("Registrar Pagamento", use_container_width=True, key="register_payment",
+                      on_click=open_payment_form, args=(selected_invoice.get('invoice_number'),),
+                      disabled=not can(ACTION_REGISTER_PAYMENT))
+
+            # Alternar status de pagamento sem recarregar toda a página
+            st.button(
+                "Marcar como Não Paga" if selected_invoice.get('paid', False) else "Marcar como Paga",
+                use_container_width=True,
+                key="toggle_paid",
+                on_click=toggle_invoice_paid,
+                args=(selected_invoice.get('invoice_number'),),
+                disabled=not can(ACTION_REGISTER_PAYMENT)
+            )
+
         with col4:
             # Botão para editar dados da fatura
-            if st.button("Editar Dados", use_container_width=True, key="edit_invoice"):
+            if st.button("Editar Dados", use_container_width=True, key="edit_invoice",
+                         disabled=not can(ACTION_EDIT_INVOICE)):
                 st.session_state.edit_invoice_id = selected_invoice.get('invoice_number')
                 st.session_state.edit_invoice_data = selected_invoice
                 st.rerun()
         
         with col5:
             # Botão para excluir fatura
-            if st.button("Excluir Invoice", use_container_width=True, key="delete_invoice"):
+            if st.button("Excluir Invoice", use_container_width=True, key="delete_invoice",
+                         disabled=not can(ACTION_DELETE_INVOICE)):
                 # Confirmar exclusão
                 st.warning(f"Tem certeza que deseja excluir a fatura {selected_invoice.get('invoice_number')}?")
                 
@@ -321,6 +270,8 @@ else:
                         # Encontrar e remover a fatura da lista
                         st.session_state.invoices = [inv for inv in st.session_state.invoices 
                                                    if inv.get('invoice_number') != selected_invoice.get('invoice_number')]
+                        log_event(ACTION_INVOICE_DELETED, selected_invoice.get('invoice_number'),
+                                  partner=selected_invoice.get('partner'), total_amount=selected_invoice.get('total_amount'))
                         st.success(f"Fatura {selected_invoice.get('invoice_number')} excluída com sucesso!")
                         st.rerun()
                 
@@ -328,6 +279,38 @@ else:
                     if st.button("Cancelar", key="cancel_delete"):
                         st.rerun()
         
+        # Formulário de pagamento (ativo apenas quando registrar pagamento é clicado)
+        if st.session_state.get('payment_form_invoice') == selected_invoice.get('invoice_number'):
+            st.markdown("#### Registrar Pagamento")
+
+            with st.form("payment_form"):
+                st.number_input(
+                    f"Valor Recebido ({selected_invoice.get('currency', 'USD')})",
+                    min_value=0.0,
+                    max_value=float(selected_invoice.get('total_amount', 0)),
+                    value=0.0,
+                    key="payment_form_amount"
+                )
+
+                st.date_input(
+                    "Data do Recebimento",
+                    value=datetime.now(),
+                    key="payment_form_date"
+                )
+
+                st.number_input(
+                    "Variação Cambial (+ ou -)",
+                    value=0.0,
+                    key="payment_form_variation"
+                )
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.form_submit_button("Confirmar Pagamento", on_click=submit_payment_form,
+                                          args=(selected_invoice.get('invoice_number'),))
+                with col2:
+                    st.form_submit_button("Cancelar", on_click=close_payment_form)
+
         # Formulário de edição de fatura (ativo apenas quando editar é clicado)
         if 'edit_invoice_id' in st.session_state and st.session_state.edit_invoice_id:
             st.markdown("#### Editar Fatura")
@@ -354,11 +337,17 @@ else:
                     # Atualizar a fatura na lista de sessão
                     for inv in st.session_state.invoices:
                         if inv.get('invoice_number') == edit_data.get('invoice_number'):
+                            changes = {field: {'de': inv.get(field), 'para': value} for field, value in [
+                                ('partner', partner), ('country', country), ('total_amount', total_amount),
+                                ('amount_usd', amount_usd), ('currency', currency)] if inv.get(field) != value}
+                            if changes:
+                                log_event(ACTION_INVOICE_EDITED, inv.get('invoice_number'), changes=changes)
                             inv['partner'] = partner
                             inv['country'] = country
                             inv['total_amount'] = total_amount
                             inv['amount_usd'] = amount_usd
                             inv['currency'] = currency
+                            aging_index.update(inv)
                     
                     # Limpar estado de edição
                     st.session_state.edit_invoice_id = None
@@ -373,6 +362,47 @@ else:
                     st.session_state.edit_invoice_data = None
                     st.rerun()
 
+        # Histórico de alterações da fatura (log de auditoria)
+        with st.expander("Histórico de Alterações"):
+            invoice_events = query_events(invoice_number=selected_invoice.get('invoice_number'), limit=50)
+            if invoice_events:
+                st.dataframe(pd.DataFrame(events_frame(invoice_events)), use_container_width=True, hide_index=True)
+            else:
+                st.info("Nenhuma alteração registrada para esta fatura.")
+
+    # Registro de pagamentos em lote
+    st.markdown('<div class="sub-header">Registro de Pagamentos em Lote</div>', unsafe_allow_html=True)
+
+    with st.expander("Importar lote de pagamentos (CSV ou Excel)"):
+        st.markdown("O arquivo deve conter as colunas **invoice_number**, **amount** e **date**; "
+                    "**exchange_variation** é opcional.")
+
+        batch_file = st.file_uploader("Selecione o arquivo de pagamentos", type=["csv", "xlsx", "xls"],
+                                      key=f"payment_batch_file_{st.session_state.get('payment_batch_upload', 0)}")
+
+        if batch_file is not None:
+            batch_hash = hashlib.sha256(batch_file.getvalue()).hexdigest()
+            batch_df, batch_valid, batch_message = parse_payment_batch(batch_file)
+
+            if batch_df is not None:
+                st.dataframe(batch_df.head(100), use_container_width=True, hide_index=True)
+
+            if batch_valid:
+                st.success(batch_message)
+                st.button("Registrar Pagamentos do Lote", key="apply_payment_batch",
+                          on_click=apply_payment_batch, args=(batch_df, batch_hash),
+                          disabled=not can(ACTION_REGISTER_PAYMENT)
+                          or batch_hash in st.session_state.get('posted_payment_batches', set()))
+            else:
+                st.error(batch_message)
+
+        batch_errors = st.session_state.get('payment_batch_errors')
+        if batch_errors:
+            st.error("Nenhum pagamento foi registrado. Corrija as linhas abaixo e importe novamente.")
+            st.dataframe(pd.DataFrame(batch_errors).rename(columns={
+                'row': 'Linha', 'invoice_number': 'Fatura #', 'error': 'Erro'
+            }), use_container_width=True, hide_index=True)
+
     # Seção para navegação
     st.markdown("---")
     st.markdown("#### Navegação")
@@ -0,0 +1,21 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.email_templates import render_invoice_email  # noqa: E402
+
+def test_render_invoice_email_localizes_month_money_and_dates():
+    invoice = {'invoice_number': 'F1', 'partner': 'P', 'country': 'Brazil', 'month': 1, 'year': 2024,
+               'month_name': 'January', 'currency': 'BRL', 'total_amount': 1234.5,
+               'created_at': datetime(2024, 2, 1)}
+
+    portuguese = render_invoice_email(invoice, language='pt')
+    assert portuguese['subject'] == "Fatura F1 - janeiro de 2024"
+    assert "BRL 1.234,50" in portuguese['body']
+    assert "02/03/2024" in portuguese['body']
+
+    english = render_invoice_email(invoice, language='en')
+    assert english['subject'] == "Invoice F1 - January 2024"
+    assert "BRL 1,234.50" in english['body']
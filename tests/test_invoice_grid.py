@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.invoice_grid import sort_records  # noqa: E402
+
+def test_sort_records_puts_missing_values_last_in_both_orders():
+    records = [{'v': 2}, {'v': None}, {'v': 5}, {'v': None}]
+    key = lambda record: record['v']
+
+    assert [r['v'] for r in sort_records(records, key, ascending=True)] == [2, 5, None, None]
+    assert [r['v'] for r in sort_records(records, key, ascending=False)] == [5, 2, None, None]
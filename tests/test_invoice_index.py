@@ -0,0 +1,42 @@
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.invoice_index import InvoiceAgingIndex  # noqa: E402
+
+TODAY = date(2024, 6, 1)
+
+def _invoice(number, days, paid=False):
+    return {'invoice_number': number, 'country': 'Brazil', 'partner': 'Partner',
+            'created_at': datetime(2024, 1, 1) + timedelta(days=days), 'paid': paid}
+
+def test_sync_with_new_and_replaced_invoices_keeps_order_unique():
+    # Regressão: faturas novas e objetos substituídos na mesma sincronização
+    # deixavam chaves antigas em _due_order e filter() duplicava faturas
+    rng = random.Random(7)
+    invoices = [_invoice(f"INV-{i:03d}", rng.randint(0, 300)) for i in range(8)]
+    index = InvoiceAgingIndex(invoices, today=TODAY)
+
+    for round_number in range(300):
+        invoices = [dict(inv, created_at=inv['created_at'] + timedelta(days=rng.randint(-20, 20)))
+                    if rng.random() < 0.5 else inv for inv in invoices]
+        invoices += [_invoice(f"NEW-{round_number:03d}-{i}", rng.randint(0, 300)) for i in range(4)]
+        invoices = rng.sample(invoices, min(len(invoices), 12))
+        index.sync(invoices)
+
+        numbers = [inv['invoice_number'] for inv in index.filter()]
+        assert len(numbers) == len(set(numbers)) == len(invoices)
+        assert sorted(numbers) == sorted(inv['invoice_number'] for inv in invoices)
+        assert index._due_order == sorted(index._due_order)
+
+def test_sync_reclassifies_paid_toggle():
+    invoice = _invoice("INV-001", 0)
+    index = InvoiceAgingIndex([invoice], today=TODAY)
+    invoice['paid'] = True
+    index.sync([invoice, _invoice("INV-002", 200)])
+
+    assert index.status_counts() == {'Liquidada': 1, 'A Vencer': 1}
+    assert [inv['invoice_number'] for inv in index.filter()] == ["INV-001", "INV-002"]
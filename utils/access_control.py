@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.auth import get_user_role
+from utils.permissions import ROLE_ADMIN
 
 def check_access(allowed_roles):
     """
@@ -17,10 +17,11 @@ def check_access(allowed_roles):
     user_role = st.session_state.user_role
     
     # Se for admin, tem acesso a tudo
-    if user_role == "admin":
+    if user_role == ROLE_ADMIN:
         return True
     
     # Caso contrário, verifica se o papel do usuário está na lista de permitidos
+    # (para páginas e ações registradas, prefira utils.permissions.can)
     return user_role in allowed_roles
 
 def show_access_denied():
@@ -0,0 +1,264 @@
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+import streamlit as st
+
+# Diretório dos segmentos do log de auditoria (arquivos JSONL somente de acréscimo)
+AUDIT_DIR = "data/audit"
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl"
+
+# Tamanho máximo de um segmento antes de iniciar o próximo
+SEGMENT_MAX_BYTES = 5 * 1024 * 1024
+
+# Intervalo máximo (s) entre gravações e tamanho máximo de um lote
+FLUSH_INTERVAL = 1.0
+MAX_BATCH = 500
+
+# Ações registradas
+ACTION_PAYMENT_REGISTERED = "payment.registered"
+ACTION_PAYMENT_BATCH = "payment.batch_registered"
+ACTION_PAYMENT_RECONCILED = "payment.reconciled"
+ACTION_INVOICE_PAID_TOGGLED = "invoice.paid_toggled"
+ACTION_INVOICE_EDITED = "invoice.edited"
+ACTION_INVOICE_DELETED = "invoice.deleted"
+ACTION_INVOICE_SENT = "invoice.sent"
+ACTION_INVOICE_SEND_FAILED = "invoice.send_failed"
+ACTION_SETTINGS_SAVED = "settings.country_saved"
+ACTION_STORE_OVERRIDES_SAVED = "settings.store_overrides_saved"
+ACTION_EMAIL_SETTINGS_SAVED = "settings.email_saved"
+ACTION_DATA_RESET = "data.reset"
+
+_SEGMENT_PATTERN = re.compile(rf"^{SEGMENT_PREFIX}(\d+){re.escape(SEGMENT_SUFFIX)}$")
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+def _json_default(value):
+    # Datas, Timestamps do pandas e tipos numpy
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+class AuditLog:
+    """
+    Grava eventos de auditoria em segundo plano e mantém índices por fatura e por usuário
+
+    log() apenas coloca o evento em uma fila; uma thread grava os eventos
+    em lotes (um fsync por lote), de modo que a interface nunca espera pelo disco.
+    """
+
+    def __init__(self, directory=AUDIT_DIR):
+        self.directory = directory
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._by_invoice = defaultdict(list)
+        self._by_user = defaultdict(list)
+        self._all = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._segment_number = self._build_index()
+
+        self._thread = threading.Thread(target=self._writer, name="audit-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _index(self, event, location):
+        self._all.append(location)
+        if event.get('invoice_number'):
+            self._by_invoice[str(event['invoice_number'])].append(location)
+        if event.get('user'):
+            self._by_user[event['user']].append(location)
+
+    def _build_index(self):
+        """
+        Percorre os segmentos existentes uma vez e retorna o número do segmento atual
+        """
+        numbers = self._segments()
+        for number in numbers:
+            path = os.path.join(self.directory, _segment_name(number))
+            with open(path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Linha incompleta (interrupção durante a gravação)
+                        event = None
+                    if isinstance(event, dict):
+                        self._index(event, (number, offset))
+                    offset += len(line)
+        return numbers[-1] if numbers else 1
+
+    def log(self, action, invoice_number=None, user=None, **details):
+        """
+        Registra um evento (não bloqueia)
+
+        Parâmetros:
+        - action: Ação executada (constantes ACTION_*)
+        - invoice_number: Fatura afetada, se houver
+        - user: Usuário responsável
+        - details: Dados adicionais do evento
+        """
+        event = {'timestamp': datetime.now().isoformat(timespec='milliseconds'), 'action': action, 'user': user}
+        if invoice_number is not None:
+            event['invoice_number'] = str(invoice_number)
+        if details:
+            event['details'] = details
+        self._queue.put(event)
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        path = os.path.join(self.directory, _segment_name(self._segment_number))
+        if os.path.exists(path) and os.path.getsize(path) >= SEGMENT_MAX_BYTES:
+            self._segment_number += 1
+            path = os.path.join(self.directory, _segment_name(self._segment_number))
+
+        lines = [(event, (json.dumps(event, ensure_ascii=False, default=_json_default) + "\n").encode('utf-8'))
+                 for event in batch]
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(b"".join(line for _, line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._lock:
+            for event, line in lines:
+                self._index(event, (self._segment_number, offset))
+                offset += len(line)
+
+    def _writer(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+
+            batch = self._drain(first)
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                print(f"Erro ao gravar o log de auditoria: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """
+        Aguarda a gravação de todos os eventos pendentes
+        """
+        self._queue.join()
+
+    def _read(self, locations):
+        events = []
+        handles = {}
+        try:
+            for number, offset in locations:
+                handle = handles.get(number)
+                if handle is None:
+                    handle = handles[number] = open(os.path.join(self.directory, _segment_name(number)), 'rb')
+                handle.seek(offset)
+                events.append(json.loads(handle.readline()))
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return events
+
+    def query(self, invoice_number=None, user=None, action=None, limit=100):
+        """
+        Consulta os eventos mais recentes usando os índices por fatura e por usuário
+
+        Parâmetros:
+        - invoice_number: Filtra pela fatura
+        - user: Filtra pelo usuário
+        - action: Filtra pela ação (prefixos como "payment." também são aceitos)
+        - limit: Quantidade máxima de eventos
+
+        Retorna:
+        - list: Eventos do mais recente para o mais antigo
+        """
+        with self._lock:
+            if invoice_number is not None:
+                locations = list(self._by_invoice.get(str(invoice_number), []))
+                if user is not None:
+                    user_locations = set(self._by_user.get(user, []))
+                    locations = [location for location in locations if location in user_locations]
+            elif user is not None:
+                locations = list(self._by_user.get(user, []))
+            else:
+                locations = list(self._all)
+
+        events = []
+        # Lê de trás para frente em blocos até atingir o limite
+        position = len(locations)
+        while position > 0 and len(events) < limit:
+            chunk = locations[max(0, position - limit):position]
+            position -= len(chunk)
+            for event in reversed(self._read(chunk)):
+                if action is None or event.get('action') == action or (
+                        action.endswith('.') and event.get('action', '').startswith(action)):
+                    events.append(event)
+                    if len(events) >= limit:
+                        break
+        return events
+
+@st.cache_resource(show_spinner=False)
+def get_audit_log():
+    """
+    Retorna o log de auditoria compartilhado pelo processo
+    """
+    return AuditLog()
+
+def log_event(action, invoice_number=None, **details):
+    """
+    Registra um evento de auditoria para o usuário da sessão (não bloqueia)
+
+    Parâmetros:
+    - action: Ação executada (constantes ACTION_*)
+    - invoice_number: Fatura afetada, se houver
+    - details: Dados adicionais do evento
+    """
+    get_audit_log().log(action, invoice_number=invoice_number,
+                        user=st.session_state.get('username') or None, **details)
+
+def query_events(invoice_number=None, user=None, action=None, limit=100):
+    """
+    Consulta o log de auditoria (ver AuditLog.query)
+    """
+    return get_audit_log().query(invoice_number=invoice_number, user=user, action=action, limit=limit)
+
+def events_frame(events):
+    """
+    Converte eventos em linhas para exibição em tabela
+    """
+    return [{
+        'Data': event.get('timestamp', '').replace('T', ' ')[:19],
+        'Usuário': event.get('user') or '—',
+        'Ação': event.get('action'),
+        'Fatura': event.get('invoice_number') or '—',
+        'Detalhes': json.dumps(event.get('details', {}), ensure_ascii=False) if event.get('details') else ''
+    } for event in events]
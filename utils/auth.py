@@ -1,102 +1,120 @@
 import streamlit as st
-import hashlib
-import json
-import os
 
-# Arquivo para armazenar credenciais
-USERS_FILE = "data/users.json"
+from utils.config_store import create_json
+from utils.session_tokens import QUERY_PARAM, issue_token, verify_token
+from utils.user_directory import USERS_FILE, get_user_directory, hash_password
 
 def ensure_users_file_exists():
     """
     Garante que o arquivo de usuários existe
     """
-    if not os.path.exists("data"):
-        os.makedirs("data")
-    
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'w') as f:
-            json.dump({
-                "Nickolas Silva": {
-                    "password": hash_password("Nick230420"),
-                    "role": "admin",
-                    "full_name": "Nickolas Silva"
-                },
-                "Ivan Bonilla": {
-                    "password": hash_password("ivan123"),
-                    "role": "gestor",
-                    "full_name": "Ivan Bonilla"
-                },
-                "Diego Gonçalves": {
-                    "password": hash_password("diego123"),
-                    "role": "admin",
-                    "full_name": "Diego Gonçalves"
-                },
-                "Luan Mendonça": {
-                    "password": hash_password("luan123"),
-                    "role": "gestor",
-                    "full_name": "Luan Mendonça"
-                },
-                "Luca Giaffone": {
-                    "password": hash_password("palmeiras"),
-                    "role": "gestor",
-                    "full_name": "Luca Giaffone"
-                },
-                "Igor Nakaoka": {
-                    "password": hash_password("igor123"),
-                    "role": "configuracao",
-                    "full_name": "Igor Nakaoka"
-                }
-            }, f)
-
-def hash_password(password):
-    """
-    Cria um hash da senha fornecida
-    """
-    return hashlib.sha256(password.encode()).hexdigest()
+    create_json(USERS_FILE, lambda: {
+        "Nickolas Silva": {
+            "password": hash_password("Nick230420"),
+            "role": "admin",
+            "full_name": "Nickolas Silva"
+        },
+        "Ivan Bonilla": {
+            "password": hash_password("ivan123"),
+            "role": "gestor",
+            "full_name": "Ivan Bonilla"
+        },
+        "Diego Gonçalves": {
+            "password": hash_password("diego123"),
+            "role": "admin",
+            "full_name": "Diego Gonçalves"
+        },
+        "Luan Mendonça": {
+            "password": hash_password("luan123"),
+            "role": "gestor",
+            "full_name": "Luan Mendonça"
+        },
+        "Luca Giaffone": {
+            "password": hash_password("palmeiras"),
+            "role": "gestor",
+            "full_name": "Luca Giaffone"
+        },
+        "Igor Nakaoka": {
+            "password": hash_password("igor123"),
+            "role": "configuracao",
+            "full_name": "Igor Nakaoka"
+        }
+    })
 
 def check_password(username, password):
     """
     Verifica se o nome de usuário e senha correspondem
     """
     ensure_users_file_exists()
-    
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    
-    if username not in users:
-        return False
-    
-    user_data = users[username]
-    stored_password = user_data["password"]
-    return stored_password == hash_password(password)
+    return get_user_directory().authenticate(username, password)
 
 def get_user_role(username):
     """
     Retorna o papel (role) do usuário
     """
-    ensure_users_file_exists()
-    
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    
-    if username not in users:
+    user = get_user_directory().get(username)
+    if user is None:
         return None
     
-    return users[username].get("role", "user")
+    return user.get("role", "user")
 
 def get_user_fullname(username):
     """
     Retorna o nome completo do usuário
     """
-    ensure_users_file_exists()
-    
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    
-    if username not in users:
+    user = get_user_directory().get(username)
+    if user is None:
         return username
     
-    return users[username].get("full_name", username)
+    return user.get("full_name", username)
+
+def _start_session(username):
+    """
+    Preenche a sessão do usuário autenticado e publica o token assinado na URL
+    """
+    directory = get_user_directory()
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    st.session_state.user_role = get_user_role(username)
+    st.session_state.full_name = get_user_fullname(username)
+    st.session_state.session_token = issue_token(username, st.session_state.user_role,
+                                                 directory.session_stamp(username))
+    st.query_params[QUERY_PARAM] = st.session_state.session_token
+
+def _restore_session():
+    """
+    Restaura a sessão a partir do token da URL (ex.: após recarregar a página ou reconectar)
+
+    Retorna:
+    - bool: True se o token era válido e a senha do usuário não mudou
+    """
+    token = st.query_params.get(QUERY_PARAM)
+    if not token:
+        return False
+
+    claims = verify_token(token)
+    if claims is None or not get_user_directory().verify_session(claims['username'], claims['stamp']):
+        del st.query_params[QUERY_PARAM]
+        return False
+
+    st.session_state.logged_in = True
+    st.session_state.username = claims['username']
+    st.session_state.user_role = get_user_role(claims['username'])
+    st.session_state.full_name = get_user_fullname(claims['username'])
+    st.session_state.session_token = token
+    return True
+
+def _end_session(revoke=False):
+    """
+    Encerra a sessão local; com revoke=True o token emitido também deixa de valer no servidor
+    """
+    if revoke and st.session_state.get('username'):
+        get_user_directory().revoke_sessions(st.session_state.username)
+    st.session_state.logged_in = False
+    st.session_state.username = ""
+    st.session_state.session_token = None
+    if QUERY_PARAM in st.query_params:
+        del st.query_params[QUERY_PARAM]
 
 def login_required():
     """
@@ -108,13 +126,22 @@ def login_required():
         st.session_state.username = ""
         st.session_state.user_role = ""
         st.session_state.full_name = ""
+        st.session_state.session_token = None
+        _restore_session()
+    
+    # A cada execução são conferidas a assinatura, a validade e a marca do token (tudo em memória)
+    if st.session_state.logged_in and st.session_state.get('session_token'):
+        claims = verify_token(st.session_state.session_token)
+        if (claims is None or claims['username'] != st.session_state.username
+                or not get_user_directory().verify_session(claims['username'], claims['stamp'])):
+            _end_session()
+        elif st.query_params.get(QUERY_PARAM) != st.session_state.session_token:
+            # A navegação entre páginas remove os parâmetros da URL
+            st.query_params[QUERY_PARAM] = st.session_state.session_token
         
-    # Carrega o CSS personalizado
-    try:
-        with open('assets/style.css') as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    except:
-        pass
+    # Aplica o CSS personalizado (carregado e minificado uma única vez por processo)
+    from assets.static_bundle import apply_theme
+    apply_theme()
     
     # Se não estiver logado, mostra tela de login
     if not st.session_state.logged_in:
@@ -141,10 +168,7 @@ def login_required():
                 if submitted:
                     if check_password(username, password):
                         # Armazena informações do usuário na sessão
-                        st.session_state.logged_in = True
-                        st.session_state.username = username
-                        st.session_state.user_role = get_user_role(username)
-                        st.session_state.full_name = get_user_fullname(username)
+                        _start_session(username)
                         st.success(f"Login bem-sucedido! Bem-vindo, {st.session_state.full_name}.")
                         st.rerun()
                     else:
@@ -173,8 +197,7 @@ def login_required():
 
 def logout():
     """
-    Realiza o logout do usuário
+    Realiza o logout do usuário e revoga o token de sessão emitido
     """
-    st.session_state.logged_in = False
-    st.session_state.username = ""
+    _end_session(revoke=True)
     st.rerun()
\ No newline at end of file
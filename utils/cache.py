@@ -0,0 +1,124 @@
+import hashlib
+import os
+from collections import defaultdict
+from datetime import timedelta
+
+import streamlit as st
+
+# Namespaces de cache (cada um pode ser invalidado separadamente)
+SETTINGS_NAMESPACE = "country_settings"
+EXCHANGE_RATE_NAMESPACE = "exchange_rates"
+REPORTS_NAMESPACE = "reports"
+ASSETS_NAMESPACE = "assets"
+USERS_NAMESPACE = "users"
+CONFIG_NAMESPACE = "config_files"
+
+# Tempo de vida padrão de cada namespace (None = até ser invalidado)
+DEFAULT_TTLS = {
+    SETTINGS_NAMESPACE: None,
+    EXCHANGE_RATE_NAMESPACE: timedelta(hours=1),
+    REPORTS_NAMESPACE: timedelta(minutes=10),
+    ASSETS_NAMESPACE: None,
+    USERS_NAMESPACE: None,
+    CONFIG_NAMESPACE: None,
+}
+
+# Funções de limpeza registradas por namespace
+_INVALIDATION_HOOKS = defaultdict(list)
+
+def cached_data(namespace, ttl="default", max_entries=None):
+    """
+    Decorador: cache de dados compartilhado entre sessões (st.cache_data)
+
+    O resultado é copiado a cada chamada, então pode ser alterado por quem
+    chama. Parâmetros com nome iniciado por "_" não entram na chave; nesse
+    caso a função deve receber uma chave explícita (ex.: fingerprint).
+
+    Parâmetros:
+    - namespace: Namespace usado por invalidate
+    - ttl: Tempo de vida (padrão do namespace em DEFAULT_TTLS)
+    - max_entries: Quantidade máxima de entradas
+    """
+    def decorator(func):
+        lifetime = DEFAULT_TTLS.get(namespace) if ttl == "default" else ttl
+        cached = st.cache_data(ttl=lifetime, max_entries=max_entries, show_spinner=False)(func)
+        _INVALIDATION_HOOKS[namespace].append(cached.clear)
+        return cached
+    return decorator
+
+def cached_resource(namespace, ttl=None, max_entries=None):
+    """
+    Decorador: recurso único por processo (st.cache_resource), como pools de conexão e templates
+
+    O objeto retornado é compartilhado (não é copiado) e deve ser seguro
+    para uso concorrente.
+
+    Parâmetros:
+    - namespace: Namespace usado por invalidate
+    - ttl: Tempo de vida (None = até ser invalidado)
+    - max_entries: Quantidade máxima de entradas
+    """
+    def decorator(func):
+        cached = st.cache_resource(ttl=ttl, max_entries=max_entries, show_spinner=False)(func)
+        _INVALIDATION_HOOKS[namespace].append(cached.clear)
+        return cached
+    return decorator
+
+def register_invalidation_hook(namespace, hook):
+    """
+    Registra uma função extra chamada quando o namespace é invalidado
+    """
+    _INVALIDATION_HOOKS[namespace].append(hook)
+
+def invalidate(namespace):
+    """
+    Limpa todos os caches de um namespace (ex.: após salvar as configurações)
+
+    Parâmetros:
+    - namespace: Namespace a invalidar
+    """
+    for hook in _INVALIDATION_HOOKS.get(namespace, []):
+        hook()
+
+def invalidate_all():
+    """
+    Limpa todos os caches registrados
+    """
+    for namespace in list(_INVALIDATION_HOOKS):
+        invalidate(namespace)
+
+def file_version(path):
+    """
+    Versão de um arquivo para compor chaves de cache (data de modificação e tamanho)
+
+    Alterações feitas por outros processos mudam a versão e, portanto, a chave.
+
+    Retorna:
+    - tuple ou None se o arquivo não existir
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def fingerprint(records, fields=None):
+    """
+    Gera uma chave estável para uma lista de dicionários (ex.: faturas)
+
+    Parâmetros:
+    - records: Lista de dicionários
+    - fields: Campos considerados (None para todos)
+
+    Retorna:
+    - str: Hash hexadecimal
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        if fields is None:
+            items = record.items()
+        else:
+            items = ((field, record.get(field)) for field in fields)
+        digest.update(repr(tuple(items)).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
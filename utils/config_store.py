@@ -0,0 +1,195 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from utils.cache import CONFIG_NAMESPACE, cached_data, file_version
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows: apenas o bloqueio entre threads do mesmo processo
+    FCNTL_AVAILABLE = False
+
+# Sufixos dos arquivos auxiliares de cada arquivo de configuração
+LOCK_SUFFIX = ".lock"
+VERSION_SUFFIX = ".version"
+BACKUP_SUFFIX = ".bak"
+
+# Bloqueios entre threads do mesmo processo (o flock cobre os demais processos)
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+class ConfigStoreError(ValueError):
+    """
+    Arquivo de configuração ilegível e sem cópia de segurança válida
+    """
+
+class ConfigConflictError(RuntimeError):
+    """
+    O arquivo foi alterado por outra sessão depois da versão lida
+    """
+
+def _thread_lock(path):
+    with _THREAD_LOCKS_GUARD:
+        return _THREAD_LOCKS.setdefault(os.path.abspath(path), threading.RLock())
+
+@contextmanager
+def locked(path):
+    """
+    Bloqueio exclusivo de um arquivo de configuração (entre threads e processos)
+
+    O bloqueio é consultivo (fcntl.flock) e feito em um arquivo auxiliar
+    "<arquivo>.lock", que não é substituído durante as gravações.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with _thread_lock(path):
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+
+        with open(path + LOCK_SUFFIX, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _atomic_write(path, content):
+    """
+    Grava o conteúdo em um arquivo temporário no mesmo diretório e o move com os.replace
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def read_version(path):
+    """
+    Retorna a versão de um arquivo de configuração (incrementada a cada gravação)
+
+    Retorna:
+    - int: Versão (0 se o arquivo nunca foi gravado pelo config_store)
+    """
+    try:
+        with open(path + VERSION_SUFFIX, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def _parse(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@cached_data(CONFIG_NAMESPACE, max_entries=32)
+def _read_cached(path, version, stat):
+    try:
+        return _parse(path)
+    except json.JSONDecodeError as e:
+        # Arquivo corrompido (ex.: gravado por outro programa): usa a última cópia válida
+        try:
+            return _parse(path + BACKUP_SUFFIX)
+        except (OSError, json.JSONDecodeError):
+            raise ConfigStoreError(f"Arquivo de configuração inválido: {path} ({e})") from e
+
+def read_json(path, default=None):
+    """
+    Lê um arquivo de configuração JSON
+
+    O conteúdo é analisado uma vez por versão (número de versão, data de
+    modificação e tamanho); leituras seguintes vêm do cache. O resultado é
+    uma cópia e pode ser alterado livremente.
+
+    Parâmetros:
+    - path: Caminho do arquivo
+    - default: Valor retornado se o arquivo não existir
+
+    Retorna:
+    - Conteúdo do arquivo ou default
+    """
+    stat = file_version(path)
+    if stat is None:
+        return default
+    return _read_cached(path, read_version(path), stat)
+
+def _write_locked(path, data, indent):
+    version = read_version(path) + 1
+    content = json.dumps(data, indent=indent, ensure_ascii=False)
+
+    if os.path.exists(path):
+        shutil.copyfile(path, path + BACKUP_SUFFIX)
+    _atomic_write(path, content)
+    _atomic_write(path + VERSION_SUFFIX, str(version))
+    return version
+
+def write_json(path, data, indent=4, expected_version=None):
+    """
+    Grava um arquivo de configuração JSON de forma atômica
+
+    O arquivo nunca fica truncado: o conteúdo é gravado em um temporário
+    e substituído com os.replace, sob bloqueio exclusivo. A versão anterior
+    é mantida em "<arquivo>.bak".
+
+    Parâmetros:
+    - path: Caminho do arquivo
+    - data: Conteúdo serializável em JSON
+    - indent: Indentação do JSON
+    - expected_version: Se informada, a gravação falha com ConfigConflictError
+      caso outra sessão tenha gravado uma versão diferente
+
+    Retorna:
+    - int: Nova versão do arquivo
+    """
+    with locked(path):
+        if expected_version is not None and read_version(path) != expected_version:
+            raise ConfigConflictError(f"{path} foi alterado por outra sessão.")
+        return _write_locked(path, data, indent)
+
+def update_json(path, updater, default=None, indent=4):
+    """
+    Lê, altera e grava um arquivo de configuração sob o mesmo bloqueio
+
+    Parâmetros:
+    - path: Caminho do arquivo
+    - updater: Função que recebe o conteúdo atual e retorna o novo
+    - default: Conteúdo usado se o arquivo não existir
+
+    Retorna:
+    - Novo conteúdo gravado
+    """
+    with locked(path):
+        current = read_json(path, default)
+        updated = updater(current)
+        _write_locked(path, updated, indent)
+        return updated
+
+def create_json(path, factory, indent=4):
+    """
+    Cria o arquivo com o conteúdo de factory() se ele ainda não existir
+
+    Retorna:
+    - bool: True se o arquivo foi criado
+    """
+    if os.path.exists(path):
+        return False
+    with locked(path):
+        if os.path.exists(path):
+            return False
+        _write_locked(path, factory(), indent)
+        return True
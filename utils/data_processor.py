@@ -3,6 +3,10 @@ import json
 import os
 import streamlit as st
 from datetime import datetime
+from utils.money import to_minor, from_minor, apply_rate, convert_minor
+from utils.config_store import create_json, read_json, read_version, write_json
+from utils.readers import read_payment_file
+from utils.rate_table import RATE_COLUMNS, compile_rate_table, resolve_rates
 
 # Arquivo para armazenar configurações do país
 COUNTRY_SETTINGS_FILE = "data/country_settings.json"
@@ -18,252 +22,247 @@ def load_country_settings():
     """
     Carrega as configurações dos países do arquivo JSON
     """
-    ensure_data_dir()
+    # Configurações padrão, gravadas na primeira execução
+    create_json(COUNTRY_SETTINGS_FILE, _default_country_settings)
     
-    if not os.path.exists(COUNTRY_SETTINGS_FILE):
-        # Configurações padrão
-        default_settings = {
-            "Brazil": {
-                "royalty_rate": 8.0,
-                "ad_fund_rate": 2.0,
-                "tax_rate": 15.0,
-                "currency": "BRL",
-                "exchange_rate": 5.0,
-                "stores": {
-                    "default": {
-                        "royalty_rate": 8.0,
-                        "ad_fund_rate": 2.0
-                    }
+    # Leitura em cache compartilhado, renovada quando o arquivo muda
+    return read_json(COUNTRY_SETTINGS_FILE, {})
+
+def _default_country_settings():
+    return {
+        "Brazil": {
+            "royalty_rate": 8.0,
+            "ad_fund_rate": 2.0,
+            "tax_rate": 15.0,
+            "currency": "BRL",
+            "exchange_rate": 5.0,
+            "stores": {
+                "default": {
+                    "royalty_rate": 8.0,
+                    "ad_fund_rate": 2.0
                 }
-            },
-            "USA": {
-                "royalty_rate": 6.0,
-                "ad_fund_rate": 1.5,
-                "tax_rate": 0.0,
-                "currency": "USD",
-                "exchange_rate": 1.0,
-                "stores": {
-                    "default": {
-                        "royalty_rate": 6.0,
-                        "ad_fund_rate": 1.5
-                    }
+            }
+        },
+        "USA": {
+            "royalty_rate": 6.0,
+            "ad_fund_rate": 1.5,
+            "tax_rate": 0.0,
+            "currency": "USD",
+            "exchange_rate": 1.0,
+            "stores": {
+                "default": {
+                    "royalty_rate": 6.0,
+                    "ad_fund_rate": 1.5
                 }
-            },
-            "Mexico": {
-                "royalty_rate": 7.0,
-                "ad_fund_rate": 2.0,
-                "tax_rate": 16.0,
-                "currency": "MXN",
-                "exchange_rate": 17.5,
-                "stores": {
-                    "default": {
-                        "royalty_rate": 7.0,
-                        "ad_fund_rate": 2.0
-                    }
+            }
+        },
+        "Mexico": {
+            "royalty_rate": 7.0,
+            "ad_fund_rate": 2.0,
+            "tax_rate": 16.0,
+            "currency": "MXN",
+            "exchange_rate": 17.5,
+            "stores": {
+                "default": {
+                    "royalty_rate": 7.0,
+                    "ad_fund_rate": 2.0
                 }
             }
         }
-        
-        with open(COUNTRY_SETTINGS_FILE, 'w') as f:
-            json.dump(default_settings, f, indent=4)
-        
-        return default_settings
-    
-    try:
-        with open(COUNTRY_SETTINGS_FILE, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        # Em caso de erro no arquivo, retornar configurações padrão
-        return {}
+    }
 
-def save_country_settings(settings):
+def country_settings_version():
     """
-    Salva as configurações dos países no arquivo JSON
+    Retorna a versão gravada do arquivo de configurações dos países
+    """
+    return read_version(COUNTRY_SETTINGS_FILE)
+
+def save_country_settings(settings, expected_version=None):
     """
-    ensure_data_dir()
+    Salva as configurações dos países no arquivo JSON
+    
+    Parâmetros:
+    - settings: Configurações dos países
+    - expected_version: Versão lida antes da edição; se outra sessão gravou
+      depois dela a gravação falha com ConfigConflictError
     
-    with open(COUNTRY_SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f, indent=4)
+    Retorna:
+    - int: Nova versão do arquivo
+    """
+    return write_json(COUNTRY_SETTINGS_FILE, settings, expected_version=expected_version)
 
 def validate_data(df):
     """
     Valida os dados importados
     
+    Mantida por compatibilidade: utiliza utils.validation.validate_sales_data
+    e converte a coluna Date do DataFrame recebido.
+    
     Retorna:
     - (bool, str): (é_válido, mensagem_de_erro)
     """
-    # Verificar colunas obrigatórias
-    required_columns = ['Date', 'Country', 'Partner', 'Store', 'Sales']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        return False, f"Colunas obrigatórias ausentes: {', '.join(missing_columns)}"
-    
-    # Verificar tipos de dados
-    try:
-        # Converter coluna de data
-        df['Date'] = pd.to_datetime(df['Date'])
-    except:
-        return False, "Formato de data inválido. Utilize o formato YYYY-MM-DD."
-    
-    # Verificar valores numéricos para vendas
-    if not pd.to_numeric(df['Sales'], errors='coerce').notnull().all():
-        return False, "Valores de vendas inválidos. Utilize apenas valores numéricos."
+    from utils.validation import validate_sales_data, summarize_errors
     
-    # Validar países
-    country_settings = load_country_settings()
-    unknown_countries = set(df['Country']) - set(country_settings.keys())
+    coerced, errors = validate_sales_data(df)
     
-    if unknown_countries:
-        return False, f"Países desconhecidos no arquivo: {', '.join(unknown_countries)}. Configure-os primeiro na seção Configurações."
+    if not errors.empty:
+        return False, summarize_errors(errors)
     
+    df['Date'] = coerced['Date']
     return True, "Dados válidos."
 
-def process_data(df):
+def process_data(df, country_settings=None):
     """
     Processa os dados importados e calcula royalties, fundo de publicidade e impostos
     
+    Parâmetros:
+    - df: DataFrame com os dados de venda (de preferência já convertido por validate_sales_data)
+    - country_settings: Configurações dos países (padrão: carregadas do arquivo)
+    
     Retorna:
     - DataFrame com colunas calculadas adicionais
     """
     # Carregar configurações dos países
-    country_settings = load_country_settings()
+    if country_settings is None:
+        country_settings = load_country_settings()
     
     # Criar cópia do DataFrame para evitar modificar o original
     processed_df = df.copy()
     
-    # Converter colunas
-    processed_df['Date'] = pd.to_datetime(processed_df['Date'])
-    processed_df['Sales'] = pd.to_numeric(processed_df['Sales'])
+    # Converter colunas (apenas se ainda não vierem convertidas da validação)
+    if not pd.api.types.is_datetime64_any_dtype(processed_df['Date']):
+        processed_df['Date'] = pd.to_datetime(processed_df['Date'])
+    if not pd.api.types.is_numeric_dtype(processed_df['Sales']):
+        processed_df['Sales'] = pd.to_numeric(processed_df['Sales'])
     
     # Adicionar colunas de mês e ano
     processed_df['Month'] = processed_df['Date'].dt.month
     processed_df['Year'] = processed_df['Date'].dt.year
     processed_df['Month_Name'] = processed_df['Date'].dt.strftime('%B')
     
-    # Inicializar colunas de cálculos
-    processed_df['Royalty_Rate'] = 0.0
-    processed_df['Ad_Fund_Rate'] = 0.0
-    processed_df['Tax_Rate'] = 0.0
-    processed_df['Currency'] = ''
-    processed_df['Exchange_Rate'] = 0.0
-    processed_df['Royalty_Amount'] = 0.0
-    processed_df['Ad_Fund_Amount'] = 0.0
-    processed_df['Tax_Amount'] = 0.0
-    processed_df['Total_Amount'] = 0.0
-    processed_df['Amount_USD'] = 0.0
+    # Resolver as taxas vigentes na data de cada linha (país e, se configurada, loja) com uma junção as-of
+    rates = resolve_rates(processed_df['Country'], processed_df['Store'], compile_rate_table(country_settings),
+                          processed_df['Date'])
+    for col in RATE_COLUMNS:
+        processed_df[col] = rates[col]
     
-    # Processar cada linha com base no país e, se disponível, na loja específica
-    for idx, row in processed_df.iterrows():
-        country = row['Country']
-        store = row['Store']
-        
-        if country in country_settings:
-            country_config = country_settings[country]
-            
-            # Verificar se a loja específica tem configurações personalizadas
-            if 'stores' in country_config and store in country_config['stores']:
-                store_config = country_config['stores'][store]
-                royalty_rate = store_config.get('royalty_rate', country_config['royalty_rate'])
-                ad_fund_rate = store_config.get('ad_fund_rate', country_config['ad_fund_rate'])
-            else:
-                # Usar configuração padrão da loja se disponível, caso contrário usa a do país
-                if 'stores' in country_config and 'default' in country_config['stores']:
-                    default_store = country_config['stores']['default']
-                    royalty_rate = default_store.get('royalty_rate', country_config['royalty_rate'])
-                    ad_fund_rate = default_store.get('ad_fund_rate', country_config['ad_fund_rate'])
-                else:
-                    royalty_rate = country_config['royalty_rate']
-                    ad_fund_rate = country_config['ad_fund_rate']
-            
-            # Preencher dados do país
-            processed_df.at[idx, 'Royalty_Rate'] = royalty_rate
-            processed_df.at[idx, 'Ad_Fund_Rate'] = ad_fund_rate
-            processed_df.at[idx, 'Tax_Rate'] = country_config['tax_rate']
-            processed_df.at[idx, 'Currency'] = country_config['currency']
-            processed_df.at[idx, 'Exchange_Rate'] = country_config['exchange_rate']
-            
-            # Calcular valores
-            sales = row['Sales']
-            royalty_amount = sales * (royalty_rate / 100)
-            ad_fund_amount = sales * (ad_fund_rate / 100)
-            subtotal = royalty_amount + ad_fund_amount
-            tax_amount = subtotal * (country_config['tax_rate'] / 100)
-            total_amount = subtotal + tax_amount
-            amount_usd = total_amount / country_config['exchange_rate']
-            
-            # Preencher resultados dos cálculos
-            processed_df.at[idx, 'Royalty_Amount'] = royalty_amount
-            processed_df.at[idx, 'Ad_Fund_Amount'] = ad_fund_amount
-            processed_df.at[idx, 'Tax_Amount'] = tax_amount
-            processed_df.at[idx, 'Total_Amount'] = total_amount
-            processed_df.at[idx, 'Amount_USD'] = amount_usd
+    # Calcular valores em unidades menores inteiras (centavos), de forma vetorizada
+    currencies = processed_df['Currency']
+    sales_minor = to_minor(processed_df['Sales'], currencies)
+    royalty_minor = apply_rate(sales_minor, processed_df['Royalty_Rate'] / 100)
+    ad_fund_minor = apply_rate(sales_minor, processed_df['Ad_Fund_Rate'] / 100)
+    subtotal_minor = royalty_minor + ad_fund_minor
+    tax_minor = apply_rate(subtotal_minor, processed_df['Tax_Rate'] / 100)
+    total_minor = subtotal_minor + tax_minor
+    usd_minor = convert_minor(total_minor, processed_df['Exchange_Rate'], currencies, 'USD')
+    
+    processed_df['Royalty_Minor'] = royalty_minor
+    processed_df['Ad_Fund_Minor'] = ad_fund_minor
+    processed_df['Tax_Minor'] = tax_minor
+    processed_df['Total_Minor'] = total_minor
+    processed_df['USD_Minor'] = usd_minor
+    
+    # Valores decimais derivados das unidades menores (para exibição e compatibilidade)
+    processed_df['Royalty_Amount'] = from_minor(royalty_minor, currencies)
+    processed_df['Ad_Fund_Amount'] = from_minor(ad_fund_minor, currencies)
+    processed_df['Tax_Amount'] = from_minor(tax_minor, currencies)
+    processed_df['Total_Amount'] = from_minor(total_minor, currencies)
+    processed_df['Amount_USD'] = from_minor(usd_minor, 'USD')
     
     return processed_df
 
+# Colunas de agrupamento das faturas
+INVOICE_GROUP_KEYS = ['Partner', 'Country', 'Month', 'Year', 'Month_Name']
+
+def _invoice_records(invoices_frame):
+    """
+    Converte o DataFrame de totais (uma linha por fatura) em dicionários de faturas
+    """
+    created_at = datetime.now()
+    return [{
+        **record,
+        'created_at': created_at,
+        'sent': False,
+        'paid': False,
+        'payment_amount': 0,
+        'due_status': 'A Vencer'  # Status inicial
+    } for record in invoices_frame.to_dict('records')]
+
 def group_data_by_partner(df):
     """
     Agrupa dados por parceiro e mês para geração de faturas
     
+    Usa uma única agregação nomeada (groupby.agg) sobre as colunas em
+    unidades menores.
+    
     Retorna:
-    - Lista de dicionários com dados agrupados
+    - Lista de dicionários com dados agrupados (uma fatura por item)
     """
     # Garantir que as colunas necessárias existam
     if not all(col in df.columns for col in ['Partner', 'Country', 'Month', 'Year', 'Month_Name', 'Total_Amount', 'Amount_USD', 'Currency']):
         return []
     
-    # Agrupar por parceiro, país, mês e ano
-    grouped = df.groupby(['Partner', 'Country', 'Month', 'Year', 'Month_Name'])
+    # Colunas em unidades menores (dados processados antes do cálculo em centavos não as possuem)
+    minor_columns = {
+        'Royalty_Minor': 'Royalty_Amount',
+        'Ad_Fund_Minor': 'Ad_Fund_Amount',
+        'Tax_Minor': 'Tax_Amount',
+        'Total_Minor': 'Total_Amount'
+    }
+    missing_minor = [col for col in list(minor_columns) + ['USD_Minor'] if col not in df.columns]
+    if missing_minor:
+        df = df.copy()
+        for minor_col in missing_minor:
+            if minor_col == 'USD_Minor':
+                df[minor_col] = to_minor(df['Amount_USD'], 'USD')
+            else:
+                df[minor_col] = to_minor(df[minor_columns[minor_col]], df['Currency'])
     
-    invoices_data = []
+    # Agrupar por parceiro, país, mês e ano em uma única passada
+    grouped = df.groupby(INVOICE_GROUP_KEYS, sort=False, observed=True).agg(
+        total_sales=('Sales', 'sum'),
+        royalty_minor=('Royalty_Minor', 'sum'),
+        ad_fund_minor=('Ad_Fund_Minor', 'sum'),
+        tax_minor=('Tax_Minor', 'sum'),
+        total_minor=('Total_Minor', 'sum'),
+        usd_minor=('USD_Minor', 'sum'),
+        currency=('Currency', 'first'),  # Assume que a moeda é a mesma para o grupo
+        royalty_rate=('Royalty_Rate', 'mean'),  # Média das taxas (para mostrar na fatura)
+        ad_fund_rate=('Ad_Fund_Rate', 'mean'),
+        tax_rate=('Tax_Rate', 'first')  # Assume que a taxa de imposto é a mesma
+    ).reset_index()
     
-    for (partner, country, month, year, month_name), group in grouped:
-        # Somar valores
-        total_sales = group['Sales'].sum()
-        total_royalty = group['Royalty_Amount'].sum()
-        total_ad_fund = group['Ad_Fund_Amount'].sum()
-        total_tax = group['Tax_Amount'].sum()
-        total_amount = group['Total_Amount'].sum()
-        amount_usd = group['Amount_USD'].sum()
-        currency = group['Currency'].iloc[0]  # Assume que a moeda é a mesma para o grupo
-        
-        # Média das taxas (para mostrar na fatura)
-        avg_royalty_rate = group['Royalty_Rate'].mean()
-        avg_ad_fund_rate = group['Ad_Fund_Rate'].mean()
-        tax_rate = group['Tax_Rate'].iloc[0]  # Assume que a taxa de imposto é a mesma
-        
-        # Calcular o subtotal (soma de royalties e fundo de publicidade)
-        subtotal = total_royalty + total_ad_fund
-        
-        # Criar dados para fatura
-        invoice_data = {
-            'partner': partner,
-            'country': country,
-            'month': month,
-            'year': year,
-            'month_name': month_name,
-            'total_sales': total_sales,
-            'royalty_rate': avg_royalty_rate,
-            'royalty_amount': total_royalty,
-            'ad_fund_rate': avg_ad_fund_rate,
-            'ad_fund_amount': total_ad_fund,
-            'subtotal': subtotal,  # Adicionando o subtotal
-            'tax_rate': tax_rate,
-            'tax_amount': total_tax,
-            'total_amount': total_amount,
-            'amount_usd': amount_usd,
-            'currency': currency,
-            'invoice_number': f"INV-{country[:3]}-{partner[:3]}-{year}{month:02d}",
-            'created_at': datetime.now(),
-            'sent': False,
-            'paid': False,
-            'payment_amount': 0,
-            'due_status': 'A Vencer'  # Status inicial
-        }
-        
-        invoices_data.append(invoice_data)
+    if grouped.empty:
+        return []
+    
+    currencies = grouped['currency']
+    partners = grouped['Partner'].astype(str)
+    countries = grouped['Country'].astype(str)
+    months = grouped['Month'].astype(int)
+    
+    # Criar dados para faturas (colunas vetorizadas)
+    invoices_frame = pd.DataFrame({
+        'partner': grouped['Partner'],
+        'country': grouped['Country'],
+        'month': months,
+        'year': grouped['Year'],
+        'month_name': grouped['Month_Name'],
+        'total_sales': grouped['total_sales'],
+        'royalty_rate': grouped['royalty_rate'],
+        'royalty_amount': from_minor(grouped['royalty_minor'], currencies),
+        'ad_fund_rate': grouped['ad_fund_rate'],
+        'ad_fund_amount': from_minor(grouped['ad_fund_minor'], currencies),
+        'subtotal': from_minor(grouped['royalty_minor'] + grouped['ad_fund_minor'], currencies),
+        'tax_rate': grouped['tax_rate'],
+        'tax_amount': from_minor(grouped['tax_minor'], currencies),
+        'total_amount': from_minor(grouped['total_minor'], currencies),
+        'amount_usd': from_minor(grouped['usd_minor'], 'USD'),
+        'currency': currencies,
+        'invoice_number': ("INV-" + countries.str[:3] + "-" + partners.str[:3] + "-"
+                           + grouped['Year'].astype(str) + months.map('{:02d}'.format))
+    })
     
-    return invoices_data
+    return _invoice_records(invoices_frame)
 
 def import_payment_data(file):
     """
@@ -276,10 +275,8 @@ def import_payment_data(file):
         # Detectar tipo de arquivo
         file_extension = os.path.splitext(file.name)[1].lower()
         
-        if file_extension == '.csv':
-            df = pd.read_csv(file)
-        elif file_extension in ['.xlsx', '.xls']:
-            df = pd.read_excel(file)
+        if file_extension in ['.csv', '.xlsx', '.xls']:
+            df = read_payment_file(file)
         else:
             return None, False, "Formato de arquivo não suportado. Utilize CSV ou Excel."
         
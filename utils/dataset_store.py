@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional: sem ele os dados ficam apenas na sessão
+    pa = None
+    pq = None
+
+# Diretório dos conjuntos de dados importados (um subdiretório por conjunto)
+DATASET_DIR = "data/datasets"
+MANIFEST_FILE = "manifest.json"
+PARQUET_SUBDIR = "data"
+
+# Marca gravada ao limpar os dados: nenhum conjunto fica ativo até a próxima importação
+CLEARED_MARKER = ".cleared"
+
+# Colunas usadas para particionar os arquivos Parquet
+PARTITION_COLUMNS = ['Year', 'Month', 'Country']
+
+def is_available():
+    """
+    Indica se o armazenamento em Parquet está disponível (pyarrow instalado)
+    """
+    return pq is not None
+
+def compute_dataset_id(df):
+    """
+    Calcula o identificador do conjunto a partir do conteúdo do DataFrame
+
+    Importações com o mesmo conteúdo geram o mesmo identificador e passam a
+    compartilhar os mesmos arquivos.
+
+    Retorna:
+    - str: Identificador hexadecimal (16 caracteres)
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(json.dumps(list(map(str, df.columns))).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def _dataset_path(dataset_id):
+    return os.path.join(DATASET_DIR, dataset_id)
+
+def save_dataset(df):
+    """
+    Persiste os dados processados como Parquet particionado por Ano/Mês/País
+
+    A escrita é feita em um diretório temporário e movida no final, de modo
+    que um conjunto publicado nunca é alterado (imutável).
+
+    Parâmetros:
+    - df: DataFrame processado (saída de process_data)
+
+    Retorna:
+    - str: Identificador do conjunto
+    """
+    if not is_available():
+        raise RuntimeError("pyarrow não está instalado; não é possível salvar em Parquet.")
+
+    dataset_id = compute_dataset_id(df)
+    path = _dataset_path(dataset_id)
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return dataset_id
+
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{dataset_id}-", dir=DATASET_DIR)
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_to_dataset(table, root_path=os.path.join(staging, PARQUET_SUBDIR),
+                            partition_cols=PARTITION_COLUMNS)
+
+        partitions = (df.groupby(PARTITION_COLUMNS, sort=True, observed=True)
+                        .size().reset_index(name='rows'))
+        manifest = {
+            'dataset_id': dataset_id,
+            'created_at': datetime.now().isoformat(),
+            'rows': len(df),
+            'columns': list(map(str, df.columns)),
+            'dtypes': {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+            'partners': sorted(map(str, df['Partner'].dropna().unique())),
+            'countries': sorted(map(str, df['Country'].dropna().unique())),
+            'partitions': [
+                {'Year': int(row.Year), 'Month': int(row.Month), 'Country': str(row.Country), 'rows': int(row.rows)}
+                for row in partitions.itertuples(index=False)
+            ]
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+        os.replace(staging, path)
+    except OSError:
+        # Outro processo publicou o mesmo conjunto primeiro
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            raise
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return dataset_id
+
+def load_manifest(dataset_id):
+    """
+    Carrega o manifesto de um conjunto
+
+    Retorna:
+    - dict ou None se o conjunto não existir
+    """
+    try:
+        with open(os.path.join(_dataset_path(dataset_id), MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def list_datasets():
+    """
+    Lista os manifestos dos conjuntos salvos, do mais recente para o mais antigo
+
+    Retorna:
+    - list: Manifestos
+    """
+    if not os.path.exists(DATASET_DIR):
+        return []
+
+    manifests = []
+    for name in os.listdir(DATASET_DIR):
+        if name.startswith('.'):
+            continue
+        manifest = load_manifest(name)
+        if manifest:
+            manifests.append(manifest)
+
+    return sorted(manifests, key=lambda m: m['created_at'], reverse=True)
+
+def _build_filters(countries=None, partners=None, years=None, months=None):
+    filters = []
+    if countries is not None:
+        filters.append(('Country', 'in', list(map(str, countries))))
+    if partners is not None:
+        filters.append(('Partner', 'in', list(map(str, partners))))
+    if years is not None:
+        filters.append(('Year', 'in', [int(y) for y in years]))
+    if months is not None:
+        filters.append(('Month', 'in', [int(m) for m in months]))
+    return filters or None
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _read_dataset(dataset_id, columns, countries, partners, years, months):
+    manifest = load_manifest(dataset_id)
+    if manifest is None:
+        return None
+
+    if columns:
+        columns = [col for col in columns if col in manifest['columns']]
+
+    # Filtros nas colunas de partição descartam diretórios inteiros antes da leitura
+    filters = _build_filters(countries, partners, years, months)
+    if filters and any(values == [] for _, _, values in filters):
+        table = None
+    else:
+        table = pq.read_table(os.path.join(_dataset_path(dataset_id), PARQUET_SUBDIR), columns=list(columns) if columns else None,
+                              filters=filters, memory_map=True,
+                              partitioning='hive')
+
+    if table is None:
+        return pd.DataFrame({col: pd.Series(dtype=manifest['dtypes'][col])
+                             for col in (columns or manifest['columns'])})
+
+    df = table.to_pandas()
+
+    # Colunas de partição voltam como categorias; restaura os tipos originais
+    for col in PARTITION_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).astype(manifest['dtypes'][col])
+
+    ordered = [col for col in manifest['columns'] if col in df.columns]
+    return df[ordered]
+
+def read_dataset(dataset_id, columns=None, countries=None, partners=None, years=None, months=None):
+    """
+    Lê um conjunto salvo, apenas com as partições e colunas necessárias
+
+    Os arquivos são abertos com memory map e o resultado fica em cache
+    compartilhado entre as sessões (st.cache_resource); o DataFrame
+    retornado deve ser tratado como somente leitura.
+
+    Parâmetros:
+    - dataset_id: Identificador do conjunto
+    - columns: Colunas a ler (None para todas)
+    - countries, partners, years, months: Valores a manter (None para não filtrar)
+
+    Retorna:
+    - DataFrame ou None se o conjunto não existir
+    """
+    if not is_available():
+        return None
+
+    def frozen(values):
+        return tuple(sorted(map(str, values))) if values is not None else None
+
+    return _read_dataset(dataset_id, tuple(columns) if columns else None,
+                         frozen(countries), frozen(partners), frozen(years), frozen(months))
+
+def get_active_dataset_id():
+    """
+    Retorna o conjunto em uso: o da sessão ou, após um reinício, o mais recente salvo
+
+    Depois de clear_active_dataset nenhum conjunto salvo é retomado até que
+    uma nova importação seja registrada.
+
+    Retorna:
+    - str ou None
+    """
+    dataset_id = st.session_state.get('imported_dataset_id')
+    if dataset_id and load_manifest(dataset_id):
+        return dataset_id
+
+    if not is_available() or os.path.exists(os.path.join(DATASET_DIR, CLEARED_MARKER)):
+        return None
+
+    datasets = list_datasets()
+    if datasets:
+        st.session_state.imported_dataset_id = datasets[0]['dataset_id']
+        return datasets[0]['dataset_id']
+    return None
+
+def store_imported_data(df):
+    """
+    Publica os dados processados e registra o conjunto na sessão
+
+    Com pyarrow disponível a sessão guarda apenas o identificador do
+    conjunto; caso contrário mantém o DataFrame em st.session_state como antes.
+
+    Parâmetros:
+    - df: DataFrame processado
+
+    Retorna:
+    - str ou None: Identificador do conjunto
+    """
+    dataset_id = save_dataset(df) if is_available() else None
+    set_imported_data(df, dataset_id)
+    return dataset_id
+
+def set_imported_data(df, dataset_id=None):
+    """
+    Registra na sessão dados já processados (ex.: por uma tarefa em segundo plano)
+
+    Parâmetros:
+    - df: DataFrame processado
+    - dataset_id: Identificador do conjunto já salvo em Parquet (None para manter o DataFrame na sessão)
+    """
+    if dataset_id is None:
+        st.session_state.imported_data = df
+    else:
+        st.session_state.imported_dataset_id = dataset_id
+        st.session_state.imported_data = None
+        try:
+            os.remove(os.path.join(DATASET_DIR, CLEARED_MARKER))
+        except FileNotFoundError:
+            pass
+
+def clear_active_dataset():
+    """
+    Remove os dados importados da sessão e impede que o conjunto mais
+    recente seja recarregado do disco (inclusive em novas sessões)
+
+    Os arquivos Parquet são mantidos; a marca é removida pela próxima importação.
+    """
+    st.session_state.imported_dataset_id = None
+    st.session_state.imported_data = None
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    with open(os.path.join(DATASET_DIR, CLEARED_MARKER), 'w') as f:
+        f.write(datetime.now().isoformat())
+
+def has_imported_data():
+    """
+    Indica se há dados importados disponíveis (na sessão ou salvos em Parquet)
+    """
+    if st.session_state.get('imported_data') is not None:
+        return True
+    return get_active_dataset_id() is not None
+
+def get_imported_dimensions():
+    """
+    Retorna os parceiros e países dos dados importados sem carregar as vendas
+
+    Retorna:
+    - tuple: (lista_de_parceiros, lista_de_países)
+    """
+    df = st.session_state.get('imported_data')
+    if df is not None:
+        return list(df['Partner'].unique()), list(df['Country'].unique())
+
+    dataset_id = get_active_dataset_id()
+    manifest = load_manifest(dataset_id) if dataset_id else None
+    if manifest is None:
+        return [], []
+    return manifest['partners'], manifest['countries']
+
+def get_imported_data(columns=None, countries=None, partners=None):
+    """
+    Retorna os dados importados filtrados (da sessão ou do conjunto em Parquet)
+
+    Parâmetros:
+    - columns: Colunas necessárias (None para todas)
+    - countries: Países a manter (None para todos)
+    - partners: Parceiros a manter (None para todos)
+
+    Retorna:
+    - DataFrame (somente leitura) ou None se não houver dados importados
+    """
+    df = st.session_state.get('imported_data')
+    if df is not None:
+        mask = pd.Series(True, index=df.index)
+        if countries is not None:
+            mask &= df['Country'].isin(countries)
+        if partners is not None:
+            mask &= df['Partner'].isin(partners)
+        df = df[mask]
+        return df[[col for col in columns if col in df.columns]] if columns else df
+
+    dataset_id = get_active_dataset_id()
+    if dataset_id is None:
+        return None
+    return read_dataset(dataset_id, columns=columns, countries=countries, partners=partners)
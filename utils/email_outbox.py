@@ -0,0 +1,657 @@
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.email_pipeline import PREPARE_WORKERS, prepare_message
+from utils.email_sender import (describe_refused, get_default_email_template, get_smtp_settings, invoice_attachment_name,
+                                is_permanent_failure, open_smtp_connection, parse_recipients, validate_email)
+
+# Persistent outbox (survives restarts; attachments are stored with the message)
+OUTBOX_DB = "data/outbox.sqlite3"
+
+# Sender threads draining the outbox
+SENDER_WORKERS = 4
+
+# Seconds between outbox polls and between UI refreshes
+POLL_INTERVAL = 0.5
+UI_REFRESH_SECONDS = 2.0
+
+# Retry policy: exponential backoff with jitter, capped
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 30 * 60
+
+# Messages per minute per recipient domain (DEFAULT_DOMAIN_RATE for unlisted domains)
+DEFAULT_DOMAIN_RATE = 30
+DOMAIN_RATES = {
+    'gmail.com': 20,
+    'outlook.com': 20,
+    'hotmail.com': 20,
+}
+
+# Idle SMTP connections are closed after this many seconds
+CONNECTION_IDLE_SECONDS = 30
+
+# Message statuses
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+PENDING_STATUSES = (STATUS_QUEUED, STATUS_SENDING)
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "Queued",
+    STATUS_SENDING: "Sending",
+    STATUS_SENT: "Sent",
+    STATUS_FAILED: "Failed",
+    STATUS_CANCELLED: "Cancelled",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    batch_id TEXT,
+    owner TEXT,
+    invoice_number TEXT,
+    partner TEXT,
+    recipients TEXT NOT NULL,
+    domains TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    attachment BLOB,
+    attachment_name TEXT,
+    smtp_server TEXT,
+    smtp_port INTEGER,
+    smtp_username TEXT,
+    sender TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id);
+CREATE INDEX IF NOT EXISTS idx_outbox_invoice ON outbox (invoice_number, status);
+"""
+
+# SMTP passwords are never written to disk; they are kept per (server, username)
+# for this process and fall back to SMTP_PASSWORD after a restart
+_PASSWORDS = {}
+
+def _connect():
+    os.makedirs(os.path.dirname(OUTBOX_DB), exist_ok=True)
+    conn = sqlite3.connect(OUTBOX_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+@contextmanager
+def _connection():
+    # Auto-commit at the end of the block, always closed
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _now_iso():
+    return datetime.now().isoformat()
+
+def _domains(recipients):
+    return sorted({email.rsplit('@', 1)[-1].lower() for email in recipients})
+
+def retry_delay(attempts):
+    """
+    Backoff before the next attempt: exponential in the attempt count, with jitter
+
+    Parameters:
+    - attempts: Attempts made so far (1 after the first failure)
+
+    Returns:
+    - float: Seconds to wait
+    """
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+class DomainRateLimiter:
+    """
+    Token bucket per recipient domain, shared by all sender threads
+    """
+
+    def __init__(self, rates=None, default_rate=DEFAULT_DOMAIN_RATE):
+        self.rates = dict(DOMAIN_RATES if rates is None else rates)
+        self.default_rate = default_rate
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._updated = {}
+
+    def _refill(self, domain, now):
+        rate = self.rates.get(domain, self.default_rate) / 60.0
+        capacity = max(1.0, rate * 60 / 6)
+        tokens = self._tokens.get(domain, capacity)
+        elapsed = now - self._updated.get(domain, now)
+        self._tokens[domain] = min(capacity, tokens + elapsed * rate)
+        self._updated[domain] = now
+        return rate
+
+    def try_acquire(self, domains):
+        """
+        Take one token from every domain, or none if any domain is exhausted
+
+        Returns:
+        - float: 0 if acquired, otherwise seconds until the slowest domain has a token
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            for domain in domains:
+                rate = self._refill(domain, now)
+                if self._tokens[domain] < 1:
+                    wait = max(wait, (1 - self._tokens[domain]) / rate)
+            if wait:
+                return wait
+            for domain in domains:
+                self._tokens[domain] -= 1
+            return 0.0
+
+class _SmtpPool:
+    """
+    One open SMTP connection per server/account, owned by a single sender thread
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    def _open(self, row, password):
+        return open_smtp_connection(row['smtp_server'], row['smtp_port'], row['smtp_username'], password)
+
+    def send(self, row, password, message):
+        """
+        Send a message over the pooled connection
+
+        Returns:
+        - dict: Recipients refused by the server {address: (code, message)}; empty if all accepted
+        """
+        key = (row['smtp_server'], row['smtp_port'], row['smtp_username'])
+        recipients = parse_recipients(row['recipients'])
+
+        for attempt in range(2):
+            entry = self._connections.get(key)
+            if entry is None:
+                entry = self._connections[key] = [self._open(row, password), time.monotonic()]
+            try:
+                refused = entry[0].sendmail(row['sender'], recipients, message)
+                entry[1] = time.monotonic()
+                return refused or {}
+            except smtplib.SMTPServerDisconnected:
+                # Reused connection timed out on the server side: reconnect once
+                self._connections.pop(key, None)
+                if attempt:
+                    raise
+
+    def discard(self, row):
+        key = (row['smtp_server'], row['smtp_port'], row['smtp_username'])
+        entry = self._connections.pop(key, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except Exception:
+                pass
+
+    def close_idle(self):
+        now = time.monotonic()
+        for key, (server, last_used) in list(self._connections.items()):
+            if now - last_used > CONNECTION_IDLE_SECONDS:
+                self._connections.pop(key, None)
+                try:
+                    server.quit()
+                except Exception:
+                    pass
+
+class OutboxWorker:
+    """
+    Sender threads that drain the outbox (one instance per process)
+    """
+
+    def __init__(self, workers=SENDER_WORKERS, limiter=None):
+        with _connection() as conn:
+            conn.executescript(_SCHEMA)
+            # Messages interrupted mid-send go back to the queue (delivery is at-least-once)
+            conn.execute("UPDATE outbox SET status = ? WHERE status = ?", (STATUS_QUEUED, STATUS_SENDING))
+
+        self.limiter = limiter or DomainRateLimiter()
+        self._prepare_pool = ThreadPoolExecutor(PREPARE_WORKERS, thread_name_prefix="outbox-prepare")
+        self._wake = threading.Event()
+        self._threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name=f"outbox-sender-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wake.set()
+
+    def _claim(self):
+        """
+        Mark the next due message whose domains have rate budget as sending
+
+        Only the oldest due message of each recipient domain set is a
+        candidate, so a large batch to one throttled domain cannot fill the
+        window and hold back messages to other domains.
+
+        Returns:
+        - sqlite3.Row or None
+        """
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            candidates = conn.execute(
+                "SELECT id, domains FROM ("
+                "  SELECT id, domains, next_attempt_at, ROW_NUMBER() OVER ("
+                "    PARTITION BY domains ORDER BY next_attempt_at, id) AS position"
+                "  FROM outbox WHERE status = ? AND next_attempt_at <= ?"
+                ") WHERE position = 1 ORDER BY next_attempt_at LIMIT 50", (STATUS_QUEUED, time.time())).fetchall()
+
+            claimed = None
+            for candidate in candidates:
+                if self.limiter.try_acquire(candidate['domains'].split(',')) == 0:
+                    conn.execute("UPDATE outbox SET status = ? WHERE id = ?", (STATUS_SENDING, candidate['id']))
+                    claimed = conn.execute("SELECT * FROM outbox WHERE id = ?", (candidate['id'],)).fetchone()
+                    break
+            conn.execute("COMMIT")
+            return claimed
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, row, status, error=None, retry_in=None, count_attempt=True):
+        attempts = row['attempts'] + (1 if count_attempt else 0)
+        with _connection() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, sent_at = ? "
+                "WHERE id = ?",
+                (status, attempts, error, time.time() + (retry_in or 0),
+                 _now_iso() if status == STATUS_SENT else None, row['id']))
+
+        if status in (STATUS_SENT, STATUS_FAILED) and row['invoice_number']:
+            from utils.audit_log import ACTION_INVOICE_SEND_FAILED, ACTION_INVOICE_SENT, get_audit_log
+            if status == STATUS_SENT:
+                get_audit_log().log(ACTION_INVOICE_SENT, row['invoice_number'], user=row['owner'],
+                                    recipient=row['recipients'], attempts=attempts)
+            else:
+                get_audit_log().log(ACTION_INVOICE_SEND_FAILED, row['invoice_number'], user=row['owner'],
+                                    error=error, attempts=attempts)
+
+    def _claim_prepared(self):
+        """
+        Claim the next message and start assembling it in the preparation pool
+
+        Returns:
+        - tuple (row, future) or None
+        """
+        try:
+            row = self._claim()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        job = {'recipients': parse_recipients(row['recipients']), 'subject': row['subject'], 'body': row['body'],
+               'pdf': row['attachment'], 'filename': row['attachment_name']}
+        return row, self._prepare_pool.submit(prepare_message, job, row['sender'])
+
+    def _deliver(self, row, prepared, pool):
+        password = _PASSWORDS.get((row['smtp_server'], row['smtp_username'])) or os.getenv('SMTP_PASSWORD', '')
+        if row['smtp_username'] and not password:
+            # Nothing to send with until someone re-enters the settings; check again later
+            self._finish(row, STATUS_QUEUED, "SMTP password unavailable after restart; save the email settings again.",
+                         retry_in=RETRY_BASE_SECONDS, count_attempt=False)
+            return
+
+        try:
+            message = prepared.result()
+        except Exception as e:
+            self._finish(row, STATUS_FAILED, f"Failed to build email: {e}")
+            return
+
+        try:
+            refused = pool.send(row, password, message)
+        except Exception as e:
+            pool.discard(row)
+            if is_permanent_failure(e):
+                self._finish(row, STATUS_FAILED, f"Failed to send email: {e}")
+            else:
+                self._retry(row, e)
+        else:
+            if refused:
+                self._split_refused(row, refused)
+            else:
+                self._finish(row, STATUS_SENT)
+
+    def _split_refused(self, row, refused):
+        """
+        Record a partial rejection: the message is sent to the accepted
+        recipients, and the refused ones move to a new message that is
+        retried (4xx replies) or failed (5xx replies)
+        """
+        recipients = parse_recipients(row['recipients'])
+        accepted = [email for email in recipients if email not in refused]
+        rejected = [email for email in recipients if email in refused]
+        error = f"Recipients refused the email: {describe_refused(refused)}"
+        permanent = all(code >= 500 for code, _ in refused.values())
+
+        if not accepted:
+            if permanent:
+                self._finish(row, STATUS_FAILED, error)
+            else:
+                self._retry(row, error)
+            return
+
+        remainder = dict(row, id=uuid.uuid4().hex, recipients=", ".join(rejected),
+                         domains=",".join(_domains(rejected)), status=STATUS_SENDING)
+        delivered = dict(row, recipients=", ".join(accepted), domains=",".join(_domains(accepted)))
+        with _connection() as conn:
+            conn.execute(f"INSERT INTO outbox ({', '.join(remainder)}) VALUES ({', '.join('?' * len(remainder))})",
+                         list(remainder.values()))
+            conn.execute("UPDATE outbox SET recipients = ?, domains = ? WHERE id = ?",
+                         (delivered['recipients'], delivered['domains'], row['id']))
+        self._finish(delivered, STATUS_SENT)
+
+        if permanent:
+            self._finish(remainder, STATUS_FAILED, error)
+        else:
+            self._retry(remainder, error)
+
+    def _retry(self, row, error):
+        if row['attempts'] + 1 >= MAX_ATTEMPTS:
+            self._finish(row, STATUS_FAILED, f"Failed to send email: {error}")
+        else:
+            self._finish(row, STATUS_QUEUED, f"Failed to send email: {error}",
+                         retry_in=retry_delay(row['attempts'] + 1))
+
+    def _release(self, rows):
+        """
+        Put messages this thread claimed but could not finish back in the queue
+
+        Only rows still marked as sending are changed, so a message whose
+        result was already recorded is never sent again.
+
+        Returns:
+        - bool: False if the database could not be updated (try again later)
+        """
+        try:
+            with _connection() as conn:
+                conn.executemany("UPDATE outbox SET status = ?, next_attempt_at = ? WHERE id = ? AND status = ?",
+                                 [(STATUS_QUEUED, time.time() + RETRY_BASE_SECONDS, row['id'], STATUS_SENDING)
+                                  for row in rows])
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _work(self):
+        pool = _SmtpPool()
+        current = upcoming = None
+        stranded = []
+        while True:
+            try:
+                if stranded and self._release(stranded):
+                    stranded = []
+                if current is None:
+                    current = self._claim_prepared()
+                if current is None:
+                    pool.close_idle()
+                    self._wake.wait(POLL_INTERVAL)
+                    self._wake.clear()
+                    continue
+
+                # The next message is assembled while this one is on the wire
+                upcoming = self._claim_prepared()
+                self._deliver(*current, pool)
+                current, upcoming = upcoming, None
+            except Exception:
+                # Keep the thread alive (e.g. "database is locked" or an audit log error)
+                traceback.print_exc()
+                stranded.extend(item[0] for item in (current, upcoming) if item is not None)
+                current = upcoming = None
+                if self._release(stranded):
+                    stranded = []
+                time.sleep(POLL_INTERVAL)
+
+@st.cache_resource(show_spinner=False)
+def get_outbox_worker():
+    """
+    Start (once per process) and return the outbox sender threads
+    """
+    return OutboxWorker()
+
+def enqueue_invoices(invoices, email_mapping, owner=None, render=None, settings=None):
+    """
+    Queue invoice emails for background delivery and return immediately
+
+    Invoices without a valid recipient or already waiting in the outbox are
+    skipped and reported back.
+
+    Parameters:
+    - invoices: List of invoice dictionaries (with 'pdf' bytes)
+    - email_mapping: Dictionary mapping partner names to email addresses
+    - owner: User queuing the messages
+    - render: Function invoice -> {'subject', 'body'} (default: get_default_email_template)
+    - settings: SMTP settings (default: get_smtp_settings())
+
+    Returns:
+    - tuple: (batch_id, queued_count, skipped) where skipped lists
+      {'invoice_number', 'partner', 'error'}
+    """
+    settings = settings or get_smtp_settings()
+    if not all([settings['server'], settings['port'], settings['username'], settings['password'], settings['sender']]):
+        return None, 0, [{'invoice_number': inv['invoice_number'], 'partner': inv['partner'],
+                          'error': "Email configuration is incomplete. Please check settings."} for inv in invoices]
+
+    worker = get_outbox_worker()
+    _PASSWORDS[(settings['server'], settings['username'])] = settings['password']
+    render = render or get_default_email_template
+
+    pending = pending_invoice_numbers([inv['invoice_number'] for inv in invoices])
+    batch_id = uuid.uuid4().hex
+    rows = []
+    skipped = []
+    now = time.time()
+
+    for invoice in invoices:
+        recipients = parse_recipients(email_mapping.get(invoice['partner']))
+        error = None
+        if invoice.get('sent', False) or invoice['invoice_number'] in pending:
+            error = "Invoice is already sent or waiting in the outbox"
+        elif not recipients:
+            error = "No email address found for this partner"
+        elif not all(validate_email(email) for email in recipients):
+            error = f"Invalid recipient email: {', '.join(recipients)}"
+        if error:
+            skipped.append({'invoice_number': invoice['invoice_number'], 'partner': invoice['partner'], 'error': error})
+            continue
+
+        template = render(invoice)
+        rows.append((uuid.uuid4().hex, batch_id, owner, invoice['invoice_number'], invoice['partner'],
+                     ", ".join(recipients), ",".join(_domains(recipients)), template['subject'], template['body'],
+                     invoice['pdf'], invoice_attachment_name(invoice), settings['server'], int(settings['port']),
+                     settings['username'], settings['sender'], STATUS_QUEUED, now, _now_iso()))
+
+    if rows:
+        with _connection() as conn:
+            conn.executemany(
+                "INSERT INTO outbox (id, batch_id, owner, invoice_number, partner, recipients, domains, subject, "
+                "body, attachment, attachment_name, smtp_server, smtp_port, smtp_username, sender, status, "
+                "next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        worker.notify()
+
+    return (batch_id if rows else None), len(rows), skipped
+
+def _invoice_numbers_with_status(invoice_numbers, statuses):
+    invoice_numbers = list(invoice_numbers)
+    found = set()
+    status_marks = ','.join('?' * len(statuses))
+    with _connection() as conn:
+        conn.executescript(_SCHEMA)
+        # SQLite limits the number of bound parameters: query in chunks
+        for start in range(0, len(invoice_numbers), 500):
+            chunk = invoice_numbers[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            found.update(row['invoice_number'] for row in conn.execute(
+                f"SELECT DISTINCT invoice_number FROM outbox WHERE status IN ({status_marks}) "
+                f"AND invoice_number IN ({marks})", (*statuses, *chunk)))
+    return found
+
+def pending_invoice_numbers(invoice_numbers):
+    """
+    Return the invoice numbers that have a message queued or being sent
+    """
+    return _invoice_numbers_with_status(invoice_numbers, PENDING_STATUSES)
+
+def mark_sent_invoices(invoices):
+    """
+    Flag invoices delivered by the outbox as sent (invoice['sent'] = True)
+
+    Returns:
+    - int: Number of invoices newly flagged
+    """
+    unsent = {inv['invoice_number']: inv for inv in invoices if not inv.get('sent', False)}
+    if not unsent:
+        return 0
+    delivered = _invoice_numbers_with_status(unsent, (STATUS_SENT,))
+    for number in delivered:
+        unsent[number]['sent'] = True
+    return len(delivered)
+
+def batch_summary(batch_id):
+    """
+    Count messages of a batch by status
+
+    Returns:
+    - dict: {status: count}
+    """
+    with _connection() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) AS total FROM outbox WHERE batch_id = ? GROUP BY status",
+                            (batch_id,)).fetchall()
+    return {row['status']: row['total'] for row in rows}
+
+def list_messages(batch_id=None, statuses=None, owner=None, with_error=False, limit=200):
+    """
+    List outbox messages (without bodies or attachments), newest first
+
+    Parameters:
+    - batch_id: Only messages of this batch
+    - statuses: Only messages with these statuses
+    - owner: Only messages queued by this user
+    - with_error: Only messages with a last error (e.g. queued ones waiting for a retry)
+    - limit: Maximum number of messages
+
+    Returns:
+    - list: Dictionaries with id, invoice_number, partner, recipients, status, attempts, last_error and dates
+    """
+    query = ("SELECT id, batch_id, owner, invoice_number, partner, recipients, status, attempts, last_error, "
+             "created_at, sent_at FROM outbox")
+    clauses, params = [], []
+    if batch_id is not None:
+        clauses.append("batch_id = ?")
+        params.append(batch_id)
+    if statuses:
+        clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if owner is not None:
+        clauses.append("owner = ?")
+        params.append(owner)
+    if with_error:
+        clauses.append("last_error IS NOT NULL")
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+
+    with _connection() as conn:
+        conn.executescript(_SCHEMA)
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+def retry_failed(batch_id=None, owner=None):
+    """
+    Put failed messages back in the queue with a fresh attempt budget
+
+    Parameters:
+    - batch_id: Only messages of this batch
+    - owner: Only messages queued by this user
+
+    Returns:
+    - int: Messages requeued
+    """
+    query = "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?"
+    params = [STATUS_QUEUED, time.time(), STATUS_FAILED]
+    if batch_id is not None:
+        query += " AND batch_id = ?"
+        params.append(batch_id)
+    if owner is not None:
+        query += " AND owner = ?"
+        params.append(owner)
+    with _connection() as conn:
+        count = conn.execute(query, params).rowcount
+    get_outbox_worker().notify()
+    return count
+
+def cancel_queued(batch_id):
+    """
+    Cancel messages of a batch that have not been picked up yet
+
+    Returns:
+    - int: Messages cancelled
+    """
+    with _connection() as conn:
+        return conn.execute("UPDATE outbox SET status = ? WHERE batch_id = ? AND status = ?",
+                            (STATUS_CANCELLED, batch_id, STATUS_QUEUED)).rowcount
+
+@st.fragment(run_every=UI_REFRESH_SECONDS)
+def render_outbox_progress(batch_id):
+    """
+    Show delivery progress of a batch, refreshed without rerunning the page
+
+    When the batch finishes, its counts are kept in
+    st.session_state.outbox_last_result and the whole page reruns once so
+    sent invoices move to the "Sent Invoices" list.
+
+    Parameters:
+    - batch_id: Batch returned by enqueue_invoices
+    """
+    summary = batch_summary(batch_id)
+    total = sum(summary.values())
+    if not any(summary.get(status) for status in PENDING_STATUSES):
+        if st.session_state.get('outbox_batch_id') == batch_id:
+            del st.session_state['outbox_batch_id']
+            st.session_state.outbox_last_result = summary
+            st.rerun()
+        return
+
+    done = total - sum(summary.get(status, 0) for status in PENDING_STATUSES)
+    parts = [f"{STATUS_LABELS[status]}: {summary[status]}" for status in STATUS_LABELS if summary.get(status)]
+    st.progress(done / total, text="Sending invoices — " + ", ".join(parts))
+
+    # Queued messages that already failed once are waiting for a retry; say why
+    waiting = list_messages(batch_id, statuses=[STATUS_QUEUED], with_error=True, limit=1)
+    if waiting:
+        st.warning(f"Some emails are waiting to be retried. Last error: {waiting[0]['last_error']}")
+
+    if st.button("Cancel queued emails", key=f"cancel_outbox_{batch_id}"):
+        cancel_queued(batch_id)
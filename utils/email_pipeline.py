@@ -0,0 +1,194 @@
+import queue
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.email_sender import (build_invoice_message, describe_refused, invoice_attachment_name, is_permanent_failure,
+                                open_smtp_connection, parse_recipients, serialize_message, validate_email)
+
+# Threads assembling and serializing messages, and threads sending them
+PREPARE_WORKERS = 2
+SEND_WORKERS = 4
+
+# Prepared messages waiting for a sender (bounds the memory held by serialized messages)
+QUEUE_SIZE = 32
+
+# Extra attempts for transient failures (4xx replies, dropped connections) and base backoff
+SEND_RETRIES = 2
+RETRY_BASE_SECONDS = 0.5
+
+_DONE = object()
+
+def prepare_message(job, sender_email):
+    """
+    Assemble and serialize the message of a job
+
+    Parameters:
+    - job: Dictionary with recipients, subject, body, pdf, filename and
+      optional attachments (list of (content, filename))
+    - sender_email: Sender address
+
+    Returns:
+    - bytes: Message data for smtplib's sendmail
+    """
+    msg = build_invoice_message(sender_email, job['recipients'], job['subject'], job['body'],
+                                job['pdf'], job['filename'], job.get('attachments'))
+    return serialize_message(msg)
+
+def invoice_jobs(invoices, email_mapping, render, shared_attachments=None):
+    """
+    Build pipeline jobs for invoices, rejecting those without valid recipients
+
+    Parameters:
+    - invoices: List of invoice dictionaries (with 'pdf' bytes)
+    - email_mapping: Dictionary mapping partner names to email addresses
+    - render: Function invoice -> {'subject', 'body'}
+    - shared_attachments: (content, filename) PDFs attached to every message;
+      each is encoded once for the whole batch
+
+    Returns:
+    - tuple: (jobs, failed_invoices)
+    """
+    jobs = []
+    failed_invoices = []
+    for invoice in invoices:
+        recipients = parse_recipients(email_mapping.get(invoice['partner']))
+        error = None
+        if not recipients:
+            error = "No email address found for this partner"
+        else:
+            invalid = [email for email in recipients if not validate_email(email)]
+            if invalid:
+                error = f"Invalid recipient email: {', '.join(invalid)}"
+        if error:
+            failed_invoices.append({'invoice_number': invoice['invoice_number'], 'partner': invoice['partner'],
+                                    'error': error})
+            continue
+
+        template = render(invoice)
+        jobs.append({
+            'invoice': invoice,
+            'recipients': recipients,
+            'subject': template['subject'],
+            'body': template['body'],
+            'pdf': invoice['pdf'],
+            'filename': invoice_attachment_name(invoice),
+            'attachments': list(shared_attachments or []),
+        })
+    return jobs, failed_invoices
+
+class EmailPipeline:
+    """
+    Producer/consumer email pipeline
+
+    A thread pool assembles and serializes messages (MIME building and
+    base64 encoding) ahead of the sender threads, which only do network
+    round trips over connections they keep open for the whole batch.
+    """
+
+    def __init__(self, settings, prepare_workers=PREPARE_WORKERS, send_workers=SEND_WORKERS,
+                 queue_size=QUEUE_SIZE, retries=SEND_RETRIES, connect=open_smtp_connection):
+        self.settings = settings
+        self.prepare_workers = prepare_workers
+        self.send_workers = send_workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.connect = connect
+
+    def run(self, jobs):
+        """
+        Send all jobs and wait for the results
+
+        Parameters:
+        - jobs: List of jobs (see prepare_message)
+
+        Returns:
+        - list: One dictionary per job, in order, with success, error,
+          attempts and seconds (from preparation to delivery)
+        """
+        results = [None] * len(jobs)
+        if not jobs:
+            return results
+
+        ready = queue.Queue(maxsize=self.queue_size)
+        senders = [threading.Thread(target=self._send_loop, args=(ready, jobs, results),
+                                    name=f"email-sender-{number}", daemon=True)
+                   for number in range(min(self.send_workers, len(jobs)))]
+        for sender in senders:
+            sender.start()
+
+        # Producers block on the bounded queue when the senders fall behind
+        with ThreadPoolExecutor(self.prepare_workers, thread_name_prefix="email-prepare") as pool:
+            for index, job in enumerate(jobs):
+                pool.submit(self._prepare, index, job, ready)
+
+        for _ in senders:
+            ready.put(_DONE)
+        for sender in senders:
+            sender.join()
+        return results
+
+    def _prepare(self, index, job, ready):
+        started = time.perf_counter()
+        try:
+            data, error = prepare_message(job, self.settings['sender']), None
+        except Exception as e:
+            data, error = None, e
+        ready.put((index, data, error, started))
+
+    def _open(self):
+        return self.connect(self.settings['server'], self.settings['port'],
+                            self.settings['username'], self.settings['password'])
+
+    def _send_loop(self, ready, jobs, results):
+        connection = None
+        try:
+            while True:
+                item = ready.get()
+                if item is _DONE:
+                    break
+
+                index, data, error, started = item
+                if error is not None:
+                    results[index] = {'success': False, 'error': f"Failed to build email: {error}",
+                                      'attempts': 0, 'seconds': time.perf_counter() - started}
+                    continue
+
+                connection, results[index] = self._deliver(connection, jobs[index], data, started)
+        finally:
+            _close(connection)
+
+    def _deliver(self, connection, job, data, started):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                if connection is None:
+                    connection = self._open()
+                refused = connection.sendmail(self.settings['sender'], job['recipients'], data)
+                if refused:
+                    # Delivered to the other recipients; retrying would send it to them again
+                    return connection, {'success': False, 'attempts': attempts,
+                                        'error': f"Recipients refused the email: {describe_refused(refused)}",
+                                        'seconds': time.perf_counter() - started}
+                return connection, {'success': True, 'error': None, 'attempts': attempts,
+                                    'seconds': time.perf_counter() - started}
+            except Exception as e:
+                # smtplib resets the transaction after a rejected reply; other errors leave the connection unusable
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    connection = _close(connection)
+                if is_permanent_failure(e) or attempts > self.retries:
+                    return connection, {'success': False, 'error': f"Failed to send email: {e}",
+                                        'attempts': attempts, 'seconds': time.perf_counter() - started}
+                delay = RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                time.sleep(random.uniform(delay / 2, delay))
+
+def _close(connection):
+    if connection is not None:
+        try:
+            connection.quit()
+        except Exception:
+            pass
+    return None
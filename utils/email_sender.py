@@ -2,10 +2,17 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email.generator import BytesGenerator
+from functools import lru_cache
+import io
+import uuid
 import streamlit as st
-import pandas as pd
 import re
 import os
+from utils.email_templates import render_invoice_email
+
+# Encoded body and attachment parts kept for repeated sends (retries, resends)
+MIME_PART_CACHE_SIZE = 128
 
 def validate_email(email):
     """
@@ -20,12 +27,174 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
     return bool(re.match(pattern, email))
 
+def parse_recipients(recipient_email):
+    """
+    Split a recipient field into individual addresses
+    
+    Parameters:
+    - recipient_email: Address, comma/semicolon separated addresses, or a list
+    
+    Returns:
+    - list: Email addresses
+    """
+    if isinstance(recipient_email, (list, tuple)):
+        items = recipient_email
+    else:
+        items = re.split(r'[;,]', recipient_email or "")
+    return [item.strip() for item in items if item and item.strip()]
+
+def get_smtp_settings():
+    """
+    Get the SMTP configuration from session state or environment variables
+    
+    Returns:
+    - dict: server, port, username, password and sender
+    """
+    return {
+        'server': st.session_state.get('smtp_server', os.getenv('SMTP_SERVER', '')),
+        'port': st.session_state.get('smtp_port', os.getenv('SMTP_PORT', '587')),
+        'username': st.session_state.get('smtp_username', os.getenv('SMTP_USERNAME', '')),
+        'password': st.session_state.get('smtp_password', os.getenv('SMTP_PASSWORD', '')),
+        'sender': st.session_state.get('sender_email', os.getenv('SENDER_EMAIL', ''))
+    }
+
+@lru_cache(maxsize=MIME_PART_CACHE_SIZE)
+def _html_part(body):
+    return MIMEText(body, 'html')
+
+@lru_cache(maxsize=MIME_PART_CACHE_SIZE)
+def encode_attachment(content, filename):
+    """
+    Get the base64-encoded MIME part of a PDF attachment
+    
+    The part is encoded once per content and filename; a document attached
+    to several messages (e.g. a statement sent to every contact) shares it.
+    
+    Parameters:
+    - content: PDF file content (bytes)
+    - filename: Filename for the attachment
+    
+    Returns:
+    - MIMEApplication: Encoded part (shared, must not be modified)
+    """
+    attachment = MIMEApplication(content, _subtype='pdf')
+    attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+    return attachment
+
+def build_invoice_message(sender_email, recipients, subject, body, invoice_pdf, invoice_filename, attachments=None):
+    """
+    Build the MIME message for an invoice email
+    
+    Parameters:
+    - sender_email: Sender address
+    - recipients: List of recipient addresses
+    - subject: Email subject
+    - body: HTML body
+    - invoice_pdf: PDF file content (bytes)
+    - invoice_filename: Filename for the attachment
+    - attachments: Additional (content, filename) PDF attachments
+    
+    Returns:
+    - MIMEMultipart: Message ready to be sent
+    """
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = ", ".join(recipients)
+    msg['Subject'] = subject
+    
+    # Attach body and PDF (encoded parts are shared between messages, never modified)
+    msg.attach(_html_part(body))
+    msg.attach(encode_attachment(invoice_pdf, invoice_filename))
+    for content, filename in attachments or []:
+        msg.attach(encode_attachment(content, filename))
+    
+    return msg
+
+def _flatten(msg):
+    buffer = io.BytesIO()
+    BytesGenerator(buffer, policy=msg.policy.clone(linesep='\r\n')).flatten(msg)
+    return buffer.getvalue()
+
+@lru_cache(maxsize=MIME_PART_CACHE_SIZE * 2)
+def _part_bytes(part):
+    # Parts come from the caches above and are never modified, so their wire form is cached too
+    return _flatten(part)
+
+def serialize_message(msg):
+    """
+    Serialize a message to the bytes sent over SMTP (CRLF line endings)
+    
+    The encoded parts are serialized once and reused; only the headers
+    are written for each message.
+    
+    Returns:
+    - bytes: Message data for smtplib's sendmail
+    """
+    if not msg.is_multipart():
+        return _flatten(msg)
+    
+    boundary = msg.get_boundary()
+    if boundary is None:
+        boundary = f"==============={uuid.uuid4().hex}=="
+        msg.set_boundary(boundary)
+    
+    policy = msg.policy.clone(linesep='\r\n')
+    delimiter = f"--{boundary}".encode('ascii')
+    chunks = [policy.fold_binary(name, value) for name, value in msg.items()]
+    chunks.append(b"\r\n")
+    for part in msg.get_payload():
+        chunks += [delimiter, b"\r\n", _part_bytes(part), b"\r\n"]
+    chunks += [delimiter, b"--\r\n"]
+    return b"".join(chunks)
+
+def open_smtp_connection(smtp_server, smtp_port, smtp_username, smtp_password, timeout=60):
+    """
+    Connect and log in to the SMTP server (STARTTLS, or implicit TLS on port 465)
+    
+    Returns:
+    - smtplib.SMTP: Open connection
+    """
+    smtp_port = int(smtp_port)
+    if smtp_port == 465:
+        server = smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=timeout)
+    else:
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=timeout)
+        server.starttls()
+    if smtp_username:
+        server.login(smtp_username, smtp_password)
+    return server
+
+def is_permanent_failure(error):
+    """
+    Check whether a send error cannot be fixed by retrying (rejected recipient, 5xx reply, bad login)
+    """
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+def describe_refused(refused):
+    """
+    Describe the recipients refused by the server in an otherwise accepted sendmail
+
+    Parameters:
+    - refused: Dictionary returned by smtplib's sendmail {address: (code, message)}
+
+    Returns:
+    - str: e.g. "a@x.com (550 Mailbox unavailable)"
+    """
+    parts = []
+    for address, (code, message) in refused.items():
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', errors='replace')
+        parts.append(f"{address} ({code} {message})")
+    return ", ".join(parts)
+
 def send_invoice_email(recipient_email, subject, body, invoice_pdf, invoice_filename):
     """
     Send invoice via email
     
     Parameters:
-    - recipient_email: Email address of recipient
+    - recipient_email: Email address of recipient (or several, see parse_recipients)
     - subject: Email subject
     - body: Email body content
     - invoice_pdf: PDF file content (bytes)
@@ -35,44 +204,38 @@ def send_invoice_email(recipient_email, subject, body, invoice_pdf, invoice_file
     - tuple: (success, message)
     """
     # Get email configuration from session state or environment variables
-    smtp_server = st.session_state.get('smtp_server', os.getenv('SMTP_SERVER', ''))
-    smtp_port = st.session_state.get('smtp_port', os.getenv('SMTP_PORT', '587'))
-    smtp_username = st.session_state.get('smtp_username', os.getenv('SMTP_USERNAME', ''))
-    smtp_password = st.session_state.get('smtp_password', os.getenv('SMTP_PASSWORD', ''))
-    sender_email = st.session_state.get('sender_email', os.getenv('SENDER_EMAIL', ''))
+    settings = get_smtp_settings()
+    smtp_server = settings['server']
+    smtp_port = settings['port']
+    smtp_username = settings['username']
+    smtp_password = settings['password']
+    sender_email = settings['sender']
     
     # Validate email configuration
     if not all([smtp_server, smtp_port, smtp_username, smtp_password, sender_email]):
         return False, "Email configuration is incomplete. Please check settings."
     
-    # Validate recipient email
-    if not validate_email(recipient_email):
-        return False, f"Invalid recipient email: {recipient_email}"
+    # Validate recipient emails
+    recipients = parse_recipients(recipient_email)
+    if not recipients:
+        return False, "No recipient email provided"
+    invalid = [email for email in recipients if not validate_email(email)]
+    if invalid:
+        return False, f"Invalid recipient email: {', '.join(invalid)}"
     
     try:
         # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        
-        # Attach body
-        msg.attach(MIMEText(body, 'html'))
-        
-        # Attach PDF
-        attachment = MIMEApplication(invoice_pdf, _subtype='pdf')
-        attachment.add_header('Content-Disposition', 'attachment', filename=invoice_filename)
-        msg.attach(attachment)
+        msg = build_invoice_message(sender_email, recipients, subject, body, invoice_pdf, invoice_filename)
         
         # Connect to SMTP server
-        server = smtplib.SMTP(smtp_server, int(smtp_port))
-        server.starttls()
-        server.login(smtp_username, smtp_password)
+        server = open_smtp_connection(smtp_server, smtp_port, smtp_username, smtp_password)
         
-        # Send email
-        server.sendmail(sender_email, recipient_email, msg.as_string())
+        # Send email (sendmail returns the recipients refused when at least one was accepted)
+        refused = server.sendmail(sender_email, recipients, serialize_message(msg))
         server.quit()
         
+        if refused:
+            return False, f"Recipients refused the email: {describe_refused(refused)}"
         return True, "Email sent successfully!"
     
     except Exception as e:
@@ -80,7 +243,7 @@ def send_invoice_email(recipient_email, subject, body, invoice_pdf, invoice_file
 
 def get_default_email_template(invoice_data):
     """
-    Get default email template for invoice
+    Get default email template for invoice, in the partner's language
     
     Parameters:
     - invoice_data: Dictionary containing invoice information
@@ -88,102 +251,55 @@ def get_default_email_template(invoice_data):
     Returns:
     - dict: Contains subject and body for email
     """
-    subject = f"Invoice {invoice_data['invoice_number']} - {invoice_data['month_name']} {invoice_data['year']}"
-    
-    body = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background-color: #4A1F60; color: white; padding: 15px; text-align: center;">
-                <h2>Invoice {invoice_data['invoice_number']}</h2>
-            </div>
-            
-            <div style="padding: 20px; border: 1px solid #ddd; border-top: none;">
-                <p>Dear {invoice_data['partner']},</p>
-                
-                <p>Please find attached your invoice for {invoice_data['month_name']} {invoice_data['year']}.</p>
-                
-                <div style="background-color: #f9f9f9; padding: 15px; margin: 20px 0; border-left: 4px solid #4A1F60;">
-                    <p><strong>Invoice Number:</strong> {invoice_data['invoice_number']}</p>
-                    <p><strong>Period:</strong> {invoice_data['month_name']} {invoice_data['year']}</p>
-                    <p><strong>Total Amount:</strong> {invoice_data['currency']} {invoice_data['total_amount']:,.2f}</p>
-                    <p><strong>Due Date:</strong> {(invoice_data['created_at'] + pd.Timedelta(days=30)).strftime('%Y-%m-%d')}</p>
-                </div>
-                
-                <p>For any questions regarding this invoice, please reply to this email or contact our accounting department.</p>
-                
-                <p>Thank you for your business.</p>
-                
-                <p>Best regards,<br>
-                Your Company Name<br>
-                Accounting Department</p>
-            </div>
-            
-            <div style="text-align: center; padding: 10px; font-size: 12px; color: #777;">
-                <p>© 2023 Your Company Name. All rights reserved.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return {"subject": subject, "body": body}
-
-def send_bulk_invoices(invoices, email_mapping):
+    return render_invoice_email(invoice_data)
+
+def invoice_attachment_name(invoice):
+    """
+    Get the PDF attachment filename for an invoice
+    """
+    return f"Invoice_{invoice['invoice_number']}_{invoice['partner']}.pdf".replace(" ", "_")
+
+def send_bulk_invoices(invoices, email_mapping, render=None, shared_attachments=None):
     """
     Send multiple invoices via email
     
+    Messages are assembled by a preparation pool while sender threads
+    deliver the ones already prepared (see utils.email_pipeline).
+    
     Parameters:
     - invoices: List of invoice dictionaries
     - email_mapping: Dictionary mapping partner names to email addresses
+    - render: Function invoice -> {'subject', 'body'} (default: get_default_email_template)
+    - shared_attachments: (content, filename) PDFs attached to every email, encoded once
     
     Returns:
     - tuple: (success_count, fail_count, failed_invoices)
     """
-    success_count = 0
-    fail_count = 0
-    failed_invoices = []
+    from utils.email_pipeline import EmailPipeline, invoice_jobs
     
-    for invoice in invoices:
-        # Skip already sent invoices
-        if invoice.get('sent', False):
-            continue
-        
-        # Get recipient email from mapping
-        recipient_email = email_mapping.get(invoice['partner'])
-        if not recipient_email:
-            fail_count += 1
-            failed_invoices.append({
-                'invoice_number': invoice['invoice_number'],
-                'partner': invoice['partner'],
-                'error': "No email address found for this partner"
-            })
-            continue
-        
-        # Get email template
-        template = get_default_email_template(invoice)
-        
-        # Generate filename
-        filename = f"Invoice_{invoice['invoice_number']}_{invoice['partner']}.pdf".replace(" ", "_")
-        
-        # Send email
-        success, message = send_invoice_email(
-            recipient_email,
-            template['subject'],
-            template['body'],
-            invoice['pdf'],
-            filename
-        )
-        
-        if success:
+    render = render or get_default_email_template
+    
+    # Skip already sent invoices
+    jobs, failed_invoices = invoice_jobs([inv for inv in invoices if not inv.get('sent', False)],
+                                         email_mapping, render, shared_attachments)
+    
+    # Validate email configuration
+    settings = get_smtp_settings()
+    if jobs and not all([settings['server'], settings['port'], settings['username'], settings['password'], settings['sender']]):
+        results = [{'success': False, 'error': "Email configuration is incomplete. Please check settings."}] * len(jobs)
+    else:
+        results = EmailPipeline(settings).run(jobs)
+    
+    success_count = 0
+    for job, result in zip(jobs, results):
+        if result['success']:
             success_count += 1
-            invoice['sent'] = True
+            job['invoice']['sent'] = True
         else:
-            fail_count += 1
             failed_invoices.append({
-                'invoice_number': invoice['invoice_number'],
-                'partner': invoice['partner'],
-                'error': message
+                'invoice_number': job['invoice']['invoice_number'],
+                'partner': job['invoice']['partner'],
+                'error': result['error']
             })
     
-    return success_count, fail_count, failed_invoices
+    return success_count, len(failed_invoices), failed_invoices
@@ -0,0 +1,413 @@
+import html
+import re
+from functools import lru_cache
+from string import Template as _LabelTemplate
+
+import pandas as pd
+
+# Languages with a built-in invoice email
+LANGUAGES = {
+    'en': "English",
+    'pt': "Português",
+    'es': "Español",
+}
+DEFAULT_LANGUAGE = 'en'
+
+# Language used when the partner has none set (keys are lower-case country names and codes)
+COUNTRY_LANGUAGES = {
+    'brazil': 'pt', 'brasil': 'pt', 'bra': 'pt', 'br': 'pt',
+    'portugal': 'pt', 'prt': 'pt',
+    'mexico': 'es', 'méxico': 'es', 'mex': 'es', 'mx': 'es',
+    'spain': 'es', 'españa': 'es', 'esp': 'es', 'es': 'es',
+    'argentina': 'es', 'arg': 'es',
+    'colombia': 'es', 'col': 'es',
+    'chile': 'es', 'chl': 'es',
+    'peru': 'es', 'perú': 'es', 'per': 'es',
+}
+
+# Variables available to invoice email templates
+TEMPLATE_VARIABLES = ['invoice_number', 'partner', 'country', 'month_name', 'year', 'currency',
+                      'total_amount', 'created_at', 'due_date']
+
+# Month names per language (invoice periods are rendered in the email language)
+MONTH_NAMES = {
+    'en': ["January", "February", "March", "April", "May", "June",
+           "July", "August", "September", "October", "November", "December"],
+    'pt': ["janeiro", "fevereiro", "março", "abril", "maio", "junho",
+           "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"],
+    'es': ["enero", "febrero", "marzo", "abril", "mayo", "junio",
+           "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"],
+}
+
+# Thousands and decimal separators used by the money filter
+NUMBER_SEPARATORS = {
+    'en': (",", "."),
+    'pt': (".", ","),
+    'es': (".", ","),
+}
+
+# Format used by the date filter when no format is given
+DATE_FORMATS = {
+    'en': "%Y-%m-%d",
+    'pt': "%d/%m/%Y",
+    'es': "%d/%m/%Y",
+}
+
+# Days between invoice generation and due date
+PAYMENT_TERM_DAYS = 30
+
+# Rendered emails kept for page reruns and retries
+RENDER_CACHE_SIZE = 1024
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(.*?)\s*\}\}', re.DOTALL)
+_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+class TemplateError(ValueError):
+    """
+    Template has invalid syntax, an unknown filter or an unknown variable
+    """
+
+def _format_money(value, arg=None, language=DEFAULT_LANGUAGE):
+    thousands, decimal = NUMBER_SEPARATORS.get(language, NUMBER_SEPARATORS[DEFAULT_LANGUAGE])
+    return f"{float(value):,.2f}".translate(str.maketrans({",": thousands, ".": decimal}))
+
+def _format_date(value, arg=None, language=DEFAULT_LANGUAGE):
+    if value is None or value == "":
+        return ""
+    return pd.Timestamp(value).strftime(arg or DATE_FORMATS.get(language, DATE_FORMATS[DEFAULT_LANGUAGE]))
+
+# Filters are called as function(value, argument, language)
+FILTERS = {
+    'money': _format_money,
+    'date': _format_date,
+    'upper': lambda value, arg=None, language=None: str(value).upper(),
+    'lower': lambda value, arg=None, language=None: str(value).lower(),
+    'title': lambda value, arg=None, language=None: str(value).title(),
+    'default': lambda value, arg=None, language=None: value if value not in (None, "") else (arg or ""),
+}
+
+def _parse_filter(text):
+    name, _, arg = text.partition(':')
+    name = name.strip()
+    arg = arg.strip()
+    if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in '"\'':
+        arg = arg[1:-1]
+    if name != 'safe' and name not in FILTERS:
+        raise TemplateError(f"Unknown template filter: {name}")
+    return name, arg or None
+
+class Template:
+    """
+    Template compiled once into literal text and placeholder slots
+
+    Placeholders use the Jinja-style syntax {{ variable }} or
+    {{ variable|filter }} / {{ variable|filter:"argument" }}. In HTML
+    templates values are escaped unless the safe filter is applied.
+    """
+
+    def __init__(self, source, html_output=False):
+        self.source = source
+        self.html_output = html_output
+        self._parts = []
+        self.variables = set()
+
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            if match.start() > position:
+                self._parts.append(source[position:match.start()])
+            name, *filters = [part.strip() for part in match.group(1).split('|')]
+            if not _NAME.match(name):
+                raise TemplateError(f"Invalid template placeholder: {match.group(0)}")
+            filters = [_parse_filter(text) for text in filters]
+            escape = html_output and not any(filter_name == 'safe' for filter_name, _ in filters)
+            self._parts.append((name, [(FILTERS[filter_name], arg) for filter_name, arg in filters
+                                       if filter_name != 'safe'], escape))
+            self.variables.add(name)
+            position = match.end()
+        if position < len(source):
+            self._parts.append(source[position:])
+
+    def render(self, context, language=DEFAULT_LANGUAGE):
+        """
+        Render the template
+
+        Parameters:
+        - context: Dictionary with the template variables
+        - language: Language of the money and date filters
+
+        Returns:
+        - str: Rendered text
+        """
+        output = []
+        for part in self._parts:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+
+            name, filters, escape = part
+            try:
+                value = context[name]
+            except KeyError:
+                raise TemplateError(f"Unknown template variable: {name}") from None
+            try:
+                for function, arg in filters:
+                    value = function(value, arg, language)
+            except (TypeError, ValueError) as e:
+                raise TemplateError(f"Cannot format {name}: {e}") from e
+            value = "" if value is None else str(value)
+            output.append(html.escape(value) if escape else value)
+        return "".join(output)
+
+@lru_cache(maxsize=64)
+def compile_template(source, html_output=False):
+    """
+    Compile a template (each distinct source is compiled once per process)
+
+    Returns:
+    - Template
+    """
+    return Template(source, html_output)
+
+_SUBJECTS = {
+    'en': "Invoice {{ invoice_number }} - {{ month_name }} {{ year }}",
+    'pt': "Fatura {{ invoice_number }} - {{ month_name }} de {{ year }}",
+    'es': "Factura {{ invoice_number }} - {{ month_name }} de {{ year }}",
+}
+
+_LABELS = {
+    'en': {
+        'title': "Invoice", 'greeting': "Dear", 'of': "",
+        'intro': "Please find attached your invoice for",
+        'number': "Invoice Number", 'period': "Period", 'total': "Total Amount", 'due': "Due Date",
+        'questions': "For any questions regarding this invoice, please reply to this email or contact our accounting department.",
+        'thanks': "Thank you for your business.", 'regards': "Best regards",
+        'department': "Accounting Department", 'rights': "All rights reserved.",
+    },
+    'pt': {
+        'title': "Fatura", 'greeting': "Prezado(a)", 'of': " de",
+        'intro': "Segue em anexo a sua fatura referente a",
+        'number': "Número da Fatura", 'period': "Período", 'total': "Valor Total", 'due': "Vencimento",
+        'questions': "Em caso de dúvidas sobre esta fatura, responda a este e-mail ou entre em contato com o nosso departamento financeiro.",
+        'thanks': "Agradecemos a parceria.", 'regards': "Atenciosamente",
+        'department': "Departamento Financeiro", 'rights': "Todos os direitos reservados.",
+    },
+    'es': {
+        'title': "Factura", 'greeting': "Estimado(a)", 'of': " de",
+        'intro': "Adjuntamos su factura correspondiente a",
+        'number': "Número de Factura", 'period': "Período", 'total': "Importe Total", 'due': "Vencimiento",
+        'questions': "Si tiene preguntas sobre esta factura, responda a este correo o contacte a nuestro departamento de contabilidad.",
+        'thanks': "Gracias por su confianza.", 'regards': "Saludos cordiales",
+        'department': "Departamento de Contabilidad", 'rights': "Todos los derechos reservados.",
+    },
+}
+
+_BODY_LAYOUT = _LabelTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="background-color: #4A1F60; color: white; padding: 15px; text-align: center;">
+                <h2>$title {{ invoice_number }}</h2>
+            </div>
+
+            <div style="padding: 20px; border: 1px solid #ddd; border-top: none;">
+                <p>$greeting {{ partner }},</p>
+
+                <p>$intro {{ month_name }}$of {{ year }}.</p>
+
+                <div style="background-color: #f9f9f9; padding: 15px; margin: 20px 0; border-left: 4px solid #4A1F60;">
+                    <p><strong>$number:</strong> {{ invoice_number }}</p>
+                    <p><strong>$period:</strong> {{ month_name }}$of {{ year }}</p>
+                    <p><strong>$total:</strong> {{ currency }} {{ total_amount|money }}</p>
+                    <p><strong>$due:</strong> {{ due_date|date }}</p>
+                </div>
+
+                <p>$questions</p>
+
+                <p>$thanks</p>
+
+                <p>$regards,<br>
+                Your Company Name<br>
+                $department</p>
+            </div>
+
+            <div style="text-align: center; padding: 10px; font-size: 12px; color: #777;">
+                <p>© 2023 Your Company Name. $rights</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """)
+
+# Built-in template sources per language
+DEFAULT_TEMPLATES = {
+    language: {'subject': _SUBJECTS[language], 'body': _BODY_LAYOUT.substitute(_LABELS[language])}
+    for language in LANGUAGES
+}
+
+def default_templates(language=DEFAULT_LANGUAGE):
+    """
+    Get the built-in subject and body template sources for a language
+
+    Returns:
+    - dict: Contains subject and body template sources
+    """
+    return dict(DEFAULT_TEMPLATES.get(language) or DEFAULT_TEMPLATES[DEFAULT_LANGUAGE])
+
+def invoice_language(invoice, directory=None):
+    """
+    Get the email language for an invoice
+
+    The partner's language in the partner directory is used when set,
+    otherwise the language of the invoice country.
+
+    Parameters:
+    - invoice: Invoice dictionary
+    - directory: Partner directory (default: get_partner_directory())
+
+    Returns:
+    - str: Language code (key of LANGUAGES)
+    """
+    if directory is None:
+        from utils.partner_directory import get_partner_directory
+        directory = get_partner_directory()
+
+    language = directory.language(invoice['partner'])
+    if language in LANGUAGES:
+        return language
+    return COUNTRY_LANGUAGES.get(str(invoice.get('country', '')).strip().lower(), DEFAULT_LANGUAGE)
+
+def _month_name(invoice, language):
+    """
+    Get the name of the invoice month in a language (the invoice's own name if the month is unknown)
+    """
+    month_name = invoice.get('month_name', '')
+    month = invoice.get('month')
+    if month is None or month == "" or pd.isna(month):
+        english = [name.lower() for name in MONTH_NAMES['en']]
+        if str(month_name).strip().lower() not in english:
+            return month_name
+        month = english.index(str(month_name).strip().lower()) + 1
+    names = MONTH_NAMES.get(language, MONTH_NAMES[DEFAULT_LANGUAGE])
+    return names[int(month) - 1]
+
+def invoice_context(invoice, language=DEFAULT_LANGUAGE):
+    """
+    Get the template variables of an invoice
+
+    Parameters:
+    - invoice: Invoice dictionary
+    - language: Language of the month name
+
+    Returns:
+    - dict: Values for TEMPLATE_VARIABLES
+    """
+    created_at = invoice.get('created_at')
+    due_date = None
+    if created_at is not None and created_at != "":
+        due_date = pd.Timestamp(created_at) + pd.Timedelta(days=PAYMENT_TERM_DAYS)
+    return {
+        'invoice_number': invoice['invoice_number'],
+        'partner': invoice['partner'],
+        'country': invoice.get('country', ''),
+        'month_name': _month_name(invoice, language),
+        'year': invoice.get('year', ''),
+        'currency': invoice.get('currency', ''),
+        'total_amount': invoice.get('total_amount', 0.0),
+        'created_at': created_at,
+        'due_date': due_date,
+    }
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(subject_source, body_source, context_items, language):
+    context = dict(context_items)
+    return (compile_template(subject_source).render(context, language),
+            compile_template(body_source, html_output=True).render(context, language))
+
+def render_invoice_email(invoice, overrides=None, language=None):
+    """
+    Render the email for an invoice in the partner's language
+
+    Parameters:
+    - invoice: Invoice dictionary
+    - overrides: Dictionary language -> {'subject', 'body'} with edited template sources
+    - language: Force a language instead of invoice_language(invoice)
+
+    Returns:
+    - dict: Contains subject, body and language
+    """
+    language = language or invoice_language(invoice)
+    sources = (overrides or {}).get(language) or DEFAULT_TEMPLATES.get(language) or DEFAULT_TEMPLATES[DEFAULT_LANGUAGE]
+    context_items = tuple(invoice_context(invoice, language).items())
+    subject, body = _render(sources['subject'], sources['body'], context_items, language)
+    return {'subject': subject, 'body': body, 'language': language}
+
+def render_batch(invoices, overrides=None):
+    """
+    Render the emails for several invoices
+
+    Template errors are raised before anything is returned, so a batch is
+    either rendered completely or not at all.
+
+    Returns:
+    - list: Dictionaries with subject, body and language, in invoice order
+    """
+    from utils.partner_directory import get_partner_directory
+
+    directory = get_partner_directory()
+    languages = {}
+    rendered = []
+    for invoice in invoices:
+        key = (invoice['partner'], invoice.get('country'))
+        if key not in languages:
+            languages[key] = invoice_language(invoice, directory)
+        rendered.append(render_invoice_email(invoice, overrides, languages[key]))
+    return rendered
+
+def make_renderer(overrides=None):
+    """
+    Get a function invoice -> {'subject', 'body'} that applies the edited templates
+    """
+    overrides = {language: dict(sources) for language, sources in (overrides or {}).items()}
+
+    def render(invoice):
+        return render_invoice_email(invoice, overrides)
+
+    return render
+
+def validate_template(subject_source, body_source, invoices=None, language=DEFAULT_LANGUAGE):
+    """
+    Check that edited template sources compile and only use known variables
+
+    Filters can still fail on actual values (e.g. {{ partner|money }}), so
+    the templates are also rendered for the given invoices.
+
+    Parameters:
+    - subject_source, body_source: Edited template sources
+    - invoices: Invoices the templates will be rendered for
+    - language: Language the templates are rendered in
+
+    Returns:
+    - list: Error messages (empty if valid)
+    """
+    errors = []
+    templates = []
+    for label, source, html_output in (("Subject", subject_source, False), ("Body", body_source, True)):
+        try:
+            template = compile_template(source, html_output)
+        except TemplateError as e:
+            errors.append(f"{label}: {e}")
+            continue
+        unknown = sorted(template.variables - set(TEMPLATE_VARIABLES))
+        if unknown:
+            errors.append(f"{label}: unknown variables {', '.join(unknown)}")
+        else:
+            templates.append((label, template))
+
+    for label, template in templates:
+        for invoice in invoices or []:
+            try:
+                template.render(invoice_context(invoice, language), language)
+            except TemplateError as e:
+                errors.append(f"{label}: {e} (invoice {invoice['invoice_number']})")
+                break
+    return errors
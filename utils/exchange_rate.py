@@ -2,11 +2,56 @@ import pandas as pd
 import requests
 from datetime import datetime, timedelta
 import streamlit as st
+from utils.cache import EXCHANGE_RATE_NAMESPACE, cached_data, cached_resource
+
+# URL da API PTAX do Banco Central
+PTAX_URL = "https://olinda.bcb.gov.br/olinda/servico/PTAX/versao/v1/odata/CotacaoDolarDia(dataCotacao=@dataCotacao)?@dataCotacao='{date}'&$format=json"
+
+# Dias anteriores consultados quando não há cotação na data (fins de semana e feriados)
+PTAX_LOOKBACK_DAYS = 5
+
+# Cotações com menos dias que isto podem ainda não ter sido publicadas (cache curto)
+RECENT_QUOTE_DAYS = 7
+
+@cached_resource(EXCHANGE_RATE_NAMESPACE)
+def _http_session():
+    # Sessão HTTP compartilhada pelo processo (reaproveita conexões)
+    return requests.Session()
+
+def _fetch_ptax(date):
+    """
+    Consulta a cotação de venda do dólar na data ou nos dias anteriores
+
+    Erros de rede são propagados (e não ficam em cache).
+    """
+    for i in range(PTAX_LOOKBACK_DAYS + 1):
+        query_date = date - timedelta(days=i)
+        response = _http_session().get(PTAX_URL.format(date=query_date.strftime('%m-%d-%Y')), timeout=15)
+        data = response.json()
+        
+        if 'value' in data and len(data['value']) > 0:
+            # Retorna a cotação de fechamento (venda)
+            return float(data['value'][0]['cotacaoVenda'])
+    
+    # Se não encontrar em nenhum dos dias anteriores
+    return None
+
+@cached_data(EXCHANGE_RATE_NAMESPACE, ttl=None, max_entries=1024)
+def _historical_ptax(date_str):
+    # Cotações antigas não mudam: ficam em cache até serem invalidadas
+    return _fetch_ptax(datetime.strptime(date_str, '%Y-%m-%d'))
+
+@cached_data(EXCHANGE_RATE_NAMESPACE, max_entries=64)
+def _recent_ptax(date_str):
+    # Cotações recentes podem ser publicadas depois: cache com tempo de vida do namespace
+    return _fetch_ptax(datetime.strptime(date_str, '%Y-%m-%d'))
 
 def get_bc_exchange_rate(date=None):
     """
     Obtém a taxa de câmbio (BRL/USD) do Banco Central para uma data específica
     
+    O resultado fica em cache compartilhado entre as sessões.
+    
     Parâmetros:
     - date: Data para consulta (datetime ou string no formato 'YYYY-MM-DD'). Se None, usa a data atual.
     
@@ -20,34 +65,10 @@ def get_bc_exchange_rate(date=None):
         elif isinstance(date, str):
             date = datetime.strptime(date, '%Y-%m-%d')
         
-        # Formatar data para o formato esperado pela API
-        date_str = date.strftime('%m-%d-%Y')
-        
-        # URL da API do Banco Central
-        url = f"https://olinda.bcb.gov.br/olinda/servico/PTAX/versao/v1/odata/CotacaoDolarDia(dataCotacao=@dataCotacao)?@dataCotacao='{date_str}'&$format=json"
-        
-        # Fazer a requisição
-        response = requests.get(url)
-        data = response.json()
-        
-        # Verificar se há valores
-        if 'value' in data and len(data['value']) > 0:
-            # Retorna a cotação de fechamento (venda)
-            return float(data['value'][0]['cotacaoVenda'])
-        else:
-            # Se não há cotação para a data fornecida, tenta o dia anterior (até 5 dias)
-            for i in range(1, 6):
-                prev_date = date - timedelta(days=i)
-                prev_date_str = prev_date.strftime('%m-%d-%Y')
-                url = f"https://olinda.bcb.gov.br/olinda/servico/PTAX/versao/v1/odata/CotacaoDolarDia(dataCotacao=@dataCotacao)?@dataCotacao='{prev_date_str}'&$format=json"
-                response = requests.get(url)
-                data = response.json()
-                
-                if 'value' in data and len(data['value']) > 0:
-                    return float(data['value'][0]['cotacaoVenda'])
-            
-            # Se não encontrar em nenhum dos dias anteriores
-            return None
+        date_str = date.strftime('%Y-%m-%d')
+        if (datetime.now().date() - datetime.strptime(date_str, '%Y-%m-%d').date()).days > RECENT_QUOTE_DAYS:
+            return _historical_ptax(date_str)
+        return _recent_ptax(date_str)
     
     except Exception as e:
         st.error(f"Erro ao obter taxa de câmbio: {str(e)}")
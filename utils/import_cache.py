@@ -0,0 +1,222 @@
+import hashlib
+import io
+import json
+from datetime import datetime
+
+import streamlit as st
+
+from utils.config_store import ConfigStoreError, read_json, update_json
+from utils.data_processor import load_country_settings, process_data
+from utils import dataset_store
+from utils.jobs import register_job
+from utils.readers import read_sales_file
+
+# Índice das importações já processadas (chave -> metadados)
+IMPORT_CACHE_FILE = "data/import_cache.json"
+
+# Tipo da tarefa de processamento executada em segundo plano
+PROCESS_SALES_JOB = "process_sales"
+
+def settings_version():
+    """
+    Retorna a versão das configurações dos países (hash do conteúdo)
+
+    Alterar taxas, moedas ou câmbio muda a versão e invalida as importações
+    processadas com as configurações anteriores.
+
+    Retorna:
+    - str: Versão (12 caracteres hexadecimais)
+    """
+    content = json.dumps(load_country_settings(), sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+
+def file_hash(file_bytes):
+    """
+    Retorna o hash SHA-256 do conteúdo do arquivo
+    """
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def compute_import_key(file_bytes, version=None):
+    """
+    Calcula a chave da importação: hash do arquivo + versão das configurações
+
+    Parâmetros:
+    - file_bytes: Conteúdo do arquivo enviado
+    - version: Versão das configurações (padrão: versão atual)
+
+    Retorna:
+    - str: Chave da importação
+    """
+    return f"{file_hash(file_bytes)}:{version or settings_version()}"
+
+def _load_index():
+    try:
+        return read_json(IMPORT_CACHE_FILE, {})
+    except (OSError, ConfigStoreError):
+        return {}
+
+def _add_to_index(key, entry):
+    # Leitura e gravação sob o mesmo bloqueio: importações simultâneas não se sobrescrevem
+    update_json(IMPORT_CACHE_FILE, lambda index: {**index, key: entry}, {})
+
+@st.cache_resource(show_spinner=False)
+def _memory_results():
+    # Resultados processados mantidos em memória quando não há armazenamento em Parquet
+    return {}
+
+def _periods(df):
+    """
+    Retorna os períodos (ano, mês, país) presentes nos dados processados
+    """
+    periods = df[['Year', 'Month', 'Country']].drop_duplicates()
+    return sorted([int(year), int(month), str(country)] for year, month, country in periods.itertuples(index=False))
+
+def lookup_import(key):
+    """
+    Busca uma importação já processada com a mesma chave
+
+    Parâmetros:
+    - key: Chave da importação (compute_import_key)
+
+    Retorna:
+    - dict ou None: Metadados da importação (file_name, dataset_id, rows, periods, imported_at)
+    """
+    entry = _load_index().get(key)
+    if entry is None:
+        return None
+
+    # O resultado precisa continuar disponível (Parquet ou memória)
+    if entry.get('dataset_id'):
+        if dataset_store.load_manifest(entry['dataset_id']) is None:
+            return None
+    elif key not in _memory_results():
+        return None
+
+    return entry
+
+def load_import_result(key, entry):
+    """
+    Publica na sessão o resultado de uma importação em cache, sem reprocessar
+
+    Parâmetros:
+    - key: Chave da importação
+    - entry: Metadados retornados por lookup_import
+    """
+    if entry.get('dataset_id'):
+        st.session_state.imported_dataset_id = entry['dataset_id']
+        st.session_state.imported_data = None
+    else:
+        st.session_state.imported_data = _memory_results()[key]
+
+def register_import(key, file_name, processed_df, dataset_id=None):
+    """
+    Registra o resultado processado de um arquivo no cache de importações
+
+    Parâmetros:
+    - key: Chave da importação
+    - file_name: Nome do arquivo enviado
+    - processed_df: DataFrame processado
+    - dataset_id: Identificador do conjunto em Parquet (None se não disponível)
+
+    Retorna:
+    - dict: Metadados registrados
+    """
+    entry = {
+        'file_name': file_name,
+        'file_hash': key.split(':', 1)[0],
+        'settings_version': key.split(':', 1)[1],
+        'dataset_id': dataset_id,
+        'rows': len(processed_df),
+        'periods': _periods(processed_df),
+        'imported_at': datetime.now().isoformat()
+    }
+
+    if dataset_id is None:
+        _memory_results()[key] = processed_df
+
+    _add_to_index(key, entry)
+    return entry
+
+def find_overlaps(entry):
+    """
+    Encontra outros arquivos importados que cobrem os mesmos períodos
+
+    Arquivos idênticos (mesmo hash) não são considerados sobreposição.
+
+    Parâmetros:
+    - entry: Metadados da importação
+
+    Retorna:
+    - list: [{'file_name', 'imported_at', 'periods': [(ano, mês, país), ...]}]
+    """
+    own_periods = {tuple(period) for period in entry.get('periods', [])}
+    overlaps = {}
+
+    for other in _load_index().values():
+        if other.get('file_hash') == entry.get('file_hash'):
+            continue
+        shared = own_periods & {tuple(period) for period in other.get('periods', [])}
+        if not shared:
+            continue
+
+        # Um mesmo arquivo pode ter sido processado com várias versões de configuração
+        current = overlaps.setdefault(other['file_hash'], {
+            'file_name': other.get('file_name'),
+            'imported_at': other.get('imported_at'),
+            'periods': set()
+        })
+        current['periods'] |= shared
+        current['imported_at'] = max(current['imported_at'] or '', other.get('imported_at') or '')
+
+    return [dict(item, periods=sorted(item['periods'])) for item in overlaps.values()]
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def parse_upload(digest, _file_bytes, file_name=None):
+    """
+    Lê o arquivo Excel enviado uma única vez por conteúdo (reruns reutilizam o resultado)
+
+    Apenas as colunas usadas pela importação são lidas, com o motor mais
+    rápido disponível (utils.readers).
+
+    Parâmetros:
+    - digest: Hash do arquivo (file_hash), usado como chave do cache
+    - _file_bytes: Conteúdo do arquivo (não entra no hash do cache)
+    - file_name: Nome do arquivo (define o formato: .xlsx ou .xls)
+
+    Retorna:
+    - DataFrame com os dados brutos
+    """
+    return read_sales_file(io.BytesIO(_file_bytes), file_name or 'upload.xlsx')
+
+@register_job(PROCESS_SALES_JOB)
+def process_sales_job(payload, context):
+    """
+    Tarefa em segundo plano: calcula os valores, publica o conjunto em Parquet
+    e registra a importação no cache
+
+    O registro é feito pela própria tarefa, de modo que a importação fica
+    disponível mesmo se a página for recarregada antes do fim.
+
+    Parâmetros:
+    - payload: {'data': DataFrame validado, 'settings': configurações dos países,
+      'import_key': chave da importação, 'file_name': nome do arquivo}
+    - context: JobContext da tarefa
+
+    Retorna:
+    - dict: {'data': DataFrame processado, 'dataset_id': identificador ou None,
+      'entry': metadados registrados ou None}
+    """
+    context.progress(0.05, "Calculando royalties, fundo de publicidade e impostos...")
+    processed_df = process_data(payload['data'], payload['settings'])
+
+    dataset_id = None
+    if dataset_store.is_available():
+        context.progress(0.7, "Salvando conjunto de dados...")
+        dataset_id = dataset_store.save_dataset(processed_df)
+
+    entry = None
+    if payload.get('import_key'):
+        context.progress(0.95, "Registrando importação...")
+        entry = register_import(payload['import_key'], payload.get('file_name'), processed_df, dataset_id)
+
+    return {'data': processed_df, 'dataset_id': dataset_id, 'entry': entry}
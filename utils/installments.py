@@ -0,0 +1,138 @@
+import numpy as np
+from utils.money import to_minor, from_minor, currency_exponents
+
+# Modos de distribuição do valor entre as parcelas
+DISTRIBUTION_EQUAL = "Iguais"
+DISTRIBUTION_PERCENT = "Percentual"
+
+# Prazos padrão (em dias)
+DEFAULT_FIRST_DUE_DAYS = 30
+DEFAULT_DAYS_BETWEEN = 30
+
+def installment_weights(num_installments, distribution=DISTRIBUTION_EQUAL, percentages=None):
+    """
+    Retorna a fração do total correspondente a cada parcela
+
+    No modo percentual a última parcela absorve a diferença para 100%,
+    como já acontecia no ajuste manual das porcentagens.
+
+    Parâmetros:
+    - num_installments: Número de parcelas
+    - distribution: "Iguais" ou "Percentual"
+    - percentages: Lista de porcentagens por parcela (modo percentual)
+
+    Retorna:
+    - np.ndarray: Frações (float64) com uma posição por parcela
+    """
+    num_installments = int(num_installments)
+    if num_installments < 1:
+        raise ValueError("O número de parcelas deve ser pelo menos 1.")
+
+    if distribution == DISTRIBUTION_PERCENT and percentages is not None:
+        weights = np.asarray(percentages, dtype=np.float64)[:num_installments] / 100.0
+        if len(weights) < num_installments:
+            raise ValueError("Informe uma porcentagem para cada parcela.")
+    else:
+        weights = np.full(num_installments, 1.0 / num_installments)
+
+    weights[-1] = 1.0 - weights[:-1].sum()
+    return weights
+
+def build_installment_schedule(totals, start_dates, num_installments,
+                               first_due_days=DEFAULT_FIRST_DUE_DAYS,
+                               days_between=DEFAULT_DAYS_BETWEEN,
+                               distribution=DISTRIBUTION_EQUAL, percentages=None, currency=None):
+    """
+    Gera o plano de parcelamento de um lote de faturas em uma única operação vetorizada
+
+    Os valores são calculados em unidades menores inteiras da moeda (centavos):
+    cada parcela recebe o valor truncado da sua fração e o resto do
+    arredondamento vai para a última parcela, de modo que a soma das parcelas
+    é sempre igual ao total.
+
+    Parâmetros:
+    - totals: Valores totais das faturas (sequência ou array)
+    - start_dates: Data base de cada fatura (ou uma única data para todas)
+    - num_installments: Número de parcelas
+    - first_due_days: Dias entre a data base e o vencimento da primeira parcela
+    - days_between: Dias entre parcelas consecutivas
+    - distribution: "Iguais" ou "Percentual"
+    - percentages: Lista de porcentagens por parcela (modo percentual)
+    - currency: Moeda de cada fatura (ou uma única moeda para todas)
+
+    Retorna:
+    - dict: {'due_dates': datetime64[D] (faturas x parcelas),
+             'amounts_cents': int64 (faturas x parcelas),
+             'amounts': float64 (faturas x parcelas)}
+    """
+    weights = installment_weights(num_installments, distribution, percentages)
+
+    totals_cents = np.atleast_1d(to_minor(totals, currency))
+
+    # Parcelas truncadas (após descartar o ruído de ponto flutuante); o resto fica na última
+    amounts_cents = np.floor(np.round(totals_cents[:, None] * weights[None, :-1], 6)).astype(np.int64)
+    last = totals_cents - amounts_cents.sum(axis=1)
+    amounts_cents = np.concatenate([amounts_cents, last[:, None]], axis=1)
+
+    start_dates = np.broadcast_to(np.asarray(start_dates, dtype='datetime64[D]'), totals_cents.shape)
+    offsets = (int(first_due_days) + np.arange(len(weights)) * int(days_between)).astype('timedelta64[D]')
+    due_dates = start_dates[:, None] + offsets[None, :]
+
+    return {
+        'due_dates': due_dates,
+        'amounts_cents': amounts_cents,
+        'amounts': _amounts_from_minor(amounts_cents, currency)
+    }
+
+def _amounts_from_minor(amounts_cents, currency):
+    if currency is None or isinstance(currency, str):
+        return from_minor(amounts_cents, currency)
+    # Uma moeda por fatura: expoente aplicado a cada linha por broadcast
+    return amounts_cents / np.power(10.0, currency_exponents(currency))[:, None]
+
+def schedule_to_installments(schedule, row=0):
+    """
+    Converte uma linha do plano na lista de parcelas armazenada na fatura
+
+    Parâmetros:
+    - schedule: Resultado de build_installment_schedule
+    - row: Posição da fatura no lote
+
+    Retorna:
+    - list: [{'number', 'due_date' (date), 'amount'}, ...]
+    """
+    due_dates = schedule['due_dates'][row].astype(object)
+    amounts = schedule['amounts'][row].tolist()
+    return [
+        {'number': i + 1, 'due_date': due_date, 'amount': amount}
+        for i, (due_date, amount) in enumerate(zip(due_dates, amounts))
+    ]
+
+def attach_installments(invoices, start_date, config, percentages=None):
+    """
+    Calcula e anexa o plano de parcelamento a um lote de faturas
+
+    Parâmetros:
+    - invoices: Lista de dicionários de faturas (alterados in-place)
+    - start_date: Data base dos vencimentos (data de emissão)
+    - config: Configuração de parcelamento (num_installments, first_due_days, days_between, distribution)
+    - percentages: Lista de porcentagens por parcela (modo percentual)
+
+    Retorna:
+    - dict: Plano gerado (ver build_installment_schedule)
+    """
+    schedule = build_installment_schedule(
+        [invoice['total_amount'] for invoice in invoices],
+        start_date,
+        config['num_installments'],
+        first_due_days=config.get('first_due_days', DEFAULT_FIRST_DUE_DAYS),
+        days_between=config.get('days_between', DEFAULT_DAYS_BETWEEN),
+        distribution=config.get('distribution', DISTRIBUTION_EQUAL),
+        percentages=percentages,
+        currency=[invoice.get('currency') for invoice in invoices]
+    )
+
+    for row, invoice in enumerate(invoices):
+        invoice['installments'] = schedule_to_installments(schedule, row)
+
+    return schedule
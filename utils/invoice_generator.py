@@ -11,6 +11,7 @@ import io
 import pandas as pd
 from svglib.svglib import svg2rlg
 from utils.exchange_rate import get_bc_exchange_rate
+from utils.partner_directory import get_partner_directory
 
 def create_invoice_pdf(invoice_data):
     """
@@ -221,13 +222,18 @@ def create_invoice_pdf(invoice_data):
     country_code = invoice_data['country']
     country_name = country_names.get(country_code, country_code)
     
+    # Endereço de cobrança e identificação fiscal do cadastro de parceiros
+    partner_street, partner_city, partner_tax_id = get_partner_directory().billing_address_lines(invoice_data['partner'])
+    
     from_to_data = [
         ["De:", "Para:"],
         ["OAKBERRY AÇAI INC.", invoice_data['partner']],
-        ["120 NW 25th Street, Ste 202", "Endereço do Parceiro Linha 1"],
-        ["Miami, Florida 33127", "Cidade do Parceiro, Estado, CEP"],
+        ["120 NW 25th Street, Ste 202", partner_street],
+        ["Miami, Florida 33127", partner_city],
         ["United States", country_name]
     ]
+    if partner_tax_id:
+        from_to_data.append(["", partner_tax_id])
     
     from_to_table = Table(from_to_data, colWidths=[2.5*inch, 2.5*inch])
     from_to_table.setStyle(TableStyle([
@@ -0,0 +1,231 @@
+import math
+import pandas as pd
+import streamlit as st
+
+# Tamanho padrão de página e opções oferecidas ao usuário
+DEFAULT_PAGE_SIZE = 50
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+
+# Estilos das células de status (aplicados somente na página visível)
+STATUS_STYLES = {
+    "Liquidada": 'background-color: #d4edda; color: #155724',
+    "Paga": 'background-color: #d4edda; color: #155724',
+    "Paid": 'background-color: #d4edda; color: #155724',
+    "Vencida": 'background-color: #f8d7da; color: #721c24',
+    "A Vencer": 'background-color: #fff3cd; color: #856404',
+    "Parcialmente Paga": 'background-color: #fff3cd; color: #856404',
+}
+
+def highlight_status(val):
+    """
+    Retorna o estilo CSS da célula de status
+    """
+    return STATUS_STYLES.get(val, '')
+
+def _state_key(key, name):
+    return f"grid_{key}_{name}"
+
+def filter_records(records, query, search_fields):
+    """
+    Filtra registros cujo texto de algum dos campos contém a consulta
+
+    Parâmetros:
+    - records: Lista de dicionários ou DataFrame
+    - query: Texto a buscar (sem diferenciar maiúsculas/minúsculas)
+    - search_fields: Campos (ou colunas) onde buscar
+
+    Retorna:
+    - Lista ou DataFrame filtrado
+    """
+    query = (query or '').strip().lower()
+    if not query or not search_fields:
+        return records
+
+    if isinstance(records, pd.DataFrame):
+        mask = pd.Series(False, index=records.index)
+        for field in search_fields:
+            if field in records.columns:
+                mask |= records[field].astype(str).str.lower().str.contains(query, regex=False)
+        return records[mask]
+
+    return [
+        record for record in records
+        if any(query in str(record.get(field, '')).lower() for field in search_fields)
+    ]
+
+def sort_records(records, sort_key, ascending=True):
+    """
+    Ordena registros no servidor
+
+    Parâmetros:
+    - records: Lista de dicionários ou DataFrame
+    - sort_key: Função que extrai a chave de ordenação (lista) ou nome da coluna (DataFrame)
+    - ascending: Ordem crescente
+
+    Retorna:
+    - Lista ou DataFrame ordenado
+    """
+    if sort_key is None:
+        return records
+
+    if isinstance(records, pd.DataFrame):
+        return records.sort_values(sort_key, ascending=ascending, kind='stable')
+
+    # Valores ausentes sempre no fim, em qualquer ordem (mantêm a ordem original)
+    keyed = [(sort_key(record), record) for record in records]
+    present = [item for item in keyed if item[0] is not None]
+    missing = [record for value, record in keyed if value is None]
+    present.sort(key=lambda item: item[0], reverse=not ascending)
+    return [record for _, record in present] + missing
+
+def paginate(records, page, page_size):
+    """
+    Retorna a fatia correspondente à página solicitada
+
+    Parâmetros:
+    - records: Lista de dicionários ou DataFrame
+    - page: Número da página (começando em 1)
+    - page_size: Quantidade de registros por página
+
+    Retorna:
+    - tuple: (registros_da_página, página_ajustada, total_de_páginas)
+    """
+    total_pages = max(1, math.ceil(len(records) / page_size))
+    page = min(max(1, page), total_pages)
+    start = (page - 1) * page_size
+
+    if isinstance(records, pd.DataFrame):
+        return records.iloc[start:start + page_size], page, total_pages
+    return records[start:start + page_size], page, total_pages
+
+def _build_page_frame(page_records, columns):
+    """
+    Monta o DataFrame de exibição apenas para os registros da página
+    """
+    if isinstance(page_records, pd.DataFrame):
+        return page_records.reset_index(drop=True)
+    return pd.DataFrame([
+        {label: build(record) for label, build in columns.items()}
+        for record in page_records
+    ], columns=list(columns))
+
+def render_invoice_grid(records, key, columns=None, sort_options=None, search_fields=None,
+                        styled_columns=None, id_field='invoice_number', selectable=False,
+                        column_config=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Renderiza uma tabela paginada com ordenação e filtro no servidor
+
+    Apenas a página visível é formatada, estilizada e enviada ao navegador,
+    de modo que o payload de cada rerun é limitado independentemente do
+    tamanho da carteira.
+
+    Parâmetros:
+    - records: Lista de dicionários (faturas, pagamentos) ou DataFrame
+    - key: Chave única da tabela na página
+    - columns: Dicionário {rótulo: função(registro)} com as colunas de exibição (apenas para listas)
+    - sort_options: Dicionário {rótulo: função(registro)} para listas, ou lista de colunas para DataFrames
+    - search_fields: Campos onde o filtro de texto busca (None desativa o filtro)
+    - styled_columns: Colunas de status a destacar com highlight_status
+    - id_field: Campo que identifica o registro (usado na seleção)
+    - selectable: Exibe uma coluna "Select" editável; a seleção é mantida entre páginas
+    - column_config: Configuração de colunas repassada ao Streamlit
+    - page_size: Tamanho inicial da página
+
+    Retorna:
+    - dict: {'records': registros da página, 'frame': DataFrame exibido/editado,
+             'selected': conjunto de ids selecionados, 'total': total após filtro}
+    """
+    is_frame = isinstance(records, pd.DataFrame)
+    if is_frame:
+        sort_options = {col: col for col in (sort_options or [])}
+    else:
+        sort_options = sort_options or {}
+
+    # Controles de filtro, ordenação e paginação
+    control_cols = st.columns([3, 2, 1, 1, 1])
+
+    with control_cols[0]:
+        query = st.text_input("Buscar", key=_state_key(key, 'query'),
+                              disabled=not search_fields,
+                              placeholder="Filtrar registros..." if search_fields else "")
+
+    with control_cols[1]:
+        sort_label = st.selectbox("Ordenar por", options=["(padrão)"] + list(sort_options),
+                                  key=_state_key(key, 'sort'))
+
+    with control_cols[2]:
+        ascending = st.selectbox("Ordem", options=["Asc", "Desc"], key=_state_key(key, 'order')) == "Asc"
+
+    with control_cols[3]:
+        page_size = st.selectbox("Por página", options=PAGE_SIZE_OPTIONS,
+                                 index=PAGE_SIZE_OPTIONS.index(page_size) if page_size in PAGE_SIZE_OPTIONS else 1,
+                                 key=_state_key(key, 'page_size'))
+
+    filtered = filter_records(records, query, search_fields)
+    ordered = sort_records(filtered, sort_options.get(sort_label), ascending)
+
+    # Volta para a primeira página quando filtro/ordenação mudam
+    signature = (query, sort_label, ascending, page_size, len(ordered))
+    page_key = _state_key(key, 'page')
+    if st.session_state.get(_state_key(key, 'signature')) != signature:
+        st.session_state[_state_key(key, 'signature')] = signature
+        st.session_state[page_key] = 1
+
+    total_pages = max(1, math.ceil(len(ordered) / page_size))
+    with control_cols[4]:
+        page = st.number_input("Página", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+    page_records, page, total_pages = paginate(ordered, int(page), page_size)
+    page_frame = _build_page_frame(page_records, columns)
+
+    start = (page - 1) * page_size
+    st.caption(f"Exibindo {start + 1 if len(ordered) else 0}–{start + len(page_frame)} "
+               f"de {len(ordered)} registros (página {page} de {total_pages})")
+
+    selection_key = _state_key(key, 'selected')
+    selected = st.session_state.setdefault(selection_key, set())
+
+    if selectable:
+        page_ids = (list(page_records[id_field]) if is_frame
+                    else [record.get(id_field) for record in page_records])
+        page_frame.insert(0, "Select", [record_id in selected for record_id in page_ids])
+
+        config = {"Select": st.column_config.CheckboxColumn("Select", default=False)}
+        config.update(column_config or {})
+        edited_frame = st.data_editor(
+            page_frame,
+            use_container_width=True,
+            column_config=config,
+            hide_index=True,
+            key=_state_key(key, f'editor_{page}')
+        )
+
+        # Atualiza a seleção persistente apenas com as linhas da página
+        for record_id, is_selected in zip(page_ids, edited_frame["Select"]):
+            if is_selected:
+                selected.add(record_id)
+            else:
+                selected.discard(record_id)
+
+        return {'records': page_records, 'frame': edited_frame, 'selected': selected, 'total': len(ordered)}
+
+    styled_columns = [col for col in (styled_columns or []) if col in page_frame.columns]
+    if styled_columns and not page_frame.empty:
+        display = page_frame.style.map(highlight_status, subset=styled_columns)
+    else:
+        display = page_frame
+
+    st.dataframe(display, use_container_width=True, hide_index=True, column_config=column_config)
+
+    return {'records': page_records, 'frame': page_frame, 'selected': selected, 'total': len(ordered)}
+
+def clear_grid_selection(key):
+    """
+    Limpa a seleção persistente de uma tabela
+    """
+    st.session_state[_state_key(key, 'selected')] = set()
+
+    # Descarta também as edições pendentes dos editores de cada página
+    editor_prefix = _state_key(key, 'editor_')
+    for state_key in [k for k in st.session_state.keys() if str(k).startswith(editor_prefix)]:
+        del st.session_state[state_key]
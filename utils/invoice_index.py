@@ -0,0 +1,376 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+import streamlit as st
+
+# Prazo padrão de vencimento (em dias após a criação) quando a fatura não define due_date
+DEFAULT_DUE_DAYS = 30
+
+# Status de vencimento utilizados nas páginas
+STATUS_A_VENCER = "A Vencer"
+STATUS_VENCIDA = "Vencida"
+STATUS_LIQUIDADA = "Liquidada"
+STATUS_NA = "N/A"
+
+def _to_date(value):
+    """
+    Converte datetime, date, Timestamp ou string (YYYY-MM-DD) para date
+
+    Retorna:
+    - date ou None se não for possível converter
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime().date()
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return None
+
+def get_due_date(invoice):
+    """
+    Retorna a data de vencimento da fatura
+
+    Usa 'due_date' quando definida (faturas manuais); caso contrário assume
+    30 dias após 'created_at'.
+
+    Parâmetros:
+    - invoice: Dicionário da fatura
+
+    Retorna:
+    - date ou None se a fatura não tiver datas
+    """
+    due_date = _to_date(invoice.get('due_date'))
+    if due_date is not None:
+        return due_date
+
+    created_date = _to_date(invoice.get('created_at'))
+    if created_date is None:
+        return None
+    return created_date + timedelta(days=DEFAULT_DUE_DAYS)
+
+def classify_due_status(invoice, today=None, due_date=None):
+    """
+    Classifica a fatura por status de vencimento
+
+    Parâmetros:
+    - invoice: Dicionário da fatura
+    - today: Data de referência (padrão: hoje)
+    - due_date: Data de vencimento já calculada (opcional)
+
+    Retorna:
+    - str: "Liquidada", "Vencida", "A Vencer" ou "N/A"
+    """
+    if invoice.get('paid', False):
+        return STATUS_LIQUIDADA
+
+    if due_date is None:
+        due_date = get_due_date(invoice)
+    if due_date is None:
+        return STATUS_NA
+
+    today = today or date.today()
+    return STATUS_VENCIDA if due_date < today else STATUS_A_VENCER
+
+def _trigrams(text):
+    """
+    Retorna o conjunto de trigramas (em minúsculas) de um texto
+    """
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class InvoiceAgingIndex:
+    """
+    Índice de vencimento das faturas
+
+    Mantém as faturas ordenadas por data de vencimento, os buckets de status
+    (A Vencer / Vencida / Liquidada) atualizados incrementalmente, conjuntos
+    por país e por master e um índice de trigramas para busca por número.
+    """
+
+    def __init__(self, invoices=None, today=None):
+        self._today = today or date.today()
+        self._by_number = {}
+        self._due_key = {}
+        self._due_order = []
+        self._status = {}
+        self._keys = {}
+        self._buckets = defaultdict(set)
+        self._by_country = defaultdict(set)
+        self._by_partner = defaultdict(set)
+        self._trigram_index = defaultdict(set)
+        self._source_id = None
+        self._source_len = 0
+
+        if invoices:
+            self.sync(invoices)
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def __contains__(self, invoice_number):
+        return invoice_number in self._by_number
+
+    def get(self, invoice_number):
+        """
+        Retorna a fatura pelo número (busca por hash) ou None
+        """
+        return self._by_number.get(invoice_number)
+
+    def add(self, invoice):
+        """
+        Adiciona uma fatura ao índice e atualiza seu 'due_status'
+        """
+        self._add(invoice, keep_sorted=True)
+
+    def _add(self, invoice, keep_sorted):
+        number = invoice.get('invoice_number', STATUS_NA)
+        if number in self._by_number:
+            self.remove(number)
+
+        due_date = get_due_date(invoice)
+        # Faturas sem data ficam no fim da ordenação
+        due_key = (due_date.toordinal() if due_date else float('inf'), number)
+        status = classify_due_status(invoice, self._today, due_date)
+        invoice['due_status'] = status
+
+        self._by_number[number] = invoice
+        self._due_key[number] = due_key
+        if keep_sorted:
+            bisect.insort(self._due_order, due_key)
+        else:
+            self._due_order.append(due_key)
+        self._status[number] = status
+        self._buckets[status].add(number)
+        # Guarda as chaves indexadas, pois a fatura pode ser editada in-place
+        country = invoice.get('country', STATUS_NA)
+        partner = invoice.get('partner', STATUS_NA)
+        self._keys[number] = (country, partner)
+        self._by_country[country].add(number)
+        self._by_partner[partner].add(number)
+        for trigram in _trigrams(number):
+            self._trigram_index[trigram].add(number)
+
+    def remove(self, invoice_number):
+        """
+        Remove uma fatura do índice
+        """
+        invoice = self._by_number.pop(invoice_number, None)
+        if invoice is None:
+            return
+
+        due_key = self._due_key.pop(invoice_number)
+        pos = bisect.bisect_left(self._due_order, due_key)
+        if pos < len(self._due_order) and self._due_order[pos] == due_key:
+            del self._due_order[pos]
+
+        self._buckets[self._status.pop(invoice_number)].discard(invoice_number)
+        country, partner = self._keys.pop(invoice_number)
+        self._discard(self._by_country, country, invoice_number)
+        self._discard(self._by_partner, partner, invoice_number)
+        for trigram in _trigrams(invoice_number):
+            self._discard(self._trigram_index, trigram, invoice_number)
+
+    def update(self, invoice):
+        """
+        Reindexa uma fatura após alteração (pagamento, edição de dados, etc.)
+        """
+        self.remove(invoice.get('invoice_number', STATUS_NA))
+        self.add(invoice)
+
+    def sync(self, invoices):
+        """
+        Sincroniza o índice com a lista de faturas da sessão
+
+        Só adiciona/remove as faturas que mudaram; as que já estão indexadas
+        são reclassificadas apenas se o status de pagamento divergir.
+        """
+        current = {inv.get('invoice_number', STATUS_NA): inv for inv in invoices}
+
+        for number in set(self._by_number) - set(current):
+            self.remove(number)
+
+        # Faturas novas entram em lote e a ordenação é refeita uma única vez;
+        # as alterações usam bisect e só são aplicadas com a lista já ordenada
+        added = 0
+        changed = []
+        for number, invoice in current.items():
+            indexed = self._by_number.get(number)
+            if indexed is None:
+                self._add(invoice, keep_sorted=False)
+                added += 1
+            elif indexed is not invoice:
+                changed.append(invoice)
+            elif (self._status[number] == STATUS_LIQUIDADA) != bool(invoice.get('paid', False)):
+                changed.append(invoice)
+
+        if added:
+            self._due_order.sort()
+
+        for invoice in changed:
+            self.update(invoice)
+
+        self._source_id = id(invoices)
+        self._source_len = len(invoices)
+
+    def is_synced_with(self, invoices):
+        """
+        Verifica se o índice foi construído a partir desta lista de faturas
+        """
+        return self._source_id == id(invoices) and self._source_len == len(invoices)
+
+    def refresh(self, today=None):
+        """
+        Avança a data de referência, movendo para "Vencida" apenas as faturas
+        cujo vencimento caiu entre a data anterior e a nova
+        """
+        today = today or date.today()
+        if today == self._today:
+            return
+
+        if today < self._today:
+            # Retrocesso de data: reclassifica tudo
+            self._today = today
+            for invoice in list(self._by_number.values()):
+                self.update(invoice)
+            return
+
+        start = bisect.bisect_left(self._due_order, (self._today.toordinal(), ''))
+        end = bisect.bisect_left(self._due_order, (today.toordinal(), ''))
+        self._today = today
+
+        for _, number in self._due_order[start:end]:
+            if self._status[number] == STATUS_A_VENCER:
+                self._buckets[STATUS_A_VENCER].discard(number)
+                self._buckets[STATUS_VENCIDA].add(number)
+                self._status[number] = STATUS_VENCIDA
+                self._by_number[number]['due_status'] = STATUS_VENCIDA
+
+    def countries(self):
+        """
+        Retorna a lista ordenada de países com faturas
+        """
+        return sorted(self._by_country)
+
+    def partners(self):
+        """
+        Retorna a lista ordenada de masters com faturas
+        """
+        return sorted(self._by_partner)
+
+    def status_counts(self):
+        """
+        Retorna a quantidade de faturas em cada bucket de status
+        """
+        return {status: len(numbers) for status, numbers in self._buckets.items() if numbers}
+
+    def search_numbers(self, query):
+        """
+        Busca faturas cujo número contém o texto informado
+
+        Consultas com 3 ou mais caracteres usam o índice de trigramas e só
+        verificam a substring nos candidatos.
+
+        Retorna:
+        - set: Números de fatura encontrados
+        """
+        query = query.strip().lower()
+        if not query:
+            return set(self._by_number)
+
+        if len(query) < 3:
+            return {number for number in self._by_number if query in number.lower()}
+
+        posting_lists = []
+        for trigram in _trigrams(query):
+            numbers = self._trigram_index.get(trigram)
+            if not numbers:
+                return set()
+            posting_lists.append(numbers)
+
+        posting_lists.sort(key=len)
+        candidates = set(posting_lists[0])
+        for numbers in posting_lists[1:]:
+            candidates &= numbers
+            if not candidates:
+                return candidates
+
+        return {number for number in candidates if query in number.lower()}
+
+    def filter(self, country=None, partner=None, status=None, number_query=None):
+        """
+        Filtra faturas combinando os índices disponíveis
+
+        Parâmetros:
+        - country: País (None ou "Todos" para não filtrar)
+        - partner: Master (None ou "Todos" para não filtrar)
+        - status: Status de vencimento (None ou "Todos" para não filtrar)
+        - number_query: Texto a buscar no número da fatura
+
+        Retorna:
+        - list: Faturas ordenadas por data de vencimento
+        """
+        candidate_sets = []
+        if country and country != "Todos":
+            candidate_sets.append(self._by_country.get(country, set()))
+        if partner and partner != "Todos":
+            candidate_sets.append(self._by_partner.get(partner, set()))
+        if status and status != "Todos":
+            candidate_sets.append(self._buckets.get(status, set()))
+        if number_query:
+            candidate_sets.append(self.search_numbers(number_query))
+
+        if not candidate_sets:
+            return [self._by_number[number] for _, number in self._due_order]
+
+        candidate_sets.sort(key=len)
+        selected = set(candidate_sets[0])
+        for numbers in candidate_sets[1:]:
+            selected &= numbers
+
+        # Para poucos resultados é mais barato ordenar os candidatos
+        if len(selected) * 8 < len(self._due_order):
+            ordered = sorted(selected, key=self._due_key.__getitem__)
+        else:
+            ordered = [number for _, number in self._due_order if number in selected]
+        return [self._by_number[number] for number in ordered]
+
+    @staticmethod
+    def _discard(mapping, key, number):
+        numbers = mapping.get(key)
+        if numbers is not None:
+            numbers.discard(number)
+            if not numbers:
+                del mapping[key]
+
+def get_aging_index(invoices):
+    """
+    Retorna o índice de vencimento da sessão, sincronizado com a lista de faturas
+
+    O índice é mantido em st.session_state e só é ressincronizado quando a
+    lista de faturas é substituída ou muda de tamanho.
+
+    Parâmetros:
+    - invoices: Lista de dicionários de faturas (st.session_state.invoices)
+
+    Retorna:
+    - InvoiceAgingIndex
+    """
+    index = st.session_state.get('invoice_aging_index')
+
+    if index is None:
+        index = InvoiceAgingIndex()
+        st.session_state.invoice_aging_index = index
+
+    if not index.is_synced_with(invoices):
+        index.sync(invoices)
+
+    index.refresh()
+    return index
@@ -0,0 +1,373 @@
+import os
+import pickle
+import sqlite3
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+# Banco da fila de tarefas e diretório dos dados de entrada/resultados
+JOBS_DB = "data/jobs.sqlite3"
+JOB_FILES_DIR = "data/jobs"
+
+# Tarefas executadas em paralelo pelo processo do Streamlit
+MAX_WORKERS = 2
+
+# Intervalo (s) entre verificações da fila e entre atualizações da tela
+POLL_INTERVAL = 0.5
+UI_REFRESH_SECONDS = 1.0
+
+# Tempo de retenção das tarefas concluídas e seus resultados
+RESULT_RETENTION = timedelta(hours=24)
+
+# Situações de uma tarefa
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = {STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED}
+
+STATUS_LABELS = {
+    STATUS_PENDING: "Na fila",
+    STATUS_RUNNING: "Em execução",
+    STATUS_DONE: "Concluída",
+    STATUS_FAILED: "Falhou",
+    STATUS_CANCELLED: "Cancelada",
+}
+
+# Funções executadas para cada tipo de tarefa (preenchido por register_job)
+_JOB_HANDLERS = {}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    description TEXT,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner, created_at);
+"""
+
+class JobCancelled(Exception):
+    """
+    Interrompe uma tarefa cujo cancelamento foi solicitado
+    """
+
+class JobContext:
+    """
+    Canal entre a tarefa em execução e a fila: progresso e cancelamento
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, fraction, message=None):
+        """
+        Atualiza o progresso (0 a 1) e interrompe a tarefa se ela foi cancelada
+        """
+        with _connection() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ?",
+                         (max(0.0, min(1.0, float(fraction))), message, self.job_id))
+        self.check_cancelled()
+
+    def is_cancelled(self):
+        with _connection() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelled()
+
+def register_job(kind):
+    """
+    Registra a função que executa um tipo de tarefa
+
+    A função recebe (payload, context) e retorna o resultado, que fica
+    disponível em get_job_result até o fim da retenção.
+
+    Parâmetros:
+    - kind: Nome do tipo de tarefa
+    """
+    def decorator(func):
+        _JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+def _connect():
+    os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+@contextmanager
+def _connection():
+    # Conexão com commit automático ao final do bloco, sempre fechada
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _now():
+    return datetime.now().isoformat()
+
+def _file_path(job_id, name):
+    return os.path.join(JOB_FILES_DIR, f"{job_id}.{name}.pkl")
+
+def _write_pickle(path, value):
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+def _read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _remove_files(job_id):
+    for name in ('payload', 'result'):
+        try:
+            os.remove(_file_path(job_id, name))
+        except OSError:
+            pass
+
+def _init_db():
+    with _connection() as conn:
+        conn.executescript(_SCHEMA)
+
+def _purge_expired():
+    """
+    Remove as tarefas finalizadas há mais tempo que RESULT_RETENTION
+    """
+    limit = (datetime.now() - RESULT_RETENTION).isoformat()
+    placeholders = ','.join('?' * len(FINAL_STATUSES))
+    with _connection() as conn:
+        rows = conn.execute(f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                            (*FINAL_STATUSES, limit)).fetchall()
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in rows])
+    for row in rows:
+        _remove_files(row['id'])
+
+class _JobRunner:
+    """
+    Threads que consomem a fila de tarefas (uma instância por processo)
+    """
+
+    def __init__(self, workers=MAX_WORKERS):
+        _init_db()
+
+        # Tarefas que estavam em execução quando o processo anterior terminou
+        with _connection() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?",
+                         (STATUS_FAILED, "Interrompida pelo reinício do servidor.", _now(), STATUS_RUNNING))
+        _purge_expired()
+
+        self._wake = threading.Event()
+        self._threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wake.set()
+
+    def _claim(self):
+        """
+        Marca a tarefa pendente mais antiga como em execução e retorna seu id
+        """
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, kind FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                               (STATUS_PENDING,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                             (STATUS_RUNNING, _now(), row['id']))
+            conn.execute("COMMIT")
+            return row
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, error=None):
+        with _connection() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, "
+                         "progress = CASE WHEN ? = ? THEN 1 ELSE progress END WHERE id = ?",
+                         (status, error, _now(), status, STATUS_DONE, job_id))
+
+    def _run(self, job_id, kind):
+        handler = _JOB_HANDLERS.get(kind)
+        if handler is None:
+            self._finish(job_id, STATUS_FAILED, f"Tipo de tarefa desconhecido: {kind}")
+            return
+
+        context = JobContext(job_id)
+        try:
+            payload = _read_pickle(_file_path(job_id, 'payload'))
+            context.check_cancelled()
+            result = handler(payload, context)
+            _write_pickle(_file_path(job_id, 'result'), result)
+            self._finish(job_id, STATUS_DONE)
+        except JobCancelled:
+            self._finish(job_id, STATUS_CANCELLED)
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job_id, STATUS_FAILED, str(e) or e.__class__.__name__)
+        finally:
+            try:
+                os.remove(_file_path(job_id, 'payload'))
+            except OSError:
+                pass
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                row = None
+
+            if row is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            self._run(row['id'], row['kind'])
+
+@st.cache_resource(show_spinner=False)
+def _get_runner():
+    return _JobRunner()
+
+def submit_job(kind, payload, owner=None, description=""):
+    """
+    Coloca uma tarefa na fila para execução em segundo plano
+
+    A tarefa continua em execução mesmo se a página for recarregada ou o
+    usuário navegar para outra página.
+
+    Parâmetros:
+    - kind: Tipo da tarefa (registrado com register_job)
+    - payload: Dados de entrada (qualquer objeto serializável com pickle)
+    - owner: Usuário que criou a tarefa
+    - description: Descrição exibida ao acompanhar a tarefa
+
+    Retorna:
+    - str: Identificador da tarefa
+    """
+    if kind not in _JOB_HANDLERS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+
+    runner = _get_runner()
+    job_id = uuid.uuid4().hex
+
+    _write_pickle(_file_path(job_id, 'payload'), payload)
+    with _connection() as conn:
+        conn.execute("INSERT INTO jobs (id, kind, owner, description, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                      (job_id, kind, owner, description, STATUS_PENDING, _now()))
+
+    runner.notify()
+    return job_id
+
+def get_job(job_id):
+    """
+    Retorna a situação de uma tarefa
+
+    Retorna:
+    - dict ou None: id, kind, owner, description, status, progress, message, error e datas
+    """
+    _get_runner()
+    with _connection() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_job_result(job_id):
+    """
+    Retorna o resultado de uma tarefa concluída
+
+    Retorna:
+    - Resultado da tarefa ou None se não estiver disponível
+    """
+    try:
+        return _read_pickle(_file_path(job_id, 'result'))
+    except OSError:
+        return None
+
+def cancel_job(job_id):
+    """
+    Cancela uma tarefa: imediatamente se ainda estiver na fila, ou no próximo
+    ponto de verificação (context.progress) se já estiver em execução
+
+    Retorna:
+    - bool: True se o cancelamento foi registrado
+    """
+    with _connection() as conn:
+        cursor = conn.execute("UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? "
+                              "WHERE id = ? AND status = ?",
+                              (STATUS_CANCELLED, _now(), job_id, STATUS_PENDING))
+        if cursor.rowcount:
+            _remove_files(job_id)
+            return True
+        cursor = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                              (job_id, STATUS_RUNNING))
+        return bool(cursor.rowcount)
+
+def list_jobs(owner=None, limit=50):
+    """
+    Lista as tarefas mais recentes, opcionalmente de um usuário
+
+    Retorna:
+    - list: Dicionários no formato de get_job
+    """
+    _get_runner()
+    query = "SELECT * FROM jobs"
+    params = []
+    if owner is not None:
+        query += " WHERE owner = ?"
+        params.append(owner)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+
+    with _connection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+@st.fragment(run_every=UI_REFRESH_SECONDS)
+def render_job_progress(job_id):
+    """
+    Mostra o progresso de uma tarefa, atualizado periodicamente sem recarregar a página
+
+    Quando a tarefa termina a página inteira é executada novamente para
+    que ela possa exibir o resultado.
+
+    Parâmetros:
+    - job_id: Identificador da tarefa
+    """
+    job = get_job(job_id)
+    if job is None or job['status'] in FINAL_STATUSES:
+        st.rerun()
+
+    label = job['description'] or job['kind']
+    status = STATUS_LABELS.get(job['status'], job['status'])
+    st.progress(job['progress'], text=f"{label} — {status}" + (f": {job['message']}" if job['message'] else ""))
+
+    if st.button("Cancelar", key=f"cancel_job_{job_id}", disabled=bool(job['cancel_requested'])):
+        cancel_job(job_id)
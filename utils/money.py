@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# Casas decimais (expoente da unidade menor) por moeda, conforme ISO 4217
+CURRENCY_EXPONENTS = {
+    'USD': 2,
+    'BRL': 2,
+    'MXN': 2,
+    'EUR': 2,
+    'GBP': 2,
+    'ARS': 2,
+    'COP': 2,
+    'PEN': 2,
+    'UYU': 2,
+    'CLP': 0,
+    'PYG': 0,
+    'JPY': 0,
+    'KRW': 0,
+    'BHD': 3,
+    'KWD': 3,
+    'OMR': 3,
+}
+
+# Expoente usado para moedas não cadastradas
+DEFAULT_EXPONENT = 2
+
+# Casas usadas para descartar o ruído de ponto flutuante antes do arredondamento
+_NOISE_DECIMALS = 6
+
+def currency_exponent(currency):
+    """
+    Retorna o número de casas decimais da moeda
+
+    Parâmetros:
+    - currency: Código da moeda (ex.: 'BRL')
+
+    Retorna:
+    - int: Expoente da unidade menor (2 para centavos)
+    """
+    return CURRENCY_EXPONENTS.get(str(currency).upper(), DEFAULT_EXPONENT) if currency else DEFAULT_EXPONENT
+
+def currency_exponents(currencies):
+    """
+    Versão vetorizada de currency_exponent
+
+    Parâmetros:
+    - currencies: Série, array ou lista de códigos de moeda
+
+    Retorna:
+    - np.ndarray: Expoentes (int64)
+    """
+    codes = pd.Series(currencies, dtype=object).fillna('').astype(str).str.upper()
+    return codes.map(CURRENCY_EXPONENTS).fillna(DEFAULT_EXPONENT).to_numpy(dtype=np.int64)
+
+def round_half_even(values):
+    """
+    Arredonda para o inteiro mais próximo com arredondamento bancário (meio para o par)
+
+    O valor é antes arredondado em 6 casas para que resíduos binários
+    (ex.: 0,5 representado como 0,49999999) não alterem o resultado.
+
+    Parâmetros:
+    - values: Escalar ou array de valores em unidades menores (float)
+
+    Retorna:
+    - np.ndarray ou int: Valores inteiros (int64)
+    """
+    rounded = np.rint(np.round(np.asarray(values, dtype=np.float64), _NOISE_DECIMALS)).astype(np.int64)
+    return int(rounded) if rounded.ndim == 0 else rounded
+
+def to_minor(amounts, currency=None):
+    """
+    Converte valores monetários para unidades menores inteiras (ex.: centavos)
+
+    Parâmetros:
+    - amounts: Escalar, lista, array ou Série de valores
+    - currency: Código da moeda ou sequência de códigos (um por valor)
+
+    Retorna:
+    - np.ndarray ou int: Valores em unidades menores (int64)
+    """
+    if currency is None or isinstance(currency, str):
+        exponent = currency_exponent(currency)
+    else:
+        exponent = currency_exponents(currency)
+    return round_half_even(np.asarray(amounts, dtype=np.float64) * np.power(10.0, exponent))
+
+def from_minor(minor, currency=None):
+    """
+    Converte unidades menores inteiras de volta para o valor decimal (float)
+
+    Parâmetros:
+    - minor: Escalar, lista, array ou Série de inteiros
+    - currency: Código da moeda ou sequência de códigos (um por valor)
+
+    Retorna:
+    - np.ndarray ou float: Valores decimais
+    """
+    if currency is None or isinstance(currency, str):
+        exponent = currency_exponent(currency)
+    else:
+        exponent = currency_exponents(currency)
+    values = np.asarray(minor, dtype=np.int64) / np.power(10.0, exponent)
+    return float(values) if np.ndim(values) == 0 else values
+
+def apply_rate(minor, rate):
+    """
+    Aplica uma alíquota (fração) a valores em unidades menores com arredondamento bancário
+
+    Parâmetros:
+    - minor: Valores em unidades menores (int)
+    - rate: Alíquota em fração (0.08 para 8%), escalar ou array
+
+    Retorna:
+    - np.ndarray ou int: Resultado em unidades menores (int64)
+    """
+    return round_half_even(np.asarray(minor, dtype=np.float64) * np.asarray(rate, dtype=np.float64))
+
+def convert_minor(minor, exchange_rate, from_currency=None, to_currency='USD'):
+    """
+    Converte unidades menores de uma moeda para outra dividindo pela taxa de câmbio
+
+    Taxas nulas ou ausentes resultam em zero.
+
+    Parâmetros:
+    - minor: Valores em unidades menores da moeda de origem
+    - exchange_rate: Unidades da moeda de origem por unidade da moeda de destino
+    - from_currency: Moeda (ou moedas) de origem
+    - to_currency: Moeda de destino
+
+    Retorna:
+    - np.ndarray ou int: Valores em unidades menores da moeda de destino (int64)
+    """
+    if from_currency is None or isinstance(from_currency, str):
+        from_exponent = currency_exponent(from_currency)
+    else:
+        from_exponent = currency_exponents(from_currency)
+    scale = np.power(10.0, currency_exponent(to_currency) - from_exponent)
+
+    rate = np.asarray(exchange_rate, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        converted = np.where(rate > 0, np.asarray(minor, dtype=np.float64) * scale / rate, 0.0)
+    return round_half_even(np.nan_to_num(converted))
+
+def money_equal(a, b, currency=None):
+    """
+    Compara dois valores monetários exatamente, em unidades menores
+
+    Retorna:
+    - bool
+    """
+    return to_minor(a, currency) == to_minor(b, currency)
@@ -0,0 +1,332 @@
+import io
+import re
+import threading
+import unicodedata
+
+import pandas as pd
+
+from utils.cache import CONFIG_NAMESPACE, cached_resource, file_version
+from utils.config_store import ConfigStoreError, create_json, read_json, update_json
+from utils.readers import read_spreadsheet
+
+# Cadastro de parceiros (nomes alternativos, contatos, endereço de cobrança e identificação fiscal)
+PARTNERS_FILE = "data/partners.json"
+
+# Arquivo antigo com apenas parceiro -> e-mail (migrado na primeira leitura)
+LEGACY_EMAILS_FILE = "data/partner_emails.json"
+
+ADDRESS_FIELDS = ['line1', 'line2', 'city', 'state', 'postal_code', 'country']
+
+# Colunas do arquivo de importação/exportação (uma linha por contato)
+EXPORT_COLUMNS = ['partner', 'aliases', 'tax_id', 'language', 'contact_name', 'email', 'contact_role'] + ADDRESS_FIELDS
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_LIST_SEPARATORS = re.compile(r'[;,\n]')
+
+def normalize_name(name):
+    """
+    Normaliza um nome para busca: sem acentos, minúsculo e sem pontuação
+    """
+    if name is None:
+        return ""
+    text = unicodedata.normalize('NFKD', str(name))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+def split_list(value):
+    """
+    Separa uma lista digitada em texto (separadores: ";", "," ou quebra de linha)
+    """
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return []
+    items = value if isinstance(value, (list, tuple)) else _LIST_SEPARATORS.split(str(value))
+    return [str(item).strip() for item in items if str(item).strip()]
+
+def _clean(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+def _new_partner(name):
+    return {'name': name, 'aliases': [], 'contacts': [], 'billing_address': {}, 'tax_id': "", 'language': ""}
+
+def _migrate_legacy(path):
+    """
+    Converte data/partner_emails.json no formato do cadastro
+    """
+    try:
+        legacy = read_json(path, {}) or {}
+    except ConfigStoreError:
+        legacy = {}
+
+    partners = {}
+    for name, emails in legacy.items():
+        partner = _new_partner(name)
+        partner['contacts'] = [{'name': "", 'email': email, 'role': ""} for email in split_list(emails)]
+        partners[name] = partner
+    return partners
+
+class PartnerDirectory:
+    """
+    Cadastro de parceiros em memória com índices por nome/nome alternativo e por e-mail
+
+    O arquivo é relido somente quando muda; os índices são reconstruídos
+    nessa ocasião e as consultas não acessam o disco.
+    """
+
+    def __init__(self, path=PARTNERS_FILE, legacy_path=LEGACY_EMAILS_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._version = None
+        self._partners = {}
+        self._by_key = {}
+        self._by_email = {}
+
+    def _compile(self, partners):
+        by_key = {}
+        by_email = {}
+        for name, partner in partners.items():
+            for variant in [name] + list(partner.get('aliases') or []):
+                by_key.setdefault(normalize_name(variant), name)
+            for contact in partner.get('contacts') or []:
+                if contact.get('email'):
+                    by_email.setdefault(contact['email'].lower(), name)
+        self._partners, self._by_key, self._by_email = partners, by_key, by_email
+
+    def _refresh(self):
+        version = file_version(self.path)
+        if version is not None and version == self._version:
+            return
+
+        with self._lock:
+            if version is None:
+                create_json(self.path, lambda: _migrate_legacy(self.legacy_path))
+                version = file_version(self.path)
+            if version == self._version:
+                return
+            try:
+                partners = read_json(self.path, {}) or {}
+            except ConfigStoreError:
+                # Mantém o cadastro anterior se o arquivo não puder ser lido
+                return
+            self._compile(partners)
+            self._version = version
+
+    def resolve(self, name):
+        """
+        Retorna o nome cadastrado do parceiro (pelo nome ou por um nome alternativo)
+        """
+        self._refresh()
+        return self._by_key.get(normalize_name(name))
+
+    def get(self, name):
+        """
+        Retorna o cadastro do parceiro ou None
+        """
+        canonical = self.resolve(name)
+        return self._partners.get(canonical) if canonical else None
+
+    def all(self):
+        self._refresh()
+        return dict(self._partners)
+
+    def find_by_email(self, email):
+        """
+        Retorna o nome do parceiro dono de um e-mail
+        """
+        self._refresh()
+        return self._by_email.get((email or "").strip().lower())
+
+    def emails(self, name):
+        """
+        Lista os e-mails dos contatos do parceiro, na ordem cadastrada
+        """
+        partner = self.get(name)
+        if partner is None:
+            return []
+        return [contact['email'] for contact in partner.get('contacts') or [] if contact.get('email')]
+
+    def email_mapping(self, names):
+        """
+        Monta o mapeamento parceiro -> destinatários (separados por vírgula) usado no envio
+        """
+        mapping = {}
+        for name in names:
+            emails = self.emails(name)
+            if emails:
+                mapping[name] = ", ".join(emails)
+        return mapping
+
+    def language(self, name):
+        """
+        Idioma dos e-mails do parceiro (código, ex.: "pt") ou "" se não cadastrado
+        """
+        partner = self.get(name) or {}
+        return partner.get('language') or ""
+
+    def billing_address_lines(self, name):
+        """
+        Linhas do endereço de cobrança para a fatura (vazias se não cadastrado)
+
+        Retorna:
+        - list: [endereço, complemento/cidade, identificação fiscal]
+        """
+        partner = self.get(name) or {}
+        address = partner.get('billing_address') or {}
+
+        street = ", ".join(part for part in [address.get('line1'), address.get('line2')] if part)
+        city_line = ", ".join(part for part in [address.get('city'), address.get('state')] if part)
+        if address.get('postal_code'):
+            city_line = f"{city_line} {address['postal_code']}".strip()
+        tax_line = f"Tax ID: {partner['tax_id']}" if partner.get('tax_id') else ""
+        return [street, city_line, tax_line]
+
+    def name_variants(self, name):
+        """
+        Nomes normalizados pelos quais o parceiro pode aparecer (ex.: em extratos bancários)
+        """
+        variants = {normalize_name(name)}
+        partner = self.get(name)
+        if partner is not None:
+            variants.add(normalize_name(partner['name']))
+            variants.update(normalize_name(alias) for alias in partner.get('aliases') or [])
+        variants.discard("")
+        return variants
+
+    def _save(self, updater):
+        with self._lock:
+            partners = update_json(self.path, updater, {})
+            self._compile(partners)
+            self._version = file_version(self.path)
+
+    def set_emails(self, mapping):
+        """
+        Substitui os e-mails dos parceiros informados, preservando os dados dos contatos existentes
+
+        Parâmetros:
+        - mapping: Dicionário parceiro -> e-mails (texto separado por vírgula ou lista)
+        """
+        self._refresh()
+        resolved = {self.resolve(name) or name: split_list(emails) for name, emails in mapping.items()}
+
+        def apply(partners):
+            for name, emails in resolved.items():
+                partner = partners.setdefault(name, _new_partner(name))
+                existing = {contact.get('email', '').lower(): contact for contact in partner.get('contacts') or []}
+                partner['contacts'] = [existing.get(email.lower(), {'name': "", 'email': email, 'role': ""})
+                                       for email in emails]
+            return partners
+
+        self._save(apply)
+
+    def upsert(self, records):
+        """
+        Inclui ou atualiza parceiros
+
+        Parâmetros:
+        - records: Lista de dicionários no formato do cadastro (campos ausentes são mantidos)
+        """
+        def apply(partners):
+            for record in records:
+                name = _clean(record.get('name'))
+                if not name:
+                    continue
+                partner = partners.setdefault(name, _new_partner(name))
+                for field in ('aliases', 'contacts', 'tax_id', 'language'):
+                    if field in record:
+                        partner[field] = record[field]
+                if 'billing_address' in record:
+                    partner['billing_address'] = {field: _clean(value) for field, value in record['billing_address'].items()
+                                                  if field in ADDRESS_FIELDS and _clean(value)}
+            return partners
+
+        self._save(apply)
+
+    def export_frame(self):
+        """
+        Exporta o cadastro em uma tabela com uma linha por contato (formato de import_file)
+        """
+        rows = []
+        for name, partner in sorted(self.all().items()):
+            base = {'partner': name, 'aliases': "; ".join(partner.get('aliases') or []),
+                    'tax_id': partner.get('tax_id', ""), 'language': partner.get('language', ""),
+                    **{field: (partner.get('billing_address') or {}).get(field, "") for field in ADDRESS_FIELDS}}
+            contacts = partner.get('contacts') or [{}]
+            for contact in contacts:
+                rows.append({**base, 'contact_name': contact.get('name', ""), 'email': contact.get('email', ""),
+                             'contact_role': contact.get('role', "")})
+        return pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+
+    def import_frame(self, df):
+        """
+        Importa parceiros de uma tabela no formato de export_frame
+
+        Linhas do mesmo parceiro são agrupadas (uma por contato). Os parceiros
+        importados substituem por completo os cadastros de mesmo nome.
+
+        Retorna:
+        - (int, list): Quantidade de parceiros importados e mensagens de erro por linha
+        """
+        df = df.copy()
+        df.columns = [str(col).strip().lower() for col in df.columns]
+        if 'partner' not in df.columns:
+            return 0, ["Coluna obrigatória ausente: partner"]
+
+        records = {}
+        errors = []
+        for position, row in enumerate(df.to_dict('records'), start=2):
+            name = _clean(row.get('partner'))
+            if not name:
+                errors.append(f"Linha {position}: parceiro não informado")
+                continue
+
+            record = records.setdefault(name, {'name': name, 'aliases': [], 'contacts': [],
+                                               'billing_address': {}, 'tax_id': "", 'language': ""})
+            for alias in split_list(row.get('aliases')):
+                if alias not in record['aliases']:
+                    record['aliases'].append(alias)
+            record['tax_id'] = record['tax_id'] or _clean(row.get('tax_id'))
+            record['language'] = record['language'] or _clean(row.get('language')).lower()
+            for field in ADDRESS_FIELDS:
+                if _clean(row.get(field)) and not record['billing_address'].get(field):
+                    record['billing_address'][field] = _clean(row.get(field))
+
+            for email in split_list(row.get('email')):
+                if '@' not in email:
+                    errors.append(f"Linha {position}: e-mail inválido ({email})")
+                    continue
+                record['contacts'].append({'name': _clean(row.get('contact_name')), 'email': email,
+                                           'role': _clean(row.get('contact_role'))})
+
+        if records:
+            self.upsert(list(records.values()))
+        return len(records), errors
+
+@cached_resource(CONFIG_NAMESPACE)
+def get_partner_directory():
+    """
+    Retorna o cadastro de parceiros compartilhado pelo processo
+    """
+    return PartnerDirectory()
+
+def import_partners_file(source, file_name=None):
+    """
+    Importa parceiros de um arquivo CSV ou Excel (colunas de EXPORT_COLUMNS)
+
+    Retorna:
+    - (int, list): Quantidade de parceiros importados e mensagens de erro
+    """
+    try:
+        df = read_spreadsheet(source, file_name, text_columns=EXPORT_COLUMNS)
+    except Exception as e:
+        return 0, [f"Erro ao ler o arquivo: {e}"]
+    return get_partner_directory().import_frame(df)
+
+def export_partners_csv():
+    """
+    Exporta o cadastro de parceiros em CSV (bytes UTF-8)
+    """
+    buffer = io.StringIO()
+    get_partner_directory().export_frame().to_csv(buffer, index=False)
+    return buffer.getvalue().encode('utf-8')
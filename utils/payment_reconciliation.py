@@ -1,7 +1,14 @@
 import pandas as pd
 import numpy as np
 import re
+from collections import defaultdict
 from datetime import datetime, timedelta
+from utils.money import to_minor
+from utils.jobs import register_job
+from utils.partner_directory import get_partner_directory, normalize_name
+
+# Tipo da tarefa de reconciliação executada em segundo plano
+RECONCILE_JOB = "reconcile_payments"
 
 def extract_invoice_number(text):
     """
@@ -23,6 +30,39 @@ def extract_invoice_number(text):
     
     return None
 
+# Maior pontuação possível sem correspondência exata de número ou valor
+# (valor próximo + data recente + nome do parceiro)
+MAX_SCORE_WITHOUT_EXACT_MATCH = 20 + 15 + 10
+
+def _remaining_minor(invoice):
+    """
+    Retorna o saldo em aberto da fatura em unidades menores da sua moeda
+    """
+    currency = invoice.get('currency')
+    return to_minor(invoice['total_amount'], currency) - to_minor(invoice.get('payment_amount', 0), currency)
+
+def _is_settled(invoice):
+    """
+    Verifica se a fatura já está totalmente paga (comparação exata em unidades menores)
+    """
+    return invoice.get('paid', False) and _remaining_minor(invoice) <= 0
+
+def build_remaining_index(invoices):
+    """
+    Indexa as faturas em aberto por (moeda, saldo em unidades menores)
+
+    Parâmetros:
+    - invoices: Lista de dicionários de faturas
+
+    Retorna:
+    - defaultdict: {(moeda, saldo): [faturas]}
+    """
+    index = defaultdict(list)
+    for invoice in invoices:
+        if not _is_settled(invoice):
+            index[(invoice.get('currency'), _remaining_minor(invoice))].append(invoice)
+    return index
+
 def find_potential_matches(payment, invoices, fuzzy_date_range=10):
     """
     Encontra possíveis correspondências de faturas para um pagamento
@@ -40,9 +80,14 @@ def find_potential_matches(payment, invoices, fuzzy_date_range=10):
     # Extrai o número da fatura da descrição ou referência do pagamento
     invoice_number = extract_invoice_number(payment['Description']) or extract_invoice_number(payment['Reference'])
     
+    # Descrição normalizada uma vez por pagamento para buscar o parceiro (nome ou nomes alternativos)
+    description = f" {normalize_name(payment['Description'])} " if isinstance(payment['Description'], str) else ""
+    directory = get_partner_directory()
+    partner_variants = {}
+    
     for invoice in invoices:
         # Ignora faturas já totalmente pagas
-        if invoice.get('paid', False) and invoice.get('payment_amount', 0) >= invoice['total_amount']:
+        if _is_settled(invoice):
             continue
         
         score = 0
@@ -53,12 +98,14 @@ def find_potential_matches(payment, invoices, fuzzy_date_range=10):
             score += 100
             reasons.append("Correspondência do número da fatura")
         
-        # Correspondência de valor (indicador forte)
+        # Correspondência de valor (indicador forte), comparada exatamente em unidades menores
+        currency = invoice.get('currency')
+        payment_minor = to_minor(payment['Amount'], currency)
         remaining_amount = invoice['total_amount'] - invoice.get('payment_amount', 0)
-        if abs(payment['Amount'] - remaining_amount) < 0.01:
+        if payment_minor == _remaining_minor(invoice):
             score += 50
             reasons.append("Correspondência de valor")
-        elif abs(payment['Amount'] - invoice['total_amount']) < 0.01:
+        elif payment_minor == to_minor(invoice['total_amount'], currency):
             score += 45
             reasons.append("Correspondência de valor total")
         
@@ -86,9 +133,13 @@ def find_potential_matches(payment, invoices, fuzzy_date_range=10):
             reasons.append(f"Fatura dentro de 60 dias")
         
         # Nome do parceiro na descrição (indicador fraco)
-        if isinstance(payment['Description'], str) and invoice['partner'].lower() in payment['Description'].lower():
-            score += 10
-            reasons.append("Nome do parceiro na descrição")
+        if description:
+            variants = partner_variants.get(invoice['partner'])
+            if variants is None:
+                variants = partner_variants[invoice['partner']] = directory.name_variants(invoice['partner'])
+            if any(f" {variant} " in description for variant in variants):
+                score += 10
+                reasons.append("Nome do parceiro na descrição")
         
         # Adiciona às correspondências se a pontuação for positiva
         if score > 0:
@@ -104,13 +155,14 @@ def find_potential_matches(payment, invoices, fuzzy_date_range=10):
     
     return matches
 
-def reconcile_payments(payments_df, invoices):
+def reconcile_payments(payments_df, invoices, progress=None):
     """
     Reconcilia pagamentos com faturas
     
     Parâmetros:
     - payments_df: DataFrame contendo dados de pagamento
     - invoices: Lista de dicionários de faturas
+    - progress: Função opcional chamada com a fração processada (0 a 1)
     
     Retorna:
     - tuple: (pagamentos_reconciliados, faturas_atualizadas)
@@ -120,12 +172,40 @@ def reconcile_payments(payments_df, invoices):
     # Cria uma cópia das faturas para atualizar
     updated_invoices = invoices.copy()
     
+    # Índices por hash: número da fatura, saldo e valor total exatos em unidades menores
+    by_number = {inv['invoice_number']: inv for inv in updated_invoices}
+    by_remaining = build_remaining_index(updated_invoices)
+    by_total = defaultdict(list)
+    for inv in updated_invoices:
+        by_total[(inv.get('currency'), to_minor(inv['total_amount'], inv.get('currency')))].append(inv)
+    currencies = {inv.get('currency') for inv in updated_invoices}
+    position = {id(inv): i for i, inv in enumerate(updated_invoices)}
+    
     # Processa cada pagamento
-    for _, payment in payments_df.iterrows():
+    total_payments = len(payments_df)
+    for number, (_, payment) in enumerate(payments_df.iterrows()):
+        if progress is not None and number % 100 == 0:
+            progress(number / total_payments)
+        
         payment_dict = payment.to_dict()
         
-        # Encontra correspondências potenciais
-        matches = find_potential_matches(payment_dict, updated_invoices)
+        # Candidatas: faturas com número, saldo ou total exatamente iguais ao pagamento
+        candidates = []
+        invoice_number = extract_invoice_number(payment_dict['Description']) or extract_invoice_number(payment_dict['Reference'])
+        if invoice_number in by_number:
+            candidates.append(by_number[invoice_number])
+        for currency in currencies:
+            amount_key = (currency, to_minor(payment_dict['Amount'], currency))
+            for invoice in by_remaining.get(amount_key, []) + by_total.get(amount_key, []):
+                if not any(invoice is candidate for candidate in candidates):
+                    candidates.append(invoice)
+        candidates.sort(key=lambda inv: position[id(inv)])
+        
+        # Encontra correspondências potenciais; só avalia todas as faturas quando
+        # nenhuma candidata supera a pontuação máxima das demais
+        matches = find_potential_matches(payment_dict, candidates) if candidates else []
+        if not matches or matches[0]['score'] <= MAX_SCORE_WITHOUT_EXACT_MATCH:
+            matches = find_potential_matches(payment_dict, updated_invoices)
         
         if matches:
             # Obtém a melhor correspondência
@@ -138,24 +218,25 @@ def reconcile_payments(payments_df, invoices):
             payment_dict['match_reasons'] = best_match['reasons']
             payment_dict['reconciled'] = True
             
-            # Atualiza o status de pagamento da fatura
-            invoice_idx = next((i for i, inv in enumerate(updated_invoices) if inv['invoice_number'] == invoice['invoice_number']), None)
-            if invoice_idx is not None:
-                # Inicializa payment_amount se não existir
-                if 'payment_amount' not in updated_invoices[invoice_idx]:
-                    updated_invoices[invoice_idx]['payment_amount'] = 0
-                
-                # Adiciona este valor de pagamento
-                updated_invoices[invoice_idx]['payment_amount'] += payment_dict['Amount']
-                
-                # Atualiza a data de pagamento
-                updated_invoices[invoice_idx]['payment_date'] = payment_dict['Date']
-                
-                # Marca como pago se o pagamento estiver completo ou exceder o valor da fatura
-                if updated_invoices[invoice_idx]['payment_amount'] >= updated_invoices[invoice_idx]['total_amount']:
-                    updated_invoices[invoice_idx]['paid'] = True
-                else:
-                    updated_invoices[invoice_idx]['paid'] = False
+            # Retira a fatura do índice de saldos antes de alterá-la
+            remaining_key = (invoice.get('currency'), _remaining_minor(invoice))
+            by_remaining[remaining_key] = [inv for inv in by_remaining.get(remaining_key, []) if inv is not invoice]
+            
+            # Inicializa payment_amount se não existir
+            if 'payment_amount' not in invoice:
+                invoice['payment_amount'] = 0
+            
+            # Adiciona este valor de pagamento
+            invoice['payment_amount'] += payment_dict['Amount']
+            
+            # Atualiza a data de pagamento
+            invoice['payment_date'] = payment_dict['Date']
+            
+            # Marca como pago se o pagamento estiver completo ou exceder o valor da fatura
+            invoice['paid'] = _remaining_minor(invoice) <= 0
+            
+            if not _is_settled(invoice):
+                by_remaining[(invoice.get('currency'), _remaining_minor(invoice))].append(invoice)
         else:
             # Nenhuma correspondência encontrada
             payment_dict['matched_invoice'] = None
@@ -167,6 +248,83 @@ def reconcile_payments(payments_df, invoices):
     
     return reconciled_payments, updated_invoices
 
+# Campos de pagamento alterados pela reconciliação
+PAYMENT_FIELDS = ('payment_amount', 'payment_date', 'paid')
+
+# Campos comparados para saber se a fatura mudou depois do envio da tarefa
+SNAPSHOT_FIELDS = ('total_amount', 'currency') + PAYMENT_FIELDS
+
+def _snapshot(invoice):
+    return {field: invoice.get(field) for field in SNAPSHOT_FIELDS}
+
+@register_job(RECONCILE_JOB)
+def reconcile_payments_job(payload, context):
+    """
+    Tarefa em segundo plano: reconcilia os pagamentos com as faturas
+    
+    A tarefa não devolve a lista de faturas inteira, apenas as alterações de
+    pagamento, que são aplicadas com apply_reconciliation sobre as faturas
+    atuais da sessão.
+    
+    Parâmetros:
+    - payload: {'payments': DataFrame de pagamentos, 'invoices': lista de faturas}
+    - context: JobContext da tarefa
+    
+    Retorna:
+    - tuple: (pagamentos_reconciliados, alterações) onde alterações é
+      {número_da_fatura: {'before': campos no envio, 'after': campos de pagamento}}
+    """
+    before = {invoice['invoice_number']: _snapshot(invoice) for invoice in payload['invoices']}
+    reconciled_payments, updated_invoices = reconcile_payments(
+        payload['payments'], payload['invoices'],
+        progress=lambda fraction: context.progress(fraction, "Reconciliando pagamentos..."))
+    
+    matched = {payment['matched_invoice'] for payment in reconciled_payments if payment['reconciled']}
+    changes = {}
+    for invoice in updated_invoices:
+        number = invoice['invoice_number']
+        if number in matched:
+            changes[number] = {'before': before[number],
+                               'after': {field: invoice.get(field) for field in PAYMENT_FIELDS}}
+    return reconciled_payments, changes
+
+def apply_reconciliation(invoices, reconciled_payments, changes):
+    """
+    Aplica às faturas atuais as alterações de pagamento de uma reconciliação
+    
+    Apenas os campos de pagamento são alterados. Faturas excluídas ou
+    alteradas depois do envio da tarefa são ignoradas, e os pagamentos
+    associados a elas voltam a ficar sem associação (para reconciliação manual).
+    
+    Parâmetros:
+    - invoices: Lista atual de faturas (alterada no lugar)
+    - reconciled_payments: Pagamentos retornados pela tarefa (alterados no lugar)
+    - changes: Alterações retornadas pela tarefa
+    
+    Retorna:
+    - tuple: (números_aplicados, números_ignorados)
+    """
+    by_number = {invoice['invoice_number']: invoice for invoice in invoices}
+    applied = []
+    skipped = []
+    for number, change in changes.items():
+        invoice = by_number.get(number)
+        if invoice is None or _snapshot(invoice) != change['before']:
+            skipped.append(number)
+            continue
+        invoice.update(change['after'])
+        applied.append(number)
+    
+    skipped_numbers = set(skipped)
+    for payment in reconciled_payments:
+        if payment['reconciled'] and payment['matched_invoice'] in skipped_numbers:
+            payment['matched_invoice'] = None
+            payment['match_score'] = 0
+            payment['match_reasons'] = []
+            payment['reconciled'] = False
+    
+    return applied, skipped
+
 def manually_reconcile_payment(payment, invoice, amount, payment_date, received_currency_amount, exchange_variation=0, invoices=None):
     """
     Reconcilia manualmente um pagamento com uma fatura
@@ -207,9 +365,6 @@ def manually_reconcile_payment(payment, invoice, amount, payment_date, received_
         updated_invoices[invoice_idx]['payment_date'] = payment['Date']
         
         # Marca como pago se o pagamento estiver completo ou exceder o valor da fatura
-        if updated_invoices[invoice_idx]['payment_amount'] >= updated_invoices[invoice_idx]['total_amount']:
-            updated_invoices[invoice_idx]['paid'] = True
-        else:
-            updated_invoices[invoice_idx]['paid'] = False
+        updated_invoices[invoice_idx]['paid'] = _remaining_minor(updated_invoices[invoice_idx]) <= 0
     
     return updated_payment, updated_invoices
@@ -0,0 +1,182 @@
+import os
+import pandas as pd
+from datetime import datetime
+from utils.money import to_minor
+
+# Colunas do lote de pagamentos (exchange_variation é opcional)
+PAYMENT_BATCH_COLUMNS = ['invoice_number', 'amount', 'date', 'exchange_variation']
+
+def parse_payment_batch(file):
+    """
+    Importa e valida um lote de pagamentos de arquivo CSV ou Excel
+
+    O arquivo deve conter as colunas invoice_number, amount e date;
+    exchange_variation é opcional (padrão 0).
+
+    Retorna:
+    - (DataFrame, bool, str): (lote, é_válido, mensagem_de_erro)
+    """
+    try:
+        file_extension = os.path.splitext(file.name)[1].lower()
+
+        if file_extension == '.csv':
+            df = pd.read_csv(file, dtype={'invoice_number': str})
+        elif file_extension in ['.xlsx', '.xls']:
+            df = pd.read_excel(file, dtype={'invoice_number': str})
+        else:
+            return None, False, "Formato de arquivo não suportado. Utilize CSV ou Excel."
+    except Exception as e:
+        return None, False, f"Erro ao importar arquivo: {str(e)}"
+
+    # Normalizar nomes de colunas
+    df.columns = [str(col).strip().lower() for col in df.columns]
+
+    missing_columns = [col for col in PAYMENT_BATCH_COLUMNS[:3] if col not in df.columns]
+    if missing_columns:
+        return df, False, f"Colunas obrigatórias ausentes: {', '.join(missing_columns)}"
+
+    if 'exchange_variation' not in df.columns:
+        df['exchange_variation'] = 0.0
+
+    batch = df[PAYMENT_BATCH_COLUMNS].copy()
+    batch['invoice_number'] = batch['invoice_number'].astype(str).str.strip()
+    batch['amount'] = pd.to_numeric(batch['amount'], errors='coerce')
+    batch['date'] = pd.to_datetime(batch['date'], errors='coerce')
+    batch['exchange_variation'] = pd.to_numeric(batch['exchange_variation'], errors='coerce').fillna(0.0)
+
+    invalid_rows = batch['amount'].isna() | batch['date'].isna()
+    if invalid_rows.any():
+        rows = ', '.join(str(i + 2) for i in batch.index[invalid_rows][:10])
+        return batch, False, f"Valores ou datas inválidos nas linhas: {rows}"
+
+    return batch, True, f"{len(batch)} pagamentos prontos para registro."
+
+def _batch_records(records):
+    if isinstance(records, pd.DataFrame):
+        return records.to_dict('records')
+    return list(records)
+
+# Campos da fatura alterados pelo registro de pagamentos
+_PAYMENT_FIELDS = ('payments', 'payment_amount', 'paid', 'payment_date')
+
+def _snapshot(invoice):
+    state = {key: invoice[key] for key in _PAYMENT_FIELDS if key in invoice}
+    if 'payments' in state:
+        state['payments'] = list(state['payments'])
+    return state
+
+def _restore(invoice, state):
+    for key in _PAYMENT_FIELDS:
+        if key in state:
+            invoice[key] = state[key]
+        else:
+            invoice.pop(key, None)
+
+def post_payments(records, index):
+    """
+    Registra um lote de pagamentos em uma única transação
+
+    Cada fatura é localizada pelo número através do índice por hash; todos
+    os registros são validados antes de qualquer alteração e, se algum
+    falhar, nenhuma fatura é modificada. payment_amount, paid e due_status
+    são recalculados somente para as faturas afetadas.
+
+    Parâmetros:
+    - records: DataFrame ou lista de dicionários com invoice_number, amount, date e exchange_variation
+    - index: InvoiceAgingIndex (ou dicionário número -> fatura)
+
+    Retorna:
+    - tuple: (pagamentos_registrados, números_das_faturas_afetadas, erros)
+    """
+    records = _batch_records(records)
+    lookup = index.get
+
+    # Fase 1: validação de todo o lote
+    errors = []
+    for row, record in enumerate(records, start=1):
+        invoice = lookup(record.get('invoice_number'))
+        if invoice is None:
+            errors.append({'row': row, 'invoice_number': record.get('invoice_number'),
+                           'error': "Fatura não encontrada"})
+        elif pd.isna(record.get('amount')) or record['amount'] <= 0:
+            errors.append({'row': row, 'invoice_number': record.get('invoice_number'),
+                           'error': "Valor do pagamento deve ser positivo"})
+        elif record.get('date') is None or pd.isna(record['date']):
+            errors.append({'row': row, 'invoice_number': record.get('invoice_number'),
+                           'error': "Data do pagamento ausente"})
+
+    if errors:
+        return 0, [], errors
+
+    affected = {}
+    for record in records:
+        number = record['invoice_number']
+        affected.setdefault(number, lookup(number))
+
+    # Snapshot das faturas afetadas para desfazer em caso de falha
+    snapshot = {number: _snapshot(invoice) for number, invoice in affected.items()}
+
+    try:
+        # Fase 2: aplicação
+        for record in records:
+            invoice = affected[record['invoice_number']]
+
+            payment_date = record['date']
+            if hasattr(payment_date, 'to_pydatetime'):
+                payment_date = payment_date.to_pydatetime()
+
+            payment_info = {
+                'date': payment_date,
+                'amount': float(record['amount']),
+                'exchange_variation': float(record.get('exchange_variation') or 0),
+                'currency': invoice.get('currency', 'USD')
+            }
+            invoice.setdefault('payments', []).append(payment_info)
+            invoice['payment_amount'] = invoice.get('payment_amount', 0) + payment_info['amount']
+
+            currency = invoice.get('currency')
+            if to_minor(invoice['payment_amount'], currency) >= to_minor(invoice.get('total_amount', 0), currency):
+                invoice['paid'] = True
+                invoice['payment_date'] = payment_date
+            else:
+                invoice['paid'] = False
+
+        # Recalcula due_status apenas das faturas afetadas
+        if hasattr(index, 'update'):
+            for invoice in affected.values():
+                index.update(invoice)
+    except Exception as e:
+        for number, state in snapshot.items():
+            _restore(affected[number], state)
+            if hasattr(index, 'update'):
+                index.update(affected[number])
+        return 0, [], [{'row': None, 'invoice_number': None, 'error': f"Erro ao registrar pagamentos: {str(e)}"}]
+
+    return len(records), list(affected), []
+
+def toggle_paid(invoice_number, index):
+    """
+    Alterna o status de pagamento de uma fatura e recalcula apenas ela
+
+    Parâmetros:
+    - invoice_number: Número da fatura
+    - index: InvoiceAgingIndex (ou dicionário número -> fatura)
+
+    Retorna:
+    - dict ou None: Fatura atualizada ou None se não encontrada
+    """
+    invoice = index.get(invoice_number)
+    if invoice is None:
+        return None
+
+    invoice['paid'] = not invoice.get('paid', False)
+    if invoice['paid']:
+        invoice['payment_date'] = datetime.now()
+        invoice['payment_amount'] = invoice.get('total_amount', 0)
+    else:
+        invoice.pop('payment_date', None)
+        invoice['payment_amount'] = 0
+
+    if hasattr(index, 'update'):
+        index.update(invoice)
+    return invoice
@@ -0,0 +1,131 @@
+from functools import wraps
+
+import streamlit as st
+
+# Papéis existentes em data/users.json
+ROLE_ADMIN = "admin"
+ROLE_GESTOR = "gestor"
+ROLE_CONFIGURACAO = "configuracao"
+ROLES = (ROLE_ADMIN, ROLE_GESTOR, ROLE_CONFIGURACAO)
+
+# Páginas
+PAGE_DASHBOARD = "page:dashboard"
+PAGE_IMPORT_DATA = "page:import_data"
+PAGE_GENERATE_INVOICES = "page:generate_invoices"
+PAGE_SEND_INVOICES = "page:send_invoices"
+PAGE_RECONCILE_PAYMENTS = "page:reconcile_payments"
+PAGE_FINANCIAL_REPORTS = "page:financial_reports"
+PAGE_SETTINGS = "page:settings"
+PAGE_INVOICE_CONTROL = "page:invoice_control"
+
+# Ações
+ACTION_SEND_INVOICES = "action:send_invoices"
+ACTION_RECONCILE = "action:reconcile"
+ACTION_REGISTER_PAYMENT = "action:register_payment"
+ACTION_EDIT_INVOICE = "action:edit_invoice"
+ACTION_DELETE_INVOICE = "action:delete_invoice"
+ACTION_SAVE_SETTINGS = "action:save_settings"
+ACTION_RESET_DATA = "action:reset_data"
+
+# Papéis com acesso a cada página/ação (o admin tem acesso a tudo)
+PERMISSIONS = {
+    PAGE_DASHBOARD: (ROLE_GESTOR, ROLE_CONFIGURACAO),
+    PAGE_IMPORT_DATA: (ROLE_CONFIGURACAO,),
+    PAGE_GENERATE_INVOICES: (ROLE_GESTOR,),
+    PAGE_SEND_INVOICES: (ROLE_GESTOR,),
+    PAGE_RECONCILE_PAYMENTS: (ROLE_GESTOR,),
+    PAGE_FINANCIAL_REPORTS: (ROLE_GESTOR, ROLE_CONFIGURACAO),
+    PAGE_SETTINGS: (ROLE_CONFIGURACAO,),
+    PAGE_INVOICE_CONTROL: (ROLE_GESTOR,),
+    ACTION_SEND_INVOICES: (ROLE_GESTOR,),
+    ACTION_RECONCILE: (ROLE_GESTOR,),
+    ACTION_REGISTER_PAYMENT: (ROLE_GESTOR,),
+    ACTION_EDIT_INVOICE: (ROLE_GESTOR,),
+    ACTION_DELETE_INVOICE: (),
+    ACTION_SAVE_SETTINGS: (ROLE_CONFIGURACAO,),
+    ACTION_RESET_DATA: (),
+}
+
+def compile_permissions(permissions):
+    """
+    Converte o mapa página/ação -> papéis em papel -> conjunto imutável de permissões
+
+    Parâmetros:
+    - permissions: Dicionário {id da página/ação: papéis permitidos}
+
+    Retorna:
+    - dict: {papel: frozenset de ids}
+    """
+    compiled = {role: set() for role in ROLES}
+    for permission, roles in permissions.items():
+        for role in roles:
+            compiled.setdefault(role, set()).add(permission)
+    compiled[ROLE_ADMIN] = set(permissions)
+    return {role: frozenset(granted) for role, granted in compiled.items()}
+
+# Compilado uma única vez, na importação do módulo
+ROLE_PERMISSIONS = compile_permissions(PERMISSIONS)
+
+def has_permission(role, permission):
+    """
+    Verifica se um papel tem uma permissão (consulta O(1))
+
+    Parâmetros:
+    - role: Papel do usuário
+    - permission: Id da página/ação (ex.: PAGE_SETTINGS, ACTION_DELETE_INVOICE)
+
+    Retorna:
+    - boolean: True se o papel tem a permissão
+    """
+    if permission not in PERMISSIONS:
+        raise KeyError(f"Permissão não registrada: {permission}")
+    return permission in ROLE_PERMISSIONS.get(role, frozenset())
+
+def can(permission):
+    """
+    Verifica se o usuário da sessão tem uma permissão
+    """
+    return has_permission(st.session_state.get('user_role'), permission)
+
+def require_page(permission):
+    """
+    Exige login e a permissão de acesso à página; caso contrário interrompe a página
+
+    Deve ser chamada logo após st.set_page_config.
+
+    Parâmetros:
+    - permission: Id da página (ex.: PAGE_IMPORT_DATA)
+
+    Retorna:
+    - str: Nome do usuário logado
+    """
+    from utils.auth import login_required
+    from utils.access_control import show_access_denied
+
+    username = login_required()
+    if not can(permission):
+        show_access_denied()
+    return username
+
+def requires_permission(permission):
+    """
+    Decorador para funções que executam uma ação protegida
+
+    Sem a permissão a função não é executada: uma mensagem de erro é
+    exibida e o retorno é None.
+
+    Parâmetros:
+    - permission: Id da ação (ex.: ACTION_SEND_INVOICES)
+    """
+    if permission not in PERMISSIONS:
+        raise KeyError(f"Permissão não registrada: {permission}")
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not can(permission):
+                st.error("Você não tem permissão para executar esta ação.")
+                return None
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
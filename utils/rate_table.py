@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+
+# Chave da configuração de loja usada quando a loja não tem taxas próprias
+DEFAULT_STORE = "default"
+
+# Colunas resolvidas para cada linha de venda
+RATE_COLUMNS = ['Royalty_Rate', 'Ad_Fund_Rate', 'Tax_Rate', 'Currency', 'Exchange_Rate']
+
+# Taxas que podem ser sobrescritas por loja
+STORE_RATE_FIELDS = ['royalty_rate', 'ad_fund_rate']
+
+# Campos de uma versão das taxas do país (os atuais ficam no nível do país, os anteriores em "history")
+VERSION_FIELDS = ['royalty_rate', 'ad_fund_rate', 'tax_rate', 'currency', 'exchange_rate', 'stores']
+
+# Campos herdados da versão atual quando uma versão anterior não os define
+INHERITED_FIELDS = ['currency', 'exchange_rate']
+
+# Início da versão mais antiga de cada país (vale também para vendas anteriores a ela)
+MIN_VALID_FROM = pd.Timestamp('1900-01-01')
+
+def _rate_row(country_config, store_config=None):
+    """
+    Monta a linha da tabela para um país e, opcionalmente, uma loja
+    """
+    store_config = store_config or {}
+    return {
+        'Royalty_Rate': store_config.get('royalty_rate', country_config.get('royalty_rate', np.nan)),
+        'Ad_Fund_Rate': store_config.get('ad_fund_rate', country_config.get('ad_fund_rate', np.nan)),
+        'Tax_Rate': country_config.get('tax_rate', np.nan),
+        'Currency': country_config.get('currency', ''),
+        'Exchange_Rate': country_config.get('exchange_rate', np.nan)
+    }
+
+def _parse_valid_from(value):
+    """
+    Converte a data de início de uma versão (None = desde sempre)
+    """
+    return pd.Timestamp(value).normalize() if value else MIN_VALID_FROM
+
+def rate_versions(country_config):
+    """
+    Lista as versões das taxas de um país, da mais antiga para a mais recente
+
+    As taxas no nível do país formam a versão mais recente (início em
+    "valid_from"); as anteriores ficam na lista "history". Versões antigas
+    sem moeda ou câmbio herdam os valores atuais.
+
+    Parâmetros:
+    - country_config: Configuração do país
+
+    Retorna:
+    - list: Dicionários com os campos de VERSION_FIELDS e "valid_from"
+    """
+    current = {field: country_config[field] for field in VERSION_FIELDS if field in country_config}
+    current['valid_from'] = country_config.get('valid_from')
+
+    versions = [current]
+    for entry in country_config.get('history') or []:
+        inherited = {field: current[field] for field in INHERITED_FIELDS if field in current}
+        versions.append({**inherited, **entry})
+
+    return sorted(versions, key=lambda version: _parse_valid_from(version.get('valid_from')))
+
+def schedule_rate_change(country_config, rates, valid_from):
+    """
+    Registra novas taxas para um país a partir de uma data, preservando o histórico
+
+    Se já existir uma versão com a mesma data ela é substituída. A versão
+    mais recente passa a ser a do nível do país e as demais vão para "history".
+
+    Parâmetros:
+    - country_config: Configuração atual do país
+    - rates: Campos alterados (ex.: {'royalty_rate': 0.06})
+    - valid_from: Data de início das novas taxas (date, datetime ou 'AAAA-MM-DD')
+
+    Retorna:
+    - dict: Nova configuração do país
+    """
+    valid_from = _parse_valid_from(valid_from)
+    versions = rate_versions(country_config)
+
+    # A nova versão parte da versão vigente na data informada
+    base = versions[0]
+    for version in versions:
+        if _parse_valid_from(version.get('valid_from')) <= valid_from:
+            base = version
+    new_version = {**base, **rates, 'valid_from': valid_from.strftime('%Y-%m-%d')}
+
+    versions = [version for version in versions
+                if _parse_valid_from(version.get('valid_from')) != valid_from]
+    versions.append(new_version)
+    versions.sort(key=lambda version: _parse_valid_from(version.get('valid_from')))
+
+    latest = versions[-1]
+    updated = {key: value for key, value in country_config.items()
+               if key not in VERSION_FIELDS and key not in ('valid_from', 'history')}
+    updated.update({field: latest[field] for field in VERSION_FIELDS if field in latest})
+    if latest.get('valid_from'):
+        updated['valid_from'] = latest['valid_from']
+    if len(versions) > 1:
+        updated['history'] = [{key: value for key, value in version.items()
+                               if not (key == 'valid_from' and value is None)}
+                              for version in versions[:-1]]
+
+    return updated
+
+def compile_rate_table(country_settings):
+    """
+    Compila as versões das taxas de países e lojas em uma tabela plana indexada
+
+    Para cada versão de cada país há uma linha (País, "default") com as
+    taxas usadas pelas lojas sem configuração própria, e uma linha
+    (País, Loja) para cada loja configurada em qualquer versão, com as taxas
+    já combinadas com as do país. A coluna Valid_From indica o início da versão.
+
+    Parâmetros:
+    - country_settings: Configurações dos países (load_country_settings)
+
+    Retorna:
+    - DataFrame indexado por (Country, Store) com Valid_From e as colunas de RATE_COLUMNS
+    """
+    records = []
+
+    for country, country_config in country_settings.items():
+        versions = rate_versions(country_config)
+        store_names = {str(store) for version in versions for store in (version.get('stores') or {})
+                       if store != DEFAULT_STORE}
+
+        for position, version in enumerate(versions):
+            valid_from = MIN_VALID_FROM if position == 0 else _parse_valid_from(version.get('valid_from'))
+            stores = {str(store): config for store, config in (version.get('stores') or {}).items()}
+            default_config = stores.get(DEFAULT_STORE)
+
+            records.append({'Country': str(country), 'Store': DEFAULT_STORE, 'Valid_From': valid_from,
+                            **_rate_row(version, default_config)})
+            for store in sorted(store_names):
+                # Loja sem configuração nesta versão usa a configuração padrão da versão
+                store_config = stores[store] if store in stores else default_config
+                records.append({'Country': str(country), 'Store': store, 'Valid_From': valid_from,
+                                **_rate_row(version, store_config)})
+
+    table = pd.DataFrame(records, columns=['Country', 'Store', 'Valid_From'] + RATE_COLUMNS)
+    table['Valid_From'] = pd.to_datetime(table['Valid_From']).astype('datetime64[ns]')
+    table['Currency'] = table['Currency'].fillna('').astype(str)
+    for col in ['Royalty_Rate', 'Ad_Fund_Rate', 'Tax_Rate', 'Exchange_Rate']:
+        table[col] = table[col].astype(float)
+    return table.sort_values('Valid_From', kind='stable').set_index(['Country', 'Store'])
+
+def resolve_rates(countries, stores, table, dates=None):
+    """
+    Resolve as taxas de cada linha de venda com uma junção as-of na tabela compilada
+
+    Cada venda usa a versão mais recente com início até a sua data
+    (merge_asof por País e Loja). Lojas sem configuração própria usam a linha
+    (País, "default"); países não configurados ficam com taxas nulas e moeda vazia.
+
+    Parâmetros:
+    - countries: Série com o país de cada linha
+    - stores: Série com a loja de cada linha
+    - table: Tabela compilada (compile_rate_table)
+    - dates: Série com a data de cada linha (None ou datas vazias usam a versão mais recente)
+
+    Retorna:
+    - DataFrame alinhado ao índice de countries, com as colunas de RATE_COLUMNS
+    """
+    country_keys = countries.astype(str).to_numpy(dtype=object)
+    store_keys = stores.astype(str).to_numpy(dtype=object)
+
+    # Lojas sem linha própria são redirecionadas para a configuração padrão do país
+    overridden = pd.MultiIndex.from_arrays([country_keys, store_keys]).isin(table.index.unique())
+    store_keys = np.where(overridden, store_keys, DEFAULT_STORE)
+
+    if dates is None:
+        sale_dates = np.full(len(countries), pd.Timestamp.max, dtype='datetime64[ns]')
+    else:
+        sale_dates = pd.to_datetime(dates).astype('datetime64[ns]').fillna(pd.Timestamp.max).to_numpy()
+
+    left = pd.DataFrame({
+        'Country': country_keys,
+        'Store': store_keys,
+        'Date': sale_dates,
+        '_position': np.arange(len(countries))
+    }).sort_values('Date', kind='stable')
+
+    right = table.reset_index()
+    right['Country'] = right['Country'].astype(left['Country'].dtype)
+    right['Store'] = right['Store'].astype(left['Store'].dtype)
+
+    resolved = pd.merge_asof(left, right, left_on='Date', right_on='Valid_From',
+                             by=['Country', 'Store'], direction='backward')
+    resolved = resolved.sort_values('_position', kind='stable')
+    resolved.index = countries.index
+    resolved = resolved[RATE_COLUMNS]
+
+    resolved['Royalty_Rate'] = resolved['Royalty_Rate'].fillna(0.0).astype(float)
+    resolved['Ad_Fund_Rate'] = resolved['Ad_Fund_Rate'].fillna(0.0).astype(float)
+    resolved['Tax_Rate'] = resolved['Tax_Rate'].fillna(0.0).astype(float)
+    resolved['Currency'] = resolved['Currency'].fillna('').astype(str)
+    resolved['Exchange_Rate'] = resolved['Exchange_Rate'].fillna(0.0).astype(float)
+    return resolved
+
+def store_overrides_frame(country_settings):
+    """
+    Lista as taxas configuradas por loja (para edição)
+
+    Taxas não definidas na loja ficam vazias (herdam a taxa do país).
+
+    Retorna:
+    - DataFrame com Country, Store, royalty_rate e ad_fund_rate
+    """
+    rows = []
+    for country, country_config in country_settings.items():
+        for store, store_config in (country_config.get('stores') or {}).items():
+            rows.append({
+                'Country': country,
+                'Store': store,
+                'royalty_rate': store_config.get('royalty_rate', np.nan),
+                'ad_fund_rate': store_config.get('ad_fund_rate', np.nan)
+            })
+    return pd.DataFrame(rows, columns=['Country', 'Store'] + STORE_RATE_FIELDS)
+
+def _same_stores(current, new):
+    """
+    Compara duas configurações de lojas (taxas com tolerância de arredondamento)
+    """
+    current = {str(store): config for store, config in (current or {}).items()}
+    if set(current) != set(new):
+        return False
+    for store, config in new.items():
+        if set(current[store]) != set(config):
+            return False
+        if any(abs(current[store][field] - value) > 1e-9 for field, value in config.items()):
+            return False
+    return True
+
+def apply_store_overrides(country_settings, overrides, valid_from):
+    """
+    Registra as configurações de lojas informadas como nova versão das taxas
+
+    Cada país cujas lojas mudaram recebe uma nova versão a partir de
+    valid_from (schedule_rate_change); vendas anteriores continuam com as
+    lojas da versão vigente na sua data. Linhas de países não configurados
+    ou sem loja são ignoradas.
+
+    Parâmetros:
+    - country_settings: Configurações dos países
+    - overrides: DataFrame no formato de store_overrides_frame
+    - valid_from: Data de início das novas configurações de lojas
+
+    Retorna:
+    - dict: Novas configurações dos países
+    """
+    stores = {country: {} for country in country_settings}
+
+    for row in overrides.to_dict('records'):
+        country = row.get('Country')
+        store = row.get('Store')
+        if country not in stores or store is None or pd.isna(store) or not str(store).strip():
+            continue
+
+        stores[country][str(store).strip()] = {field: float(row[field]) for field in STORE_RATE_FIELDS
+                                               if row.get(field) is not None and not pd.isna(row[field])}
+
+    updated = {}
+    for country, config in country_settings.items():
+        if _same_stores(config.get('stores'), stores[country]):
+            updated[country] = config
+            continue
+
+        # Uma versão sem lojas precisa de "stores" vazio para não herdar as lojas da versão anterior
+        updated[country] = schedule_rate_change(config, {'stores': stores[country]}, valid_from)
+        if not updated[country].get('stores'):
+            updated[country].pop('stores', None)
+
+    return updated
@@ -0,0 +1,276 @@
+import io
+import os
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+import pandas as pd
+
+try:
+    import python_calamine  # noqa: F401  (motor 'calamine' do pandas)
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+try:
+    import openpyxl  # noqa: F401
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# Motores de leitura em ordem de preferência
+ENGINE_CALAMINE = "calamine"
+ENGINE_XML = "xml"
+ENGINE_OPENPYXL = "openpyxl"
+ENGINE_ORDER = [ENGINE_CALAMINE, ENGINE_XML, ENGINE_OPENPYXL]
+
+# Colunas e tipos lidos nas importações de vendas e de pagamentos
+SALES_COLUMNS = ['Date', 'Country', 'Partner', 'Store', 'Sales']
+SALES_TEXT_COLUMNS = ['Country', 'Partner', 'Store']
+PAYMENT_COLUMNS = ['Date', 'Amount', 'Description', 'Reference']
+PAYMENT_TEXT_COLUMNS = ['Description', 'Reference']
+
+# Namespaces do formato xlsx (SpreadsheetML)
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_TAG_ROW = f"{_NS_MAIN}row"
+_TAG_VALUE = f"{_NS_MAIN}v"
+
+# Origem das datas seriais do Excel (sistema 1900)
+_EXCEL_EPOCH = '1899-12-30'
+
+def available_engines():
+    """
+    Retorna os motores de leitura de xlsx disponíveis, em ordem de preferência
+    """
+    engines = []
+    if CALAMINE_AVAILABLE:
+        engines.append(ENGINE_CALAMINE)
+    engines.append(ENGINE_XML)
+    if OPENPYXL_AVAILABLE:
+        engines.append(ENGINE_OPENPYXL)
+    return engines
+
+def _column_index(reference):
+    """
+    Converte a referência da célula (ex.: 'AB12') no índice da coluna (base 0)
+    """
+    index = 0
+    for char in reference:
+        if char.isalpha():
+            index = index * 26 + (ord(char.upper()) - 64)
+        else:
+            break
+    return index - 1
+
+def _first_sheet_path(archive):
+    """
+    Localiza o arquivo XML da primeira planilha do workbook
+    """
+    workbook = parse(archive.open('xl/workbook.xml')).getroot()
+    first_sheet = workbook.find(f'{_NS_MAIN}sheets/{_NS_MAIN}sheet')
+    rel_id = first_sheet.get(f'{_NS_REL}id')
+
+    rels = parse(archive.open('xl/_rels/workbook.xml.rels')).getroot()
+    for rel in rels.iter(f'{_NS_PKG_REL}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+
+    return 'xl/worksheets/sheet1.xml'
+
+def _shared_strings(archive):
+    """
+    Carrega a tabela de textos compartilhados (sharedStrings.xml)
+    """
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+
+    strings = []
+    for _, elem in iterparse(archive.open('xl/sharedStrings.xml'), events=('end',)):
+        if elem.tag == f'{_NS_MAIN}si':
+            # Texto simples ou rich text (vários <r><t>), ignorando a fonética (<rPh>)
+            parts = [t.text or '' for t in elem.iter(f'{_NS_MAIN}t')]
+            phonetic = [t.text or '' for rph in elem.iter(f'{_NS_MAIN}rPh') for t in rph.iter(f'{_NS_MAIN}t')]
+            if phonetic:
+                parts = parts[:len(parts) - len(phonetic)]
+            strings.append(''.join(parts))
+            elem.clear()
+    return strings
+
+def _cell_value(cell, shared):
+    """
+    Converte o conteúdo de uma célula <c> para o valor Python
+    """
+    cell_type = cell.get('t')
+
+    if cell_type == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{_NS_MAIN}t'))
+
+    value = None
+    for child in cell:
+        if child.tag == _TAG_VALUE:
+            value = child.text
+            break
+    if value is None:
+        return None
+
+    if cell_type == 's':
+        return shared[int(value)]
+    if cell_type == 'b':
+        return value == '1'
+    if cell_type in ('str', 'e'):
+        return value
+
+    if value.isdigit():
+        return int(value)
+    return float(value)
+
+def read_xlsx_streaming(source, columns=None):
+    """
+    Lê a primeira planilha de um xlsx percorrendo o XML em streaming
+
+    Apenas as células das colunas pedidas são convertidas; as demais são
+    descartadas assim que cada linha é lida.
+
+    Parâmetros:
+    - source: Caminho, bytes ou objeto de arquivo
+    - columns: Colunas a manter (None para todas)
+
+    Retorna:
+    - DataFrame (datas ficam como números seriais do Excel)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    with zipfile.ZipFile(source) as archive:
+        shared = _shared_strings(archive)
+        sheet_path = _first_sheet_path(archive)
+
+        header = None
+        keep = {}
+        data = {}
+        column_cache = {}
+
+        for _, elem in iterparse(archive.open(sheet_path), events=('end',)):
+            if elem.tag != _TAG_ROW:
+                continue
+
+            values = {}
+            has_cells = False
+            for position, cell in enumerate(elem):
+                has_cells = True
+                reference = cell.get('r')
+                if reference:
+                    letters = reference.rstrip('0123456789')
+                    col = column_cache.get(letters)
+                    if col is None:
+                        col = column_cache[letters] = _column_index(letters)
+                else:
+                    col = position
+                if header is None or col in keep:
+                    values[col] = _cell_value(cell, shared)
+            elem.clear()
+
+            if not has_cells:
+                continue
+
+            # A primeira linha não vazia é o cabeçalho
+            if header is None:
+                if not values:
+                    continue
+                header = {col: str(value) for col, value in values.items() if value is not None}
+                keep = {col: name for col, name in header.items() if columns is None or name in columns}
+                data = {name: [] for name in keep.values()}
+                continue
+
+            for col, name in keep.items():
+                data[name].append(values.get(col))
+
+    return pd.DataFrame(data, columns=list(keep.values()))
+
+def _serials_to_dates(series):
+    """
+    Converte números seriais do Excel em datas, mantendo os demais valores
+    """
+    numeric = pd.to_numeric(series, errors='coerce')
+    is_serial = numeric.notna() & series.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+    if not is_serial.any():
+        return series
+
+    converted = series.astype(object).copy()
+    converted[is_serial] = pd.to_datetime(numeric[is_serial], unit='D', origin=_EXCEL_EPOCH)
+    return converted if not is_serial.all() else pd.to_datetime(converted)
+
+def _apply_text_columns(df, text_columns):
+    """
+    Converte para texto os valores das colunas indicadas, preservando os vazios
+    """
+    for col in text_columns or []:
+        if col in df.columns:
+            df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+def read_spreadsheet(source, file_name=None, columns=None, text_columns=None, date_columns=None, engine=None):
+    """
+    Lê um arquivo de vendas ou pagamentos (xlsx, xls ou csv) com o motor mais rápido disponível
+
+    Ordem dos motores para xlsx: calamine, leitor XML em streaming e openpyxl.
+    Somente as colunas pedidas são lidas; colunas ausentes no arquivo são
+    ignoradas para que a validação possa reportá-las.
+
+    Parâmetros:
+    - source: Caminho, bytes ou objeto de arquivo (ex.: UploadedFile do Streamlit)
+    - file_name: Nome do arquivo (para detectar o formato quando source não tem .name)
+    - columns: Colunas a ler (None para todas)
+    - text_columns: Colunas lidas como texto
+    - date_columns: Colunas de data (números seriais do Excel são convertidos)
+    - engine: Força um motor específico ("calamine", "xml" ou "openpyxl")
+
+    Retorna:
+    - DataFrame
+    """
+    file_name = file_name or getattr(source, 'name', None) or (source if isinstance(source, str) else '')
+    extension = os.path.splitext(str(file_name))[1].lower()
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    usecols = (lambda col: col in columns) if columns else None
+    dtype = {col: str for col in text_columns or []}
+
+    if extension == '.csv':
+        return pd.read_csv(source, usecols=usecols, dtype=dtype)
+
+    if extension == '.xls':
+        # Formato binário antigo: somente o motor padrão do pandas
+        return pd.read_excel(source, usecols=usecols, dtype=dtype)
+
+    engine = engine or available_engines()[0]
+
+    if engine == ENGINE_XML:
+        df = read_xlsx_streaming(source, columns)
+        for col in date_columns or []:
+            if col in df.columns:
+                df[col] = _serials_to_dates(df[col])
+        return _apply_text_columns(df, text_columns)
+
+    return pd.read_excel(source, engine=engine, usecols=usecols, dtype=dtype)
+
+def read_sales_file(source, file_name=None, engine=None):
+    """
+    Lê um arquivo de vendas apenas com as colunas usadas pela importação
+    """
+    return read_spreadsheet(source, file_name, columns=SALES_COLUMNS, text_columns=SALES_TEXT_COLUMNS,
+                            date_columns=['Date'], engine=engine)
+
+def read_payment_file(source, file_name=None, engine=None):
+    """
+    Lê um extrato de pagamentos apenas com as colunas usadas na reconciliação
+    """
+    return read_spreadsheet(source, file_name, columns=PAYMENT_COLUMNS, text_columns=PAYMENT_TEXT_COLUMNS,
+                            date_columns=['Date'], engine=engine)
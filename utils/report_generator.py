@@ -5,11 +5,19 @@ import base64
 import streamlit as st
 import matplotlib.pyplot as plt
 import numpy as np
+from utils.cache import REPORTS_NAMESPACE, cached_data, fingerprint
+
+# Invoice fields used by the summary (and therefore by its cache key)
+SUMMARY_FIELDS = ['invoice_number', 'partner', 'country', 'month_name', 'year', 'total_sell_out',
+                  'royalty_amount', 'ad_fund_amount', 'tax_amount', 'total_amount', 'currency',
+                  'created_at', 'paid', 'sent', 'payment_date', 'payment_amount']
 
 def generate_invoice_summary_df(invoices):
     """
     Generate a DataFrame summarizing all invoices
     
+    Results are cached across sessions, keyed by the summarized fields.
+    
     Parameters:
     - invoices: List of invoice dictionaries
     
@@ -19,6 +27,14 @@ def generate_invoice_summary_df(invoices):
     if not invoices:
         return pd.DataFrame()
     
+    return _cached_summary_df(fingerprint(invoices, SUMMARY_FIELDS), invoices)
+
+@cached_data(REPORTS_NAMESPACE, max_entries=32)
+def _cached_summary_df(key, _invoices):
+    return _build_summary_df(_invoices)
+
+def _build_summary_df(invoices):
+    
     # Extract relevant fields from invoices
     data = []
     for invoice in invoices:
@@ -147,6 +163,8 @@ def generate_charts(invoices):
     """
     Generate charts for invoice visualization
     
+    Figures are cached across sessions, keyed by the summarized fields.
+    
     Parameters:
     - invoices: List of invoice dictionaries
     
@@ -156,8 +174,19 @@ def generate_charts(invoices):
     if not invoices:
         return None, None, None
     
-    # Get invoice summary data
-    summary_df = generate_invoice_summary_df(invoices)
+    return _cached_charts(fingerprint(invoices, SUMMARY_FIELDS), invoices)
+
+@cached_data(REPORTS_NAMESPACE, max_entries=16)
+def _cached_charts(key, _invoices):
+    figures = _build_charts(generate_invoice_summary_df(_invoices))
+    
+    # Figures are served from the cache, so they are released from pyplot here
+    for figure in figures:
+        plt.close(figure)
+    
+    return figures
+
+def _build_charts(summary_df):
     
     # Create a figure for payment status breakdown
     payment_status_fig, ax1 = plt.subplots(figsize=(8, 5))
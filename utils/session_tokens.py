@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from utils.cache import USERS_NAMESPACE, cached_resource
+
+# Chave usada para assinar os tokens (a variável de ambiente tem prioridade sobre o arquivo)
+SECRET_ENV_VAR = "BERRYBILL_SESSION_SECRET"
+SECRET_FILE = "data/session_secret.key"
+
+# Validade de um token de sessão
+TOKEN_TTL_SECONDS = 12 * 60 * 60
+
+# Parâmetro da URL que guarda o token (sobrevive a recarregar a página e a reconexões)
+QUERY_PARAM = "session"
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+@cached_resource(USERS_NAMESPACE)
+def _signing_key():
+    """
+    Carrega (ou cria na primeira execução) a chave de assinatura dos tokens
+    """
+    secret = os.environ.get(SECRET_ENV_VAR)
+    if secret:
+        return secret.encode('utf-8')
+
+    try:
+        with open(SECRET_FILE, 'rb') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(SECRET_FILE), exist_ok=True)
+    key = _b64encode(os.urandom(32)).encode('ascii')
+    try:
+        # O_EXCL: se outro processo criou a chave ao mesmo tempo, usa a dele
+        fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(SECRET_FILE, 'rb') as f:
+            return f.read().strip()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+def _sign(payload):
+    return hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest()
+
+def issue_token(username, role, stamp=None, ttl=TOKEN_TTL_SECONDS):
+    """
+    Gera um token de sessão assinado (HMAC-SHA256) para o usuário
+
+    Parâmetros:
+    - username: Nome de usuário
+    - role: Papel do usuário
+    - stamp: Marca da senha (UserDirectory.session_stamp), invalida o token se a senha mudar
+    - ttl: Validade em segundos
+
+    Retorna:
+    - str: Token no formato "dados.assinatura" (base64 para URL)
+    """
+    data = {'u': username, 'r': role, 'e': int(time.time()) + int(ttl)}
+    if stamp:
+        data['s'] = stamp
+    payload = _b64encode(json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    return f"{payload}.{_b64encode(_sign(payload))}"
+
+def verify_token(token, now=None):
+    """
+    Valida a assinatura (em tempo constante) e a validade de um token
+
+    Não acessa arquivos nem executa o KDF das senhas.
+
+    Parâmetros:
+    - token: Token gerado por issue_token
+    - now: Horário de referência (padrão: agora)
+
+    Retorna:
+    - dict ou None: username, role, expires_at e stamp se o token for válido
+    """
+    if not token or not isinstance(token, str):
+        return None
+
+    payload, _, signature = token.partition('.')
+    try:
+        if not hmac.compare_digest(_sign(payload), _b64decode(signature)):
+            return None
+        data = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+
+    if not isinstance(data, dict) or data.get('e', 0) <= (now if now is not None else time.time()):
+        return None
+
+    return {
+        'username': data.get('u'),
+        'role': data.get('r'),
+        'expires_at': data.get('e'),
+        'stamp': data.get('s')
+    }
@@ -0,0 +1,231 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+from utils.cache import USERS_NAMESPACE, cached_resource, file_version
+from utils.config_store import ConfigStoreError, read_json, update_json
+
+# Arquivo para armazenar credenciais
+USERS_FILE = "data/users.json"
+
+# Parâmetros do scrypt (custo pago uma vez por login); aumentar N torna o hash mais lento
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+
+# Iterações do PBKDF2 (aceito na verificação para hashes gerados sem scrypt)
+PBKDF2_ITERATIONS = 600_000
+
+SALT_BYTES = 16
+
+# Prefixos dos formatos de hash armazenados em users.json
+SCHEME_SCRYPT = "scrypt"
+SCHEME_PBKDF2 = "pbkdf2_sha256"
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password, salt, n, r, p, dklen):
+    # O limite de memória padrão do OpenSSL (32 MB) não comporta N maiores
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, dklen=dklen,
+                          maxmem=256 * n * r * p + 1024 * 1024)
+
+def hash_password(password):
+    """
+    Cria o hash da senha com scrypt e sal aleatório
+
+    Retorna:
+    - str: "scrypt$N$r$p$sal$hash" (sal e hash em base64)
+    """
+    salt = os.urandom(SALT_BYTES)
+    derived = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P, SCRYPT_DKLEN)
+    return "$".join([SCHEME_SCRYPT, str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+                     _b64encode(salt), _b64encode(derived)])
+
+def _is_legacy_hash(stored):
+    # Formato antigo: SHA-256 sem sal em hexadecimal
+    return len(stored) == 64 and all(char in '0123456789abcdef' for char in stored)
+
+def verify_password(password, stored):
+    """
+    Verifica a senha contra o hash armazenado (scrypt, PBKDF2 ou SHA-256 legado)
+
+    A comparação é feita em tempo constante.
+
+    Parâmetros:
+    - password: Senha digitada
+    - stored: Hash armazenado
+
+    Retorna:
+    - bool: True se a senha confere
+    """
+    if not stored:
+        return False
+
+    try:
+        if _is_legacy_hash(stored):
+            candidate = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            return hmac.compare_digest(candidate, stored)
+
+        scheme, *fields = stored.split('$')
+        if scheme == SCHEME_SCRYPT:
+            n, r, p, salt, expected = fields
+            expected = _b64decode(expected)
+            candidate = _scrypt(password, _b64decode(salt), int(n), int(r), int(p), len(expected))
+            return hmac.compare_digest(candidate, expected)
+        if scheme == SCHEME_PBKDF2:
+            iterations, salt, expected = fields
+            expected = _b64decode(expected)
+            candidate = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), _b64decode(salt),
+                                            int(iterations), len(expected))
+            return hmac.compare_digest(candidate, expected)
+    except (ValueError, TypeError):
+        return False
+
+    return False
+
+def needs_rehash(stored):
+    """
+    Indica se o hash deve ser regerado com os parâmetros atuais (legado ou custo menor)
+    """
+    if not stored or _is_legacy_hash(stored):
+        return True
+
+    scheme, *fields = stored.split('$')
+    if scheme != SCHEME_SCRYPT or len(fields) != 5:
+        return True
+    try:
+        n, r, p = (int(value) for value in fields[:3])
+    except ValueError:
+        return True
+    return (n, r, p) < (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+class UserDirectory:
+    """
+    Usuários carregados em memória, recarregados quando users.json é alterado
+
+    Consultas de papel e nome não abrem o arquivo; cada acesso apenas
+    compara a data de modificação com a da última leitura.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._version = None
+        self._users = {}
+
+    def _refresh(self):
+        version = file_version(self.path)
+        if version == self._version:
+            return self._users
+
+        with self._lock:
+            if version != self._version:
+                try:
+                    users = read_json(self.path, {})
+                except (OSError, ConfigStoreError):
+                    # Mantém os dados anteriores se o arquivo não puder ser lido
+                    return self._users
+                self._users = users
+                self._version = version
+        return self._users
+
+    def get(self, username):
+        """
+        Retorna os dados do usuário ou None se ele não existir
+        """
+        return self._refresh().get(username)
+
+    def usernames(self):
+        return list(self._refresh())
+
+    def authenticate(self, username, password):
+        """
+        Verifica usuário e senha; hashes legados ou fracos são atualizados após o login
+
+        Retorna:
+        - bool: True se as credenciais conferem
+        """
+        user = self.get(username)
+        if user is None:
+            # Executa o KDF mesmo assim para não revelar quais usuários existem
+            verify_password(password, _DUMMY_HASH)
+            return False
+
+        stored = user.get("password", "")
+        if not verify_password(password, stored):
+            return False
+
+        if needs_rehash(stored):
+            self.set_password(username, password)
+        return True
+
+    def set_password(self, username, password):
+        """
+        Grava um novo hash de senha para o usuário
+        """
+        self.update_user(username, password=hash_password(password))
+
+    def update_user(self, username, **fields):
+        """
+        Altera campos de um usuário existente e grava o arquivo
+        """
+        def apply(users):
+            if username in users:
+                users[username].update(fields)
+            return users
+
+        with self._lock:
+            self._users = update_json(self.path, apply, {})
+            self._version = file_version(self.path)
+
+    def session_stamp(self, username):
+        """
+        Marca curta derivada do hash da senha e da época de sessão do usuário,
+        guardada na sessão após o login
+
+        Se a senha for alterada, as sessões forem revogadas (logout) ou o
+        usuário removido, a marca deixa de conferir e a sessão precisa ser
+        autenticada de novo.
+        """
+        user = self.get(username)
+        if user is None:
+            return None
+        material = f"{user.get('password', '')}:{user.get('session_epoch', 0)}"
+        return hashlib.blake2b(material.encode('utf-8'), digest_size=8).hexdigest()
+
+    def revoke_sessions(self, username):
+        """
+        Invalida os tokens de sessão já emitidos para o usuário (avança a época de sessão)
+        """
+        def apply(users):
+            if username in users:
+                users[username]['session_epoch'] = users[username].get('session_epoch', 0) + 1
+            return users
+
+        with self._lock:
+            self._users = update_json(self.path, apply, {})
+            self._version = file_version(self.path)
+
+    def verify_session(self, username, stamp):
+        """
+        Confere a marca da sessão sem executar o KDF
+        """
+        expected = self.session_stamp(username)
+        return expected is not None and stamp is not None and hmac.compare_digest(expected, stamp)
+
+# Hash fixo usado para igualar o tempo de resposta de usuários inexistentes
+_DUMMY_HASH = hash_password(os.urandom(8).hex())
+
+@cached_resource(USERS_NAMESPACE)
+def get_user_directory():
+    """
+    Retorna o diretório de usuários compartilhado pelo processo
+    """
+    return UserDirectory()
@@ -0,0 +1,102 @@
+import pandas as pd
+
+from utils.data_processor import load_country_settings
+
+# Colunas obrigatórias dos dados de venda
+REQUIRED_COLUMNS = ['Date', 'Country', 'Partner', 'Store', 'Sales']
+
+# Colunas da tabela de erros
+ERROR_COLUMNS = ['Linha', 'Coluna', 'Valor', 'Motivo']
+
+# Deslocamento entre o índice do DataFrame e a linha da planilha (cabeçalho na linha 1)
+ROW_OFFSET = 2
+
+def _error_rows(df, mask, column, reason):
+    """
+    Monta as linhas da tabela de erros para as posições marcadas em mask
+    """
+    if not mask.any():
+        return None
+    return pd.DataFrame({
+        'Linha': pd.RangeIndex(len(df))[mask.to_numpy()] + ROW_OFFSET,
+        'Coluna': column,
+        'Valor': df.loc[mask, column].astype(object).fillna('').astype(str).to_numpy(),
+        'Motivo': reason
+    })
+
+def validate_sales_data(df, country_settings=None):
+    """
+    Valida e converte os dados de venda em uma única passada
+
+    Cada coluna é convertida uma vez (datas, valores numéricos) e todas as
+    linhas com problema são reunidas em uma tabela de erros, em vez de
+    parar no primeiro problema encontrado.
+
+    Parâmetros:
+    - df: DataFrame com os dados brutos
+    - country_settings: Configurações dos países (padrão: carregadas do arquivo)
+
+    Retorna:
+    - tuple: (DataFrame convertido ou None, DataFrame de erros com Linha, Coluna, Valor e Motivo)
+    """
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        errors = pd.DataFrame({
+            'Linha': [None] * len(missing_columns),
+            'Coluna': missing_columns,
+            'Valor': [''] * len(missing_columns),
+            'Motivo': ["Coluna obrigatória ausente"] * len(missing_columns)
+        })
+        return None, errors
+
+    if country_settings is None:
+        country_settings = load_country_settings()
+
+    coerced = df.copy()
+
+    # Conversões tipadas (uma única vez por coluna)
+    dates = pd.to_datetime(coerced['Date'], errors='coerce')
+    sales = pd.to_numeric(coerced['Sales'], errors='coerce')
+
+    checks = [
+        (coerced['Date'].notna() & dates.isna(), 'Date', "Data inválida (utilize o formato AAAA-MM-DD)"),
+        (coerced['Date'].isna(), 'Date', "Data ausente"),
+        (coerced['Sales'].notna() & sales.isna(), 'Sales', "Valor de venda não numérico"),
+        (coerced['Sales'].isna(), 'Sales', "Valor de venda ausente"),
+        (coerced['Country'].notna() & ~coerced['Country'].isin(list(country_settings)), 'Country',
+         "País não configurado (configure-o na seção Configurações)"),
+        (coerced['Country'].isna(), 'Country', "País ausente"),
+        (coerced['Partner'].isna(), 'Partner', "Parceiro ausente"),
+    ]
+
+    errors = [_error_rows(coerced, mask, column, reason) for mask, column, reason in checks]
+    errors = [table for table in errors if table is not None]
+
+    coerced['Date'] = dates
+    coerced['Sales'] = sales
+
+    if errors:
+        error_table = pd.concat(errors, ignore_index=True).sort_values(['Linha', 'Coluna'], kind='stable')
+        return coerced, error_table.reset_index(drop=True)
+
+    return coerced, pd.DataFrame(columns=ERROR_COLUMNS)
+
+def summarize_errors(errors, limit=5):
+    """
+    Resume a tabela de erros em uma mensagem curta
+
+    Parâmetros:
+    - errors: DataFrame de erros (validate_sales_data)
+    - limit: Quantidade máxima de motivos listados
+
+    Retorna:
+    - str: Mensagem de erro
+    """
+    if errors.empty:
+        return "Dados válidos."
+
+    counts = errors.groupby('Motivo', sort=False).size()
+    parts = [f"{reason} ({count} linha{'s' if count > 1 else ''})" for reason, count in counts.head(limit).items()]
+    if errors['Linha'].isna().any():
+        parts = [f"Colunas obrigatórias ausentes: {', '.join(errors.loc[errors['Linha'].isna(), 'Coluna'])}"]
+    return "; ".join(parts)